@@ -0,0 +1,360 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from prompts import normalize_environment
+
+load_dotenv()
+
+# Per LLaMA endpoint; unset: the endpoint's own concurrency (see `generation_slots`).
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE")) if os.getenv("ADMISSION_MAX_ACTIVE") else None
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10))
+ADMISSION_BATCH_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_BATCH_QUEUE_TIMEOUT", 120))
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", 5))
+ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", 20))
+ADMISSION_MAX_USERS = int(os.getenv("ADMISSION_MAX_USERS", 10000))
+ADMISSION_RATE_KEY = os.getenv("ADMISSION_RATE_KEY", "username")
+
+# Lower index = higher priority. Interactive traffic of either environment
+# goes before batch traffic, so re-evaluation runs cannot inflate the latency
+# users see; within each mode production goes first. Each endpoint has its
+# own slots, so classes only compete for the endpoint they share.
+PRIORITY_CLASSES = ('prod-interactive', 'dev-interactive', 'prod-batch', 'dev-batch')
+
+WAITING = 'waiting'
+ADMITTED = 'admitted'
+SHED = 'shed'
+
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised when a request is refused by admission control.
+
+    Attributes:
+        message (str): Client-facing reason.
+        retry_after (float): Seconds the client should wait before retrying.
+        rate_limited (bool): True if the user exceeded their rate, False if
+            the request was shed because the service is overloaded.
+    """
+    def __init__(self, message, retry_after, rate_limited=False):
+        self.message = message
+        self.retry_after = retry_after
+        self.rate_limited = rate_limited
+        super().__init__(message)
+
+
+def generation_slots(endpoint_slots, configured=ADMISSION_MAX_ACTIVE):
+    """
+    Number of admission slots of one endpoint.
+
+    Args:
+        endpoint_slots (int): Concurrency limit of the endpoint.
+        configured (int | None): `ADMISSION_MAX_ACTIVE`; None uses `endpoint_slots`.
+
+    Returns:
+        int: `configured`, capped at `endpoint_slots`; 0 disables slots.
+    """
+    if configured is None:
+        return endpoint_slots
+    return min(configured, endpoint_slots)
+
+
+def priority_of(environment, batch=False):
+    """
+    Rank a request for scheduling.
+
+    Args:
+        environment (str): Environment name as sent by the client.
+        batch (bool): Whether the request is part of a batch run.
+
+    Returns:
+        int: Index into `PRIORITY_CLASSES`; lower runs first.
+    """
+    mode = 'batch' if batch else 'interactive'
+    return PRIORITY_CLASSES.index(f"{normalize_environment(environment)}-{mode}")
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    Not thread-safe on its own; `AdmissionController` guards it.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Take one token if available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is.
+        """
+        current = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (current - self.updated) * self.rate)
+        self.updated = current
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ('priority', 'sequence', 'state')
+
+    def __init__(self, priority, sequence):
+        self.priority = priority
+        self.sequence = sequence
+        self.state = WAITING
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class SlotPool:
+    """
+    Generation slots of one endpoint with a priority queue in front of them.
+
+    When all slots are busy, requests wait and are admitted highest priority
+    first (see `PRIORITY_CLASSES`), in arrival order within a class.
+    Overload is shed by priority: when the queue is full a new request
+    displaces the lowest-priority waiter, or is rejected itself if nothing
+    queued ranks below it, and waiters give up after their class's queue
+    timeout.
+
+    Attributes:
+        name (str): The endpoint, e.g. 'llama-prod'.
+        max_active (int): Concurrent generations; 0 disables slots. Keep it
+            at or below the endpoint's concurrency limit, so admitted
+            requests do not queue again, first-come first-served, on the
+            endpoint's semaphore.
+        queue_size (int): Maximum number of waiting requests.
+    """
+    def __init__(self, name, max_active, queue_size=ADMISSION_QUEUE_SIZE):
+        self.name = name
+        self.max_active = max_active
+        self.queue_size = queue_size
+
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self.active = 0
+
+        self.admitted = [0] * len(PRIORITY_CLASSES)
+        self.shed = [0] * len(PRIORITY_CLASSES)
+
+    @property
+    def max_blocked(self):
+        """
+        Requests that can be inside the pool at once: running in a slot or
+        waiting in the queue. Each of them holds a request thread.
+        """
+        return self.max_active + self.queue_size if self.max_active > 0 else 0
+
+    def acquire(self, priority, timeout):
+        """
+        Take a generation slot, queueing by priority while none is free.
+
+        Args:
+            priority (int): Index into `PRIORITY_CLASSES`.
+            timeout (float): Seconds to wait in the queue.
+
+        Raises:
+            AdmissionRejectedError: If the request is shed.
+        """
+        if self.max_active <= 0:
+            return
+        with self._condition:
+            if self.active < self.max_active and not self._waiters:
+                self.active += 1
+                self.admitted[priority] += 1
+                return
+
+            if len(self._waiters) >= self.queue_size:
+                lowest = max(self._waiters, default=None)
+                if lowest is None or lowest.priority <= priority:
+                    self._reject(priority)
+                self._waiters.remove(lowest)
+                heapq.heapify(self._waiters)
+                lowest.state = SHED
+                self._condition.notify_all()
+
+            waiter = _Waiter(priority, next(self._sequence))
+            heapq.heappush(self._waiters, waiter)
+            deadline = time.monotonic() + timeout
+            while waiter.state == WAITING:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    self._reject(priority)
+                self._condition.wait(remaining)
+
+            if waiter.state == SHED:
+                self._reject(priority)
+            self.admitted[priority] += 1
+
+    def _reject(self, priority):
+        self.shed[priority] += 1
+        raise AdmissionRejectedError("The service is overloaded, please retry.", 1.0)
+
+    def release(self):
+        """
+        Return a slot and admit the highest-priority waiters that now fit.
+        """
+        if self.max_active <= 0:
+            return
+        with self._condition:
+            self.active -= 1
+            while self._waiters and self.active < self.max_active:
+                waiter = heapq.heappop(self._waiters)
+                waiter.state = ADMITTED
+                self.active += 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Summarize the pool.
+
+        Returns:
+            dict: Active and maximum slots, and queued/admitted/shed counts
+            per priority class.
+        """
+        with self._condition:
+            queued = [0] * len(PRIORITY_CLASSES)
+            for waiter in self._waiters:
+                queued[waiter.priority] += 1
+            return {
+                'active': self.active,
+                'maxActive': self.max_active,
+                'queued': dict(zip(PRIORITY_CLASSES, queued)),
+                'admitted': dict(zip(PRIORITY_CLASSES, self.admitted)),
+                'shed': dict(zip(PRIORITY_CLASSES, self.shed)),
+            }
+
+
+class AdmissionController:
+    """
+    Per-worker admission control in front of model generation.
+
+    Every request first takes a token from the bucket of its client and
+    environment, so a single client cannot flood the service. The client is
+    the `username` of the request body by default; that name is chosen by
+    the caller and not authenticated, so these limits keep cooperating
+    clients fair but do not stop a caller rotating names. Set
+    `ADMISSION_RATE_KEY=address` to key buckets on the peer address instead,
+    when clients reach the service directly.
+
+    Requests that need the model then take a slot of the endpoint serving
+    them, one `SlotPool` per endpoint. A burst on the dev endpoint therefore
+    waits for dev slots only and cannot hold slots production requests need.
+    Models without a pool (e.g. T5) are not queued.
+
+    Attributes:
+        pools (dict[str, SlotPool]): Slot pools by endpoint name, built from
+            `slots` (e.g. {'llama-prod': 16, 'llama-dev': 4}), each queueing
+            up to `queue_size` requests.
+        user_rate (float): Tokens per second per user; 0 disables rate limiting.
+        user_burst (float): Bucket capacity per user.
+    """
+    def __init__(self, slots=None, queue_size=ADMISSION_QUEUE_SIZE,
+                 user_rate=ADMISSION_USER_RATE, user_burst=ADMISSION_USER_BURST, max_users=ADMISSION_MAX_USERS):
+        self.pools = {name: SlotPool(name, max_active, queue_size) for name, max_active in (slots or {}).items()}
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_users = max_users
+
+        self._bucket_lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.rate_limited = 0
+
+    @property
+    def max_blocked(self):
+        """
+        Requests that can be inside the controller at once, over all pools.
+        """
+        return sum(pool.max_blocked for pool in self.pools.values())
+
+    def check_rate(self, client, environment):
+        """
+        Charge one request to a client's token bucket.
+
+        Buckets are kept per client and canonical environment; the least
+        recently seen ones are dropped beyond `max_users`.
+
+        Args:
+            client (str): The requesting client: its username or address
+                (see `ADMISSION_RATE_KEY`).
+            environment (str): Environment name as sent by the client.
+
+        Raises:
+            AdmissionRejectedError: If the bucket is empty (rate limited).
+        """
+        if self.user_rate <= 0:
+            return
+        key = (client, normalize_environment(environment))
+        with self._bucket_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.user_rate, self.user_burst)
+                while len(self._buckets) > self.max_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take()
+            if wait > 0:
+                self.rate_limited += 1
+        if wait > 0:
+            raise AdmissionRejectedError(
+                f"Rate limit exceeded for '{client}', retry in {wait:.1f}s", wait, rate_limited=True
+            )
+
+    @contextmanager
+    def slot(self, pool, environment, batch=False):
+        """
+        Hold a generation slot of an endpoint for the duration of a `with` block.
+
+        Args:
+            pool (str | None): Endpoint name (see `LlamaEndpoint.name`); None,
+                or an endpoint without a pool, takes no slot.
+            environment (str): Environment name as sent by the client.
+            batch (bool): Whether the request is part of a batch run; batch
+                requests rank below interactive ones and may queue longer.
+
+        Raises:
+            AdmissionRejectedError: If the request is shed.
+        """
+        slots = self.pools.get(pool)
+        if slots is None:
+            yield
+            return
+        timeout = ADMISSION_BATCH_QUEUE_TIMEOUT if batch else ADMISSION_QUEUE_TIMEOUT
+        slots.acquire(priority_of(environment, batch), timeout)
+        try:
+            yield
+        finally:
+            slots.release()
+
+    def stats(self):
+        """
+        Summarize admission control.
+
+        Returns:
+            dict: Slot pool summaries by endpoint, rate-limited requests and
+            tracked users.
+        """
+        with self._bucket_lock:
+            users = len(self._buckets)
+        return {
+            'pools': {name: pool.stats() for name, pool in self.pools.items()},
+            'rateLimited': self.rate_limited,
+            'users': users,
+        }
@@ -1,18 +1,42 @@
+import contextvars
 import inflect
 import os
 import requests
 import sys
+import threading
 from collections.abc import Iterable
 from dotenv import load_dotenv
 
 load_dotenv()
 PROJECT_PATH = os.getcwd()
 sys.path.append(PROJECT_PATH)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cache import LRUCache, get_shared_tier
+from circuit_breaker import UPSTREAM_CONNECT_TIMEOUT, get_breaker
+from imr_encoding import to_leaves, with_fields
 
 SEARCH_ENDPOINT = os.getenv("SEARCH_ENDPOINT")
 COLOR_BUNDLE_SEARCH = os.getenv("COLOR_BUNDLE_SEARCH")
 PLURAL_ENGINE = inflect.engine()
 DEFAULT_DISTANCE = os.getenv("DEFAULT_DISTANCE")
+TAG_CACHE_SIZE = int(os.getenv("TAG_CACHE_SIZE", 4096))
+TAG_CACHE_TTL = float(os.getenv("TAG_CACHE_TTL", 3600))
+PLURAL_CACHE_SIZE = int(os.getenv("PLURAL_CACHE_SIZE", 4096))
+
+TAG_CACHE = LRUCache('osm-tag', maxsize=TAG_CACHE_SIZE, ttl=TAG_CACHE_TTL, shared=get_shared_tier())
+COLOR_CACHE = LRUCache('color-bundle', maxsize=TAG_CACHE_SIZE, ttl=TAG_CACHE_TTL, shared=get_shared_tier())
+PLURAL_CACHE = LRUCache('plural', maxsize=PLURAL_CACHE_SIZE, shared=get_shared_tier())
+
+SEARCH_BREAKER = get_breaker('osm-tag-search', initial_timeout=10.0, min_timeout=1.0, max_timeout=30.0)
+COLOR_BREAKER = get_breaker('color-bundle-search', initial_timeout=10.0, min_timeout=1.0, max_timeout=30.0)
+
+# Observer notified of every tag lookup made in the current request context
+# (see `prefetch.Speculation`). Background prefetch threads do not inherit it.
+TAG_LOOKUP_OBSERVER = contextvars.ContextVar('tag_lookup_observer', default=None)
+
+_tag_fetches = {}
+_tag_fetches_lock = threading.Lock()
 
 load_dotenv()
 
@@ -70,12 +94,17 @@ class AdoptFuncError(Exception):
         super().__init__(self.message)
 
 
-def search_osm_tag(entity):
+def search_osm_tag(entity, timeout=None, breaker=SEARCH_BREAKER):
     """
     Query the OSM tag search service for an entity name and return IMR hints.
 
     Args:
         entity (str): Tag or concept to look up (e.g., 'restaurant', 'door color').
+        timeout (float | None): Upper bound (s) on the lookup, e.g. the time
+            left to a deadline; the adaptive timeout applies below it.
+        breaker (CircuitBreaker): Breaker the request goes through;
+            speculative lookups pass their own so that their failures and
+            latencies do not open or stretch the one of real requests.
 
     Returns:
         dict | list: Parsed JSON response from the search endpoint.
@@ -83,12 +112,64 @@ def search_osm_tag(entity):
     Notes:
         - Uses the `SEARCH_ENDPOINT` URL from environment variables.
         - SSL verification is disabled (verify=False).
+        - Calls go through the 'osm-tag-search' circuit breaker (by default), which applies
+          an adaptive timeout and raises `CircuitOpenError` while open.
+        - Results are cached in `TAG_CACHE` with their filter leaves as shared
+          `FilterLeaf` objects; callers get a copy of the containers because
+          `build_filters` modifies the returned blocks in place.
+        - Concurrent lookups of the same entity share one request: later
+          callers wait for the one in flight (e.g. a prefetch) and read its
+          result from the cache.
     """
+    observer = TAG_LOOKUP_OBSERVER.get()
+    if observer is not None:
+        observer.record(entity)
+
+    cached = TAG_CACHE.get('search', entity)
+    if cached is not None:
+        return to_leaves(cached)
+
+    with _tag_fetches_lock:
+        in_flight = _tag_fetches.get(entity)
+        if in_flight is None:
+            done = _tag_fetches[entity] = threading.Event()
+    if in_flight is not None:
+        in_flight.wait(min(breaker.timeout(), timeout) if timeout is not None else breaker.timeout())
+        cached = TAG_CACHE.get('search', entity)
+        if cached is not None:
+            return to_leaves(cached)
+        return _fetch_osm_tag(entity, timeout, breaker)
+
+    try:
+        return _fetch_osm_tag(entity, timeout, breaker)
+    finally:
+        with _tag_fetches_lock:
+            del _tag_fetches[entity]
+        done.set()
+
+
+def tag_fetches_in_flight():
+    """
+    Count the distinct entities whose tag search request is in flight.
+
+    Returns:
+        int: Number of entities currently being looked up.
+    """
+    with _tag_fetches_lock:
+        return len(_tag_fetches)
+
+
+def _fetch_osm_tag(entity, timeout=None, breaker=SEARCH_BREAKER):
     PARAMS = {"word": entity, "limit": 1, "detail": False}
-    r = requests.get(
-        url=SEARCH_ENDPOINT, params=PARAMS, verify=False
+    options = {}
+    if timeout is not None:
+        options['timeout'] = (min(UPSTREAM_CONNECT_TIMEOUT, timeout), min(breaker.timeout(), timeout))
+    r = breaker.call(
+        requests.get, url=SEARCH_ENDPOINT, params=PARAMS, verify=False, **options
     )  # set verify to False to ignore SSL certificate
-    return r.json()
+    result = to_leaves(r.json())
+    TAG_CACHE.set('search', entity, result)
+    return to_leaves(result)
 
 def fetch_color_bundles(color:str):
     """
@@ -103,12 +184,67 @@ def fetch_color_bundles(color:str):
     Notes:
         - Uses `COLOR_BUNDLE_SEARCH` from environment variables.
         - SSL verification is disabled (verify=False).
+        - Calls go through the 'color-bundle-search' circuit breaker.
+        - Results are cached in `COLOR_CACHE`.
     """
+    cached = COLOR_CACHE.get('search', color)
+    if cached is not None:
+        return cached
+
     PARAMS = {"color": color, "limit": 1, "detail": False}
-    r = requests.get(
-        url=COLOR_BUNDLE_SEARCH, params=PARAMS, verify=False
+    r = COLOR_BREAKER.call(
+        requests.get, url=COLOR_BUNDLE_SEARCH, params=PARAMS, verify=False
     )  # set verify to False to ignore SSL certificate
-    return r.json()
+    result = r.json()
+    COLOR_CACHE.set('search', color, result)
+    return result
+
+
+def pluralize(name):
+    """
+    Build the display name of an entity, pluralizing it unless it already is.
+
+    Args:
+        name (str): Entity name as extracted by the model.
+
+    Returns:
+        str: The plural form, or `name` itself when it is already plural.
+
+    Notes:
+        - `inflect` lookups are comparatively slow, so results are cached in
+          `PLURAL_CACHE`.
+    """
+    display_name = PLURAL_CACHE.get('noun', name)
+    if display_name is not None:
+        return display_name
+
+    if not PLURAL_ENGINE.singular_noun(name):
+        display_name = PLURAL_ENGINE.plural_noun(name)
+    else:
+        display_name = name
+    PLURAL_CACHE.set('noun', name, display_name)
+    return display_name
+
+def prefetch_node_tags(node):
+    """
+    Look up the tags `build_filters` will need for a node, filling `TAG_CACHE`.
+
+    Used to overlap tag search with generation: the lookups run while the
+    model is still producing later entities, so `build_filters` finds them
+    cached.
+
+    Args:
+        node (dict): A parsed entity with a `name` and optional `properties`.
+    """
+    if not isinstance(node, dict) or not node.get('name'):
+        return
+    names = [node['name']]
+    for node_property in node.get('properties') or []:
+        if isinstance(node_property, dict) and node_property.get('name'):
+            names.append(node_property['name'])
+    for name in names:
+        search_osm_tag(name)
+
 
 def build_filters(node):
     """
@@ -152,7 +288,7 @@ def build_filters(node):
         ent_filters = [
             {
                 'or': [
-                    {**sub_item, 'value': brand_name if sub_item['value'] == '***example***' else sub_item['value']}
+                    with_fields(sub_item, value=brand_name) if sub_item['value'] == '***example***' else sub_item
                     for sub_item in item['or']
                 ]
             }
@@ -189,9 +325,8 @@ def build_filters(node):
 
                 new_ent_value = node_flt["value"]
                 if len(ent_property_imr) == 1:
-                    ent_property_imr = ent_property_imr[0]
-                    ent_property_imr["operator"] = new_ent_operator
-                    ent_property_imr["value"] = new_ent_value
+                    ent_property_imr = with_fields(ent_property_imr[0], operator=new_ent_operator,
+                                                   value=new_ent_value)
                 elif any(_ent_prop['value'] in ['***example***'] for _ent_prop in ent_property_imr) or any(_ent_prop['value'] in ['***numeric***'] for _ent_prop in ent_property_imr):
                     new_ent_property_imr = []
 
@@ -199,15 +334,14 @@ def build_filters(node):
                         color_values = fetch_color_bundles(new_ent_value)['color_values']
                         for color_value in color_values:
                             for item in ent_property_imr:
-                                new_item = item.copy()
-                                new_item['operator'] = new_ent_operator
-                                new_item['value'] = color_value
-                                new_ent_property_imr.append(new_item)
+                                new_ent_property_imr.append(
+                                    with_fields(item, operator=new_ent_operator, value=color_value)
+                                )
                     else:
                         for item in ent_property_imr:
-                            item['operator'] = new_ent_operator
-                            item['value'] = new_ent_value
-                            new_ent_property_imr.append(item)
+                            new_ent_property_imr.append(
+                                with_fields(item, operator=new_ent_operator, value=new_ent_value)
+                            )
 
                     new_ent_property_imr = {"or": new_ent_property_imr}
                     ent_property_imr = new_ent_property_imr
@@ -280,10 +414,7 @@ def adopt_generation(parsed_result):
             if 'name' not in node:
                 print(f'{node} has not the required name field!')
                 continue
-            if not PLURAL_ENGINE.singular_noun(node['name']):
-                display_name = PLURAL_ENGINE.plural_noun(node["name"])
-            else:
-                display_name = node['name']
+            display_name = pluralize(node['name'])
 
             if display_name.startswith('brand:'):
                 display_name = display_name.replace('brand:', '')
@@ -0,0 +1,345 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from loguru import logger
+from serialization import json_default
+
+load_dotenv()
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_FILE = os.getenv("CACHE_FILE", "/tmp/spot_nlp_cache.sqlite3")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_SHARED_TIMEOUT = float(os.getenv("CACHE_SHARED_TIMEOUT", 0.05))
+CACHE_FILE_MAX_ROWS = int(os.getenv("CACHE_FILE_MAX_ROWS", 100000))
+CACHE_FILE_PRUNE_INTERVAL = float(os.getenv("CACHE_FILE_PRUNE_INTERVAL", 60))
+
+
+class SQLiteTier:
+    """
+    File-backed shared cache tier for worker processes on the same host.
+
+    Each process and thread opens its own connection, so the tier is safe to
+    use after the server forks its workers. Values are stored as JSON.
+
+    Writes prune the file at most every `prune_interval` seconds per process:
+    expired rows are deleted, then the oldest rows beyond `max_rows`.
+
+    Attributes:
+        path (str): SQLite database file shared by all workers.
+        max_rows (int): Rows kept after pruning.
+        prune_interval (float): Minimum seconds between two prunes.
+    """
+    def __init__(self, path, max_rows=CACHE_FILE_MAX_ROWS, prune_interval=CACHE_FILE_PRUNE_INTERVAL):
+        self.path = path
+        self.max_rows = max_rows
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._prune_lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=CACHE_SHARED_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=json_default), expires_at),
+        )
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        current = time.monotonic()
+        with self._prune_lock:
+            if current < self._next_prune:
+                return
+            self._next_prune = current + self.prune_interval
+        try:
+            self.prune()
+        except sqlite3.Error as e:
+            logger.warning(f"Pruning the shared cache file failed: {e}")
+
+    def prune(self):
+        """
+        Delete expired rows, then the oldest rows beyond `max_rows`.
+
+        `INSERT OR REPLACE` gives a rewritten key a new rowid, so rowid order
+        is write order.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        connection = self._connection()
+        deleted = connection.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+        deleted += connection.execute(
+            "DELETE FROM cache WHERE rowid <= (SELECT rowid FROM cache ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+            (self.max_rows,),
+        ).rowcount
+        return deleted
+
+
+class RedisTier:
+    """
+    Shared cache tier on any Redis-protocol server (Redis, Valkey, KeyDB, ...).
+
+    Requires the optional `redis` package. Values are stored as JSON.
+
+    Attributes:
+        url (str): Connection URL, e.g. 'redis://localhost:6379/0'.
+    """
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.url = url
+        self._client = redis.Redis.from_url(
+            url, socket_timeout=CACHE_SHARED_TIMEOUT, socket_connect_timeout=CACHE_SHARED_TIMEOUT
+        )
+
+    def get(self, key):
+        value = self._client.get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        text = json.dumps(value, default=json_default)
+        if ttl is None:
+            self._client.set(key, text)
+        else:
+            self._client.set(key, text, ex=max(1, int(ttl)))
+
+
+_shared_tier = None
+_shared_tier_lock = threading.Lock()
+
+
+def get_shared_tier():
+    """
+    Build the shared tier selected by `CACHE_BACKEND` once per process.
+
+    Returns:
+        SQLiteTier | RedisTier | None: The tier, or None for 'memory' (the
+        default), in which case caches stay purely in-process.
+
+    Raises:
+        ValueError: If `CACHE_BACKEND` names an unknown backend.
+    """
+    global _shared_tier
+    if CACHE_BACKEND in ('', 'memory'):
+        return None
+    with _shared_tier_lock:
+        if _shared_tier is None:
+            if CACHE_BACKEND == 'file':
+                _shared_tier = SQLiteTier(CACHE_FILE)
+            elif CACHE_BACKEND == 'redis':
+                _shared_tier = RedisTier(CACHE_REDIS_URL)
+            else:
+                raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+        return _shared_tier
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional time-to-live and an
+    optional shared tier behind it.
+
+    Keys are namespaced, so one instance can hold entries for several
+    environments or backends without collisions. Cached values are shared
+    between callers and must be treated as read-only.
+
+    With a shared tier, local misses fall through to it and local writes are
+    written through, so worker processes see each other's entries. Values
+    must then be JSON-serializable (tuples come back as lists). Shared-tier
+    errors are logged and treated as misses, never failing the request.
+
+    Attributes:
+        name (str): Identifier used in stats, logs and shared-tier keys.
+        maxsize (int): Maximum number of entries; 0 disables the cache.
+        ttl (float | None): Seconds an entry stays valid; None keeps it until evicted.
+        shared (SQLiteTier | RedisTier | None): Optional cross-process tier.
+    """
+    def __init__(self, name, maxsize=1024, ttl=None, shared=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def _shared_key(self, namespace, key):
+        return f"{self.name}:{namespace}:{key}"
+
+    def _shared_get(self, namespace, key):
+        try:
+            return self.shared.get(self._shared_key(namespace, key))
+        except Exception as e:
+            with self._lock:
+                self.shared_errors += 1
+            logger.warning(f"Shared cache read failed for {self.name}: {e}")
+            return None
+
+    def _shared_set(self, namespace, key, value):
+        try:
+            self.shared.set(self._shared_key(namespace, key), value, self.ttl)
+        except Exception as e:
+            with self._lock:
+                self.shared_errors += 1
+            logger.warning(f"Shared cache write failed for {self.name}: {e}")
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def get(self, namespace, key, default=None):
+        """
+        Look up an entry and mark it as recently used.
+
+        Args:
+            namespace (str): Cache namespace (e.g. 'llama:prod').
+            key (Hashable): Key within the namespace.
+            default (Any): Returned on a miss.
+
+        Returns:
+            Any: The cached value, or `default`.
+        """
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and not self._expired(entry[1]):
+                self._entries.move_to_end((namespace, key))
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[(namespace, key)]
+
+        if self.shared is not None and self.maxsize > 0:
+            value = self._shared_get(namespace, key)
+            if value is not None:
+                self._set_local(namespace, key, value, shared_hit=True)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, namespace, key, value):
+        """
+        Store an entry, evicting the least recently used one when full, and
+        write it through to the shared tier if there is one.
+
+        Args:
+            namespace (str): Cache namespace.
+            key (Hashable): Key within the namespace.
+            value (Any): Value to cache.
+        """
+        if self.maxsize <= 0:
+            return
+        self._set_local(namespace, key, value)
+        if self.shared is not None:
+            self._shared_set(namespace, key, value)
+
+    def _set_local(self, namespace, key, value, stored_at=None, shared_hit=False):
+        with self._lock:
+            if shared_hit:
+                self.shared_hits += 1
+            self._entries[(namespace, key)] = (value, stored_at if stored_at is not None else time.monotonic())
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def snapshot(self):
+        """
+        Export the live entries, least recently used first.
+
+        Returns:
+            list[list]: `[namespace, key, value, age]` rows, where `age` is the
+            number of seconds since the entry was stored. Expired entries are
+            skipped.
+        """
+        current = time.monotonic()
+        with self._lock:
+            return [
+                [namespace, key, value, current - stored_at]
+                for (namespace, key), (value, stored_at) in self._entries.items()
+                if not self._expired(stored_at)
+            ]
+
+    def restore(self, rows):
+        """
+        Load entries exported by `snapshot` into the local tier.
+
+        Entries keep their original age, so they expire when they would have
+        without the restart. The shared tier is not written to.
+
+        Args:
+            rows (Iterable[list]): `[namespace, key, value, age]` rows.
+
+        Returns:
+            int: Number of entries restored.
+        """
+        if self.maxsize <= 0:
+            return 0
+        restored = 0
+        current = time.monotonic()
+        for namespace, key, value, age in rows:
+            if self.ttl is not None and age > self.ttl:
+                continue
+            self._set_local(namespace, key, value, stored_at=current - age)
+            restored += 1
+        return restored
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Summarize cache usage.
+
+        Returns:
+            dict: Size, capacity, hit/miss counters (local and shared) and
+            per-namespace sizes.
+        """
+        with self._lock:
+            namespaces = {}
+            for namespace, _ in self._entries:
+                namespaces[namespace] = namespaces.get(namespace, 0) + 1
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'sharedHits': self.shared_hits,
+                'sharedErrors': self.shared_errors,
+                'sharedTier': type(self.shared).__name__ if self.shared is not None else None,
+                'namespaces': namespaces,
+            }
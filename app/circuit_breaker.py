@@ -0,0 +1,275 @@
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05))
+UPSTREAM_TIMEOUT_PERCENTILE = float(os.getenv("UPSTREAM_TIMEOUT_PERCENTILE", 0.99))
+UPSTREAM_TIMEOUT_MULTIPLIER = float(os.getenv("UPSTREAM_TIMEOUT_MULTIPLIER", 2.0))
+LATENCY_WINDOW = int(os.getenv("UPSTREAM_LATENCY_WINDOW", 200))
+MIN_LATENCY_SAMPLES = 20
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is rejected because the upstream's circuit is open.
+
+    Attributes:
+        name (str): Name of the upstream whose circuit is open.
+        retry_after (float): Seconds until the breaker lets a trial call through.
+    """
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        self.message = f"Upstream '{name}' is unavailable, retry in {retry_after:.0f}s"
+        super().__init__(self.message)
+
+
+def percentile(values, q):
+    """
+    Compute the `q`-th quantile of a collection using nearest-rank.
+
+    Args:
+        values (Iterable[float]): Observed values.
+        q (float): Quantile in [0, 1].
+
+    Returns:
+        float | None: The quantile, or None if `values` is empty.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker with a latency-derived read timeout.
+
+    The breaker is closed while the upstream is healthy. After
+    `failure_threshold` consecutive failures (connection errors, timeouts or
+    5xx responses) it opens and rejects calls with `CircuitOpenError` for
+    `reset_timeout` seconds. It then lets a single trial call through
+    (half-open); success closes the circuit, failure re-opens it.
+
+    The read timeout handed to `requests` follows observed latencies: once
+    enough samples are collected it is the configured percentile times
+    `UPSTREAM_TIMEOUT_MULTIPLIER`, clamped to [`min_timeout`, `max_timeout`].
+    """
+    def __init__(self, name, initial_timeout=10.0, min_timeout=1.0, max_timeout=60.0,
+                 failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._total_calls = 0
+        self._total_failures = 0
+        self._total_rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    def timeout(self):
+        """
+        Current adaptive read timeout in seconds.
+
+        Returns:
+            float: `initial_timeout` until `MIN_LATENCY_SAMPLES` latencies are
+            recorded, then the latency percentile scaled and clamped.
+        """
+        with self._lock:
+            if len(self._latencies) < MIN_LATENCY_SAMPLES:
+                return self.initial_timeout
+            observed = percentile(self._latencies, UPSTREAM_TIMEOUT_PERCENTILE)
+        return min(self.max_timeout, max(self.min_timeout, observed * UPSTREAM_TIMEOUT_MULTIPLIER))
+
+    def before_call(self):
+        """
+        Admit or reject a call according to the circuit state.
+
+        Returns:
+            bool: True if the call is the half-open trial.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial
+                call already in flight.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._state = HALF_OPEN
+                self._trial_in_flight = True
+                return True
+            self._total_rejected += 1
+            retry_after = self.reset_timeout
+            if self._opened_at is not None:
+                retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self._total_calls += 1
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+            self._state = CLOSED
+            self._opened_at = None
+
+    def record_failure(self, latency=None):
+        """
+        Record a failed call.
+
+        Args:
+            latency (float | None): For timeouts, the timeout that expired. It
+                is kept as a latency sample, so the adaptive timeout grows when
+                the upstream slows down instead of staying below its latency.
+        """
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self._total_calls += 1
+            self._total_failures += 1
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def abandon_trial(self):
+        """
+        Let another trial through after one ended without an upstream verdict.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run an HTTP call through the breaker with the adaptive timeout.
+
+        The half-open trial gets `max_timeout`, so an upstream that became
+        slower than the adaptive timeout can still close the circuit.
+
+        Args:
+            func (Callable): A `requests`-style function or session method
+                accepting a `timeout` keyword (e.g. `requests.get`).
+            *args, **kwargs: Forwarded to `func`.
+
+        Returns:
+            requests.Response: The upstream response. 5xx responses are
+            returned unchanged but count as failures.
+
+        Raises:
+            CircuitOpenError: If the circuit rejects the call.
+            requests.RequestException: Re-raised after being recorded as a failure.
+        """
+        trial = self.before_call()
+        read_timeout = self.max_timeout if trial else self.timeout()
+        kwargs.setdefault('timeout', (UPSTREAM_CONNECT_TIMEOUT, read_timeout))
+        started = time.monotonic()
+        try:
+            response = func(*args, **kwargs)
+        except requests.Timeout:
+            self.record_failure(latency=time.monotonic() - started)
+            raise
+        except requests.RequestException:
+            self.record_failure()
+            raise
+        except BaseException:
+            if trial:
+                self.abandon_trial()
+            raise
+        if response.status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success(time.monotonic() - started)
+        return response
+
+    def snapshot(self):
+        """
+        Describe the breaker for health views.
+
+        Returns:
+            dict: State, failure counters, current timeout and latency percentiles.
+        """
+        timeout = self.timeout()
+        with self._lock:
+            latencies = list(self._latencies)
+            state = self._current_state()
+            retry_after = None
+            if state == OPEN:
+                retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'state': state,
+                'consecutiveFailures': self._consecutive_failures,
+                'totalCalls': self._total_calls,
+                'totalFailures': self._total_failures,
+                'totalRejected': self._total_rejected,
+                'timeout': timeout,
+                'latencyP50': percentile(latencies, 0.5),
+                'latencyP99': percentile(latencies, 0.99),
+                'samples': len(latencies),
+                'retryAfter': retry_after,
+            }
+
+
+BREAKERS = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name, **kwargs):
+    """
+    Return the process-wide breaker for an upstream, creating it on first use.
+
+    Args:
+        name (str): Upstream identifier (e.g. 'osm-tag-search').
+        **kwargs: `CircuitBreaker` options, only applied on creation.
+
+    Returns:
+        CircuitBreaker: The shared breaker instance.
+    """
+    with _registry_lock:
+        if name not in BREAKERS:
+            BREAKERS[name] = CircuitBreaker(name, **kwargs)
+        return BREAKERS[name]
+
+
+def breaker_states():
+    """
+    Snapshot every registered breaker.
+
+    Returns:
+        dict: Mapping of upstream name to `CircuitBreaker.snapshot()`.
+    """
+    with _registry_lock:
+        breakers = list(BREAKERS.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,138 @@
+import gzip
+import os
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+
+
+def supported_encodings():
+    """
+    Content codings this process can produce, in order of preference.
+
+    Returns:
+        tuple[str, ...]: ('br', 'gzip') with the optional `brotli` package,
+        ('gzip',) without it.
+    """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding, supported=None):
+    """
+    Pick a content coding from an `Accept-Encoding` header.
+
+    Codings are ranked by the client's q-values; ties are broken by server
+    preference (brotli first). `*` matches any supported coding and `q=0`
+    excludes one.
+
+    Args:
+        accept_encoding (str | None): The request header.
+        supported (Iterable[str] | None): Codings to choose from; defaults to
+            `supported_encodings()`.
+
+    Returns:
+        str | None: The chosen coding, or None to send the body uncompressed.
+    """
+    if not accept_encoding:
+        return None
+    supported = tuple(supported if supported is not None else supported_encodings())
+
+    weights = {}
+    for part in accept_encoding.split(','):
+        pieces = part.strip().split(';')
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for parameter in pieces[1:]:
+            name, _, value = parameter.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in supported:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(body, coding):
+    """
+    Compress a response body.
+
+    Args:
+        body (bytes): Uncompressed body.
+        coding (str): 'br' or 'gzip'.
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing HTTP responses per request with brotli or gzip.
+
+    The coding is negotiated from each request's `Accept-Encoding` header.
+    Bodies smaller than `COMPRESSION_MIN_SIZE` bytes, or already carrying a
+    `Content-Encoding`, are passed through unchanged. Responses are buffered
+    before compression, which suits the JSON bodies this service returns.
+    """
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        coding = negotiate_encoding(Headers(scope=scope).get('accept-encoding'))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        chunks = []
+
+        async def buffered_send(message):
+            nonlocal start_message
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            chunks.append(message.get('body', b''))
+            if message.get('more_body', False):
+                return
+
+            body = b''.join(chunks)
+            headers = MutableHeaders(raw=start_message['headers'])
+            if len(body) >= self.minimum_size and 'content-encoding' not in headers:
+                body = compress(body, coding)
+                headers['Content-Encoding'] = coding
+                headers['Content-Length'] = str(len(body))
+                headers.add_vary_header('Accept-Encoding')
+            await send(start_message)
+            await send({'type': 'http.response.body', 'body': body})
+
+        await self.app(scope, receive, buffered_send)
@@ -0,0 +1,130 @@
+import ast
+import json
+
+
+class InferenceError(Exception):
+    """
+    Structured failure reported by a model backend.
+
+    Raised by `generate` when the model endpoint rejects a sentence (HTTP 400)
+    and by `adopt` when the generated output cannot be turned into an IMR. The
+    endpoint logs it and answers with 400 without re-parsing any strings.
+
+    Attributes:
+        error (str): Human-readable cause of the failure.
+        input_sentence (str | None): Sentence the backend was working on.
+        imr (dict | None): Partial IMR, if the backend produced one.
+        raw_output (str | None): Raw model output, if any.
+        model_version (str | None): Backend-reported model identifier.
+        prompt (str | None): Prompt the backend used.
+        detail (Any): Payload returned to the client as the error message.
+    """
+    def __init__(self, error, input_sentence=None, imr=None, raw_output=None, model_version=None, prompt=None,
+                 detail=None):
+        self.error = error
+        self.input_sentence = input_sentence
+        self.imr = imr
+        self.raw_output = raw_output
+        self.model_version = model_version
+        self.prompt = prompt
+        self.detail = detail if detail is not None else error
+        super().__init__(error)
+
+    @classmethod
+    def from_details(cls, details, detail=None):
+        """
+        Build the error from the detail fields an upstream service reports.
+
+        Args:
+            details (dict): Upstream fields ('error', 'inputSentence', 'imr',
+                'rawOutput', 'modelVersion', 'prompt').
+            detail (Any): Client-facing payload; defaults to `details['error']`.
+
+        Returns:
+            InferenceError: The structured error.
+        """
+        return cls(
+            error=details.get('error'),
+            input_sentence=details.get('inputSentence'),
+            imr=details.get('imr'),
+            raw_output=details.get('rawOutput'),
+            model_version=details.get('modelVersion'),
+            prompt=details.get('prompt'),
+            detail=detail,
+        )
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Build the error from an upstream HTTP 400 response.
+
+        The upstream body is `{"message": ...}` where the message is either a
+        JSON object, a JSON string, or the `repr` of a Python dict. Each form
+        is parsed with a real parser (`json`, then `ast.literal_eval`), so
+        apostrophes, quotes, newlines and `None` in the fields are preserved.
+
+        Args:
+            response (requests.Response): The 400 response.
+
+        Returns:
+            InferenceError: The structured error. If the message cannot be
+            parsed, it becomes the `error` text as-is.
+        """
+        try:
+            body = response.json()
+        except ValueError:
+            return cls(error=response.text, detail=response.text)
+
+        message = body.get('message', '') if isinstance(body, dict) else body
+        details = parse_error_message(message)
+        if details is None:
+            return cls(error=str(message), detail=body)
+        return cls.from_details(details, detail=body)
+
+    def to_document(self, sentence, model, username):
+        """
+        Build the request-log document for this failure.
+
+        Args:
+            sentence (str): The request sentence (used if the backend did not report one).
+            model (str): The request model key (used if the backend did not report one).
+            username (str): The requesting user.
+
+        Returns:
+            dict: Fields for `request_log.compact_document`, without `timestamp`.
+        """
+        return {
+            'inputSentence': self.input_sentence if self.input_sentence is not None else sentence,
+            'imr': self.imr,
+            'rawOutput': self.raw_output,
+            'status': "error",
+            'error': self.error,
+            'modelVersion': self.model_version if self.model_version is not None else model,
+            'prompt': self.prompt,
+            'username': username,
+        }
+
+
+def parse_error_message(message):
+    """
+    Parse the `message` of an upstream error body into a dict.
+
+    Args:
+        message (dict | str): The message as received.
+
+    Returns:
+        dict | None: The parsed details, or None if `message` is not a mapping
+        in any supported notation.
+    """
+    if isinstance(message, dict):
+        return message
+    if not isinstance(message, str):
+        return None
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            details = parse(message)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            continue
+        if isinstance(details, dict):
+            return details
+    return None
@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+
+"""
+Production server profile: several uvicorn worker processes managed by
+gunicorn, with the app imported once in the master (`preload_app`) so that
+prompt files, templates and module state are loaded before forking.
+
+Per-process resources that are not fork-safe (the Mongo client, SQLite
+connections of the shared cache tier) are created lazily after the fork.
+
+Run with:
+    gunicorn -c gunicorn.conf.py main:app
+"""
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", 330))
+graceful_timeout = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("WORKER_KEEPALIVE", 5))
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", 0))
+accesslog = "-"
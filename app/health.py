@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+import pymongo
+import requests
+
+load_dotenv()
+
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 2))
+HEALTH_CHECK_TTL = float(os.getenv("HEALTH_CHECK_TTL", 10))
+HEALTH_OPTIONAL_CHECKS = frozenset(
+    name.strip()
+    for name in os.getenv("HEALTH_OPTIONAL_CHECKS", "mongo,llama-dev,t5,osm-tag-search,color-bundle-search").split(',')
+    if name.strip()
+)
+
+OK = 'ok'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+def http_probe(url, params=None, session=None, verify=True):
+    """
+    Build a probe that sends a GET request to an upstream.
+
+    Any answer below 500 counts as healthy: the upstream is reachable and
+    not failing, even if it does not serve GET on that URL.
+
+    Args:
+        url (str | None): URL to request; None when the upstream is not configured.
+        params (dict | None): Query parameters.
+        session (requests.Session | None): Session to send the request with,
+            e.g. an endpoint's own session and headers.
+        verify (bool): Verify the TLS certificate.
+
+    Returns:
+        Callable[[float], None] | None: The probe, or None for an unconfigured
+        upstream.
+    """
+    if not url:
+        return None
+
+    def probe(timeout):
+        response = (session or requests).get(url, params=params, timeout=timeout, verify=verify)
+        if response.status_code >= 500:
+            raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+
+    return probe
+
+
+def mongo_probe(collection_factory):
+    """
+    Build a probe that pings the MongoDB server of the request log.
+
+    The probe's timeout bounds server selection as well as the ping, so an
+    unreachable server fails the check instead of hanging for the client's
+    `serverSelectionTimeoutMS`.
+
+    Args:
+        collection_factory (Callable[[], Collection]): Returns the request log.
+
+    Returns:
+        Callable[[float], None]: The probe.
+    """
+    def probe(timeout):
+        with pymongo.timeout(timeout):
+            collection_factory().database.client.admin.command('ping')
+
+    return probe
+
+
+def executor_stats(executor):
+    """
+    Describe the utilization of a thread pool.
+
+    Args:
+        executor (ThreadPoolExecutor): The pool.
+
+    Returns:
+        dict: Started and maximum worker threads and queued tasks.
+    """
+    return {
+        'workers': len(executor._threads),
+        'maxWorkers': executor._max_workers,
+        'queued': executor._work_queue.qsize(),
+    }
+
+
+class DependencyCheck:
+    """
+    Cached health check of one dependency.
+
+    The probe runs at most once per `ttl` seconds and never twice at the
+    same time: while a probe is still running (e.g. past its timeout), the
+    last result is reported instead of starting another one.
+
+    Attributes:
+        name (str): Dependency name, e.g. 'mongo' or 'llama-prod'.
+        probe (Callable[[float], None] | None): Raises if the dependency is
+            unhealthy; None marks the dependency as not configured.
+        required (bool): Whether a failure makes the worker not ready; by
+            default unless the name is listed in `HEALTH_OPTIONAL_CHECKS`.
+        ttl (float): Seconds a result is reused.
+    """
+    def __init__(self, name, probe, required=None, ttl=HEALTH_CHECK_TTL):
+        self.name = name
+        self.probe = probe
+        self.required = name not in HEALTH_OPTIONAL_CHECKS if required is None else required
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._running = False
+        self._result = None
+        self._checked_at = None
+
+    def _record(self, status, latency, error=None):
+        with self._lock:
+            self._result = {'status': status, 'latency': latency, 'error': error}
+            self._checked_at = time.monotonic()
+            self._running = False
+
+    def _run(self, timeout):
+        started = time.monotonic()
+        try:
+            self.probe(timeout)
+        except Exception as e:
+            self._record(FAILED, time.monotonic() - started, f"{type(e).__name__}: {e}")
+        else:
+            self._record(OK, time.monotonic() - started)
+
+    def refresh(self, executor, timeout):
+        """
+        Start the probe unless a fresh result exists or one is running.
+
+        Args:
+            executor (ThreadPoolExecutor): Pool to run the probe on.
+            timeout (float): Timeout handed to the probe.
+
+        Returns:
+            Future | None: The started probe, or None if none was started.
+        """
+        if self.probe is None:
+            return None
+        with self._lock:
+            if self._running:
+                return None
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.ttl:
+                return None
+            self._running = True
+            return executor.submit(self._run, timeout)
+
+    def timed_out(self, timeout):
+        """
+        Record a failure for a probe still running after `timeout` seconds.
+
+        The probe's own result replaces it once the probe returns.
+
+        Args:
+            timeout (float): The elapsed timeout.
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._result = {'status': FAILED, 'latency': None, 'error': f"timed out after {timeout:g}s"}
+            self._checked_at = time.monotonic()
+
+    def result(self):
+        """
+        Report the last result.
+
+        Returns:
+            dict: 'status' ('ok', 'failed' or 'skipped'), 'latency' (seconds),
+            'error', 'age' (seconds since the check) and 'required'.
+        """
+        if self.probe is None:
+            return {'status': SKIPPED, 'latency': None, 'error': 'not configured', 'age': None,
+                    'required': self.required}
+        with self._lock:
+            if self._result is None:
+                return {'status': FAILED, 'latency': None, 'error': 'not checked yet', 'age': None,
+                        'required': self.required}
+            return {**self._result, 'age': time.monotonic() - self._checked_at, 'required': self.required}
+
+
+class HealthChecks:
+    """
+    Dependency checks behind `/readyz`.
+
+    Stale checks are probed concurrently and a report waits at most
+    `timeout` seconds, so readiness probes stay fast even when a dependency
+    hangs. Unconfigured dependencies are skipped; failures of optional
+    dependencies are reported without making the worker not ready.
+
+    Attributes:
+        checks (list[DependencyCheck]): The dependency checks.
+        timeout (float): Maximum seconds a report waits for probes.
+        executor (ThreadPoolExecutor): Pool the probes run on.
+    """
+    def __init__(self, checks, timeout=HEALTH_CHECK_TIMEOUT):
+        self.checks = checks
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(checks)), thread_name_prefix="health-check")
+
+    def report(self):
+        """
+        Refresh stale checks and report all of them.
+
+        Returns:
+            tuple[bool, dict]: Whether every required dependency is healthy,
+            and the result of each check by name.
+        """
+        started = {}
+        for check in self.checks:
+            future = check.refresh(self.executor, self.timeout)
+            if future is not None:
+                started[future] = check
+        if started:
+            _, pending = wait(started, timeout=self.timeout)
+            for future in pending:
+                started[future].timed_out(self.timeout)
+
+        results = {check.name: check.result() for check in self.checks}
+        healthy = all(result['status'] != FAILED for result in results.values() if result['required'])
+        return healthy, results
@@ -0,0 +1,245 @@
+import sys
+from functools import lru_cache
+
+LEAF_FIELDS = ('key', 'operator', 'value')
+LEAF_INTERN_SIZE = 65536
+
+
+class FilterLeaf:
+    """
+    Immutable, slotted `{key, operator, value}` filter leaf.
+
+    Leaves are shared: `make_leaf` returns the same instance for equal
+    fields, and the key and operator strings are interned, so colour
+    expansions and cached tag results reuse a few small objects instead of
+    allocating a dict per leaf. Leaves read like a dict (`leaf['key']`,
+    `leaf.get`, `dict(leaf)`, equality with dicts) and are converted to dicts
+    only when serialized (`to_dict`, `to_builtin`, `serialization.json_default`).
+    Use `replace` instead of item assignment.
+
+    Attributes:
+        key (str): OSM tag key.
+        operator (str): Comparison operator.
+        value (Any): Tag value.
+    """
+    __slots__ = LEAF_FIELDS
+
+    def __init__(self, key, operator, value):
+        self.key = sys.intern(key) if type(key) is str else key
+        self.operator = sys.intern(operator) if type(operator) is str else operator
+        self.value = value
+
+    def __getitem__(self, field):
+        if field not in LEAF_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in LEAF_FIELDS else default
+
+    def keys(self):
+        return LEAF_FIELDS
+
+    def __iter__(self):
+        return iter(LEAF_FIELDS)
+
+    def __contains__(self, field):
+        return field in LEAF_FIELDS
+
+    def __len__(self):
+        return len(LEAF_FIELDS)
+
+    def replace(self, **changes):
+        """
+        Return the leaf with some fields changed.
+
+        Args:
+            **changes: New `key`, `operator` and/or `value`.
+
+        Returns:
+            FilterLeaf: The (shared) leaf with the resulting fields.
+        """
+        return make_leaf(changes.get('key', self.key), changes.get('operator', self.operator),
+                         changes.get('value', self.value))
+
+    def to_dict(self):
+        return {'key': self.key, 'operator': self.operator, 'value': self.value}
+
+    def __eq__(self, other):
+        if isinstance(other, FilterLeaf):
+            return (self.key, self.operator, self.value) == (other.key, other.operator, other.value)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.key, self.operator, self.value))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"FilterLeaf(key={self.key!r}, operator={self.operator!r}, value={self.value!r})"
+
+
+@lru_cache(maxsize=LEAF_INTERN_SIZE)
+def _interned_leaf(key, operator, value):
+    return FilterLeaf(key, operator, value)
+
+
+def make_leaf(key, operator, value):
+    """
+    Return the shared leaf for these fields.
+
+    Args:
+        key (str): OSM tag key.
+        operator (str): Comparison operator.
+        value (Any): Tag value; unhashable values get a fresh, unshared leaf.
+
+    Returns:
+        FilterLeaf: The leaf.
+    """
+    try:
+        return _interned_leaf(key, operator, value)
+    except TypeError:
+        return FilterLeaf(key, operator, value)
+
+
+def with_fields(leaf, **changes):
+    """
+    Return a leaf with some fields changed, leaving the original untouched.
+
+    Args:
+        leaf (FilterLeaf | dict): The leaf; dicts with extra fields are
+            copied as dicts.
+        **changes: New `key`, `operator` and/or `value`.
+
+    Returns:
+        FilterLeaf | dict: The changed leaf.
+    """
+    if type(leaf) is FilterLeaf:
+        return make_leaf(changes.get('key', leaf.key), changes.get('operator', leaf.operator),
+                         changes.get('value', leaf.value))
+    return {**leaf, **changes}
+
+
+def is_leaf(item):
+    """
+    Check whether a filter item is a `{key, operator, value}` leaf.
+
+    Args:
+        item (Any): An element of a filter tree.
+
+    Returns:
+        bool: True for leaves, False for `and`/`or` groups.
+    """
+    if isinstance(item, FilterLeaf):
+        return True
+    return isinstance(item, dict) and 'key' in item and 'and' not in item and 'or' not in item
+
+
+def to_leaves(tree):
+    """
+    Copy a JSON tree, replacing exact `{key, operator, value}` dicts with shared leaves.
+
+    Containers are copied, leaves are shared (they are immutable), so the
+    result can be modified like a deep copy of `tree`. Dicts with other or
+    missing fields are copied as dicts.
+
+    Args:
+        tree (Any): e.g. a tag search result.
+
+    Returns:
+        Any: The converted copy.
+    """
+    if isinstance(tree, list):
+        return [to_leaves(item) for item in tree]
+    if isinstance(tree, dict):
+        if len(tree) == len(LEAF_FIELDS) and all(field in tree for field in LEAF_FIELDS):
+            return make_leaf(tree['key'], tree['operator'], tree['value'])
+        return {name: to_leaves(item) for name, item in tree.items()}
+    return tree
+
+
+def to_builtin(tree):
+    """
+    Copy a tree with every `FilterLeaf` converted to a dict.
+
+    Args:
+        tree (Any): e.g. an IMR returned by `adopt_generation`.
+
+    Returns:
+        Any: Lists, dicts and scalars only.
+    """
+    if isinstance(tree, FilterLeaf):
+        return tree.to_dict()
+    if isinstance(tree, list):
+        return [to_builtin(item) for item in tree]
+    if isinstance(tree, dict):
+        return {name: to_builtin(item) for name, item in tree.items()}
+    return tree
+
+
+def compact_filters(filters):
+    """
+    Encode a filter tree compactly: every leaf becomes `[key, operator, value]`.
+
+    Args:
+        filters (list | dict): A filter tree as built by `build_filters`.
+
+    Returns:
+        list | dict: A new tree; `and`/`or` groups keep their shape.
+    """
+    if isinstance(filters, list):
+        return [compact_filters(item) for item in filters]
+    if is_leaf(filters):
+        return [filters.get(field) for field in LEAF_FIELDS]
+    if isinstance(filters, dict):
+        return {group: compact_filters(items) for group, items in filters.items()}
+    return filters
+
+
+def expand_filters(filters):
+    """
+    Reverse `compact_filters`.
+
+    Args:
+        filters (list | dict): A compact filter tree.
+
+    Returns:
+        list | dict: The tree with `{key, operator, value}` leaves.
+    """
+    if isinstance(filters, list):
+        if len(filters) == len(LEAF_FIELDS) and not any(isinstance(item, (list, dict)) for item in filters):
+            return dict(zip(LEAF_FIELDS, filters))
+        return [expand_filters(item) for item in filters]
+    if isinstance(filters, dict):
+        return {group: expand_filters(items) for group, items in filters.items()}
+    return filters
+
+
+def compact_imr(imr):
+    """
+    Return a copy of an IMR whose node filters use the compact leaf encoding.
+
+    Colour expansions repeat `"key"`, `"operator"` and `"value"` on every
+    leaf; positional triples remove that overhead. The input is not modified,
+    so cached IMRs stay intact.
+
+    Args:
+        imr (dict): The IMR.
+
+    Returns:
+        dict: The compact IMR.
+    """
+    if not isinstance(imr, dict) or 'nodes' not in imr:
+        return imr
+    compact = dict(imr)
+    compact['nodes'] = [
+        {**node, 'filters': compact_filters(node['filters'])} if 'filters' in node else node
+        for node in imr['nodes']
+    ]
+    return compact
@@ -1,25 +1,41 @@
+import hashlib
+import json
 import requests
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 from loguru import logger
 from yaml_parser import validate_and_fix_yaml
-from adopt_generation import adopt_generation
+from adopt_generation import AdoptFuncError, adopt_generation, prefetch_node_tags
+from circuit_breaker import get_breaker
+from errors import InferenceError
+from profiling import ADOPT, YAML, stage
+from prompts import (HF_STOP_SEQUENCES, estimate_max_new_tokens, get_prompt_template, normalize_environment,
+                     trim_to_yaml_document)
+from requests.adapters import HTTPAdapter
+from serialization import dumps
+from yaml_stream import ENTITY, IncrementalYamlParser
 
 logger.add(f"{__name__}.log", rotation="500 MB")
 
 load_dotenv()
 
 HF_LLAMA_ENDPOINT = os.getenv("HF_LLAMA_ENDPOINT")
+HF_LLAMA_ENDPOINT_PROD = os.getenv("HF_LLAMA_ENDPOINT_PROD") or HF_LLAMA_ENDPOINT
+HF_LLAMA_ENDPOINT_DEV = os.getenv("HF_LLAMA_ENDPOINT_DEV") or HF_LLAMA_ENDPOINT_PROD
 
 HF_ACCESS_TOKEN = os.getenv("HF_ACCESS_TOKEN")
-HF_MAX_NEW_TOKEN = os.getenv("HF_MAX_NEW_TOKEN", 1048)
 HF_TOP_P = os.getenv("HF_TOP_P", 0.1)
 HF_TEMPERATURE = os.getenv("HF_TEMPERATURE", 0.001)
-
-PROMPT_FILE = os.getenv("PROMPT_FILE")
-
-with open(PROMPT_FILE, 'r') as file:
-    PROMPT = file.read()
+HF_TIMEOUT = float(os.getenv("HF_TIMEOUT", 120))
+HF_TIMEOUT_MAX = float(os.getenv("HF_TIMEOUT_MAX", 300))
+HF_MAX_CONCURRENCY_PROD = int(os.getenv("HF_MAX_CONCURRENCY_PROD", 16))
+HF_MAX_CONCURRENCY_DEV = int(os.getenv("HF_MAX_CONCURRENCY_DEV", 4))
+HF_QUEUE_TIMEOUT = float(os.getenv("HF_QUEUE_TIMEOUT", 5))
+HF_STREAM = os.getenv("HF_STREAM", "false").lower() in ('1', 'true', 'yes')
+HF_STREAM_PREFETCH_WORKERS = int(os.getenv("HF_STREAM_PREFETCH_WORKERS", 8))
+HF_MODEL_REVISION = os.getenv("HF_MODEL_REVISION", "")
 
 headers = {
     "Accept": "application/json",
@@ -27,10 +43,261 @@ headers = {
     "Content-Type": "application/json"
 }
 
+STREAM_PREFETCH_POOL = ThreadPoolExecutor(max_workers=HF_STREAM_PREFETCH_WORKERS, thread_name_prefix="tag-prefetch")
+
+
+class EndpointBusyError(Exception):
+    """
+    Raised when an environment's endpoint has no free concurrency slot.
+
+    Attributes:
+        environment (str): Canonical environment whose limit was reached.
+    """
+    def __init__(self, environment):
+        self.environment = environment
+        self.message = f"The {environment} inference endpoint is at capacity, please retry."
+        super().__init__(self.message)
+
+
+class StreamError(Exception):
+    """
+    Raised when a generation stream fails after the endpoint answered 200:
+    an error event (e.g. overload or out of memory), a dropped connection
+    or a read timeout between tokens. It is the endpoint's failure, not the
+    sentence's, and is recorded on the endpoint's circuit breaker.
+
+    Attributes:
+        environment (str): Canonical environment of the endpoint.
+        error (str): What went wrong.
+    """
+    def __init__(self, environment, error):
+        self.environment = environment
+        self.error = error
+        self.message = f"The {environment} inference endpoint failed while generating, please retry."
+        super().__init__(f"{self.message} ({error})")
+
+
+class StreamedGeneration:
+    """
+    Result of a streamed generation, shaped like a non-streamed response.
+
+    Attributes:
+        status_code (int): Always 200; failed streams are returned as the
+            original `requests.Response`.
+        text (str): The concatenated generated text.
+    """
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def json(self):
+        return [{'generated_text': self.text}]
+
+
+def iter_stream_tokens(response, environment):
+    """
+    Yield the generated text of a server-sent event stream.
+
+    Expects text-generation-inference style events: one `data:` line per
+    token with `{"token": {"text": ..., "special": ...}}`, and an
+    `{"error": ...}` event if generation fails mid-stream.
+
+    Args:
+        response (requests.Response): A streaming 200 response.
+        environment (str): Canonical environment of the endpoint.
+
+    Yields:
+        str: Token texts, special tokens excluded.
+
+    Raises:
+        StreamError: If the stream reports an error.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        event = json.loads(line[len('data:'):])
+        if event.get('error'):
+            raise StreamError(environment, event['error'])
+        token = event.get('token') or {}
+        if token.get('text') and not token.get('special'):
+            yield token['text']
+
+
+class LlamaEndpoint:
+    """
+    Everything needed to serve one environment from its own LLaMA endpoint.
+
+    Each environment gets a dedicated `requests.Session` whose connection
+    pool is sized to its concurrency limit, a semaphore bounding in-flight
+    generations, its own circuit breaker, prompt template and cache
+    namespace. Development traffic therefore never queues behind, or holds
+    connections needed by, production traffic.
+
+    Attributes:
+        environment (str): Canonical environment name ('prod' or 'dev').
+        name (str): Endpoint name, e.g. 'llama-prod', shared by its circuit
+            breaker and its admission slot pool.
+        url (str): Inference endpoint URL.
+        prompt (PromptTemplate): Preloaded prompt of the environment.
+        version (str): Short hash of everything that shapes the output: URL,
+            prompt text, sampling parameters, stop sequences and
+            `HF_MODEL_REVISION`.
+        cache_namespace (str): Namespace for this environment's cached
+            results, e.g. 'llama:prod:3f2a9c0d41be'; it includes `version`, so
+            changing the prompt or model never serves older results.
+        max_concurrency (int): Maximum simultaneous requests to the endpoint.
+    """
+    def __init__(self, environment, url, max_concurrency):
+        self.environment = environment
+        self.name = f"llama-{environment}"
+        self.url = url
+        self.prompt = get_prompt_template(environment)
+        self.version = hashlib.sha256(json.dumps(
+            [url, self.prompt.text, HF_TOP_P, HF_TEMPERATURE, HF_STOP_SEQUENCES, HF_MODEL_REVISION]
+        ).encode('utf-8')).hexdigest()[:12]
+        self.cache_namespace = f"llama:{environment}:{self.version}"
+        self.max_concurrency = max_concurrency
+        self.breaker = get_breaker(self.name, initial_timeout=HF_TIMEOUT, min_timeout=10.0,
+                                   max_timeout=HF_TIMEOUT_MAX)
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._in_flight_lock = threading.Lock()
+        self.in_flight = 0
+
+    def post(self, payload):
+        """
+        Send a generation request within the environment's concurrency limit.
+
+        The payload is serialized once with `serialization.dumps`; the JSON
+        content type is set on the session.
+
+        Args:
+            payload (dict): JSON body for the endpoint.
+
+        Returns:
+            requests.Response: The endpoint response.
+
+        Raises:
+            EndpointBusyError: If no slot frees up within `HF_QUEUE_TIMEOUT` seconds.
+            CircuitOpenError: If this environment's circuit breaker is open.
+            requests.RequestException: On connection errors or adaptive timeouts.
+        """
+        if not self._slots.acquire(timeout=HF_QUEUE_TIMEOUT):
+            raise EndpointBusyError(self.environment)
+        with self._in_flight_lock:
+            self.in_flight += 1
+        try:
+            return self.breaker.call(self.session.post, self.url, data=dumps(payload))
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stream(self, payload, on_text):
+        """
+        Send a streaming generation request and read it until it ends or
+        `on_text` asks to stop.
+
+        The concurrency slot is held until the stream is read. Stopping early
+        closes the connection, which ends the generation on the endpoint. The
+        adaptive read timeout applies to the gap between tokens.
+
+        Args:
+            payload (dict): JSON body for the endpoint; `stream` is set to true.
+            on_text (Callable[[str], bool]): Called with each generated token;
+                returns True once no more text is needed.
+
+        Returns:
+            StreamedGeneration | requests.Response: The generated text, or the
+            endpoint response if it did not answer with 200.
+
+        Raises:
+            EndpointBusyError: If no slot frees up within `HF_QUEUE_TIMEOUT` seconds.
+            CircuitOpenError: If this environment's circuit breaker is open.
+            StreamError: If the stream fails after the endpoint answered;
+                recorded as a failure on the circuit breaker.
+            requests.RequestException: On connection errors or adaptive
+                timeouts before the endpoint answered.
+        """
+        if not self._slots.acquire(timeout=HF_QUEUE_TIMEOUT):
+            raise EndpointBusyError(self.environment)
+        with self._in_flight_lock:
+            self.in_flight += 1
+        try:
+            response = self.breaker.call(self.session.post, self.url, data=dumps({**payload, "stream": True}),
+                                         stream=True)
+            if response.status_code != 200:
+                return response
+            # The breaker saw a success once the headers arrived; failures
+            # while reading the body are recorded here.
+            chunks = []
+            try:
+                with response:
+                    for text in iter_stream_tokens(response, self.environment):
+                        chunks.append(text)
+                        if on_text(text):
+                            break
+            except StreamError:
+                self.breaker.record_failure()
+                raise
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                raise StreamError(self.environment, f"{type(e).__name__}: {e}") from e
+            return StreamedGeneration(''.join(chunks))
+        finally:
+            with self._in_flight_lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        """
+        Describe the endpoint's current load for the debug view.
+
+        Returns:
+            dict: In-flight generations, the concurrency limit and their ratio,
+            plus connections opened by the pool and currently idle in it.
+        """
+        pools = self._adapter.poolmanager.pools
+        connection_pools = [pool for pool in (pools.get(key) for key in pools.keys()) if pool is not None]
+        return {
+            'inFlight': self.in_flight,
+            'maxConcurrency': self.max_concurrency,
+            'utilization': self.in_flight / self.max_concurrency,
+            'connectionsOpened': sum(pool.num_connections for pool in connection_pools),
+            'connectionsIdle': sum(sum(1 for connection in pool.pool.queue if connection is not None)
+                                   for pool in connection_pools if pool.pool is not None),
+        }
+
+
+ENDPOINTS = {
+    'prod': LlamaEndpoint('prod', HF_LLAMA_ENDPOINT_PROD, HF_MAX_CONCURRENCY_PROD),
+    'dev': LlamaEndpoint('dev', HF_LLAMA_ENDPOINT_DEV, HF_MAX_CONCURRENCY_DEV),
+}
+
+
+def get_endpoint(environment):
+    """
+    Resolve the endpoint serving a request environment.
+
+    Args:
+        environment (str): Environment name as sent by the client.
+
+    Returns:
+        LlamaEndpoint: The endpoint of the canonical environment.
+    """
+    return ENDPOINTS[normalize_environment(environment)]
+
 
 def query(payload, environment):
     """
-    Send a POST request to the configured Hugging Face LLaMA inference endpoint.
+    Send a POST request to the Hugging Face LLaMA endpoint of an environment.
 
     Args:
         payload (dict): JSON-serializable body for the inference request. Expected
@@ -38,19 +305,24 @@ def query(payload, environment):
               - "inputs" (str): The input text.
               - "prompt" (str): The system or few-shot prompt to prepend.
               - "max_new_tokens" (int/str): Max tokens to generate.
+              - "stop" (list[str]): Optional stop sequences.
               - "top_p" (float/str): Nucleus sampling parameter.
               - "temperature" (float/str): Sampling temperature.
         environment (str): Execution environment indicator (e.g., "dev", "prod").
-            Currently not used in this function, but accepted for interface parity
-            and potential routing/telemetry.
+            Selects the endpoint, connection pool and concurrency limit.
 
     Returns:
         requests.Response: The raw HTTP response from the inference endpoint.
+
+    Raises:
+        EndpointBusyError: If the environment's concurrency limit is exhausted.
+        CircuitOpenError: If the environment's circuit breaker is open.
+        requests.RequestException: On connection errors or adaptive timeouts.
     """
-    endpoint = HF_LLAMA_ENDPOINT
-    response = requests.post(endpoint, headers=headers, json=payload)
+    response = get_endpoint(environment).post(payload)
     return response
 
+
 class LlamaInference:
     """
     Thin wrapper around a Hugging Face-hosted LLaMA text generation endpoint.
@@ -64,27 +336,108 @@ class LlamaInference:
         """
         Generate text using the underlying LLaMA endpoint.
 
+        The request goes to the endpoint of the request environment with that
+        environment's prompt template, and `max_new_tokens` is sized from the
+        sentence rather than always using `HF_MAX_NEW_TOKEN`.
+
+        With `HF_STREAM` enabled the output is streamed and parsed
+        incrementally: as soon as an entity is complete, its tag lookups
+        start in the background so they overlap with the rest of the
+        generation. The call returns once generation and those lookups are
+        done.
+
         Args:
             sentence (str): Input sentence to process. Will be lowercased before
                 being sent.
             environment (str): Execution environment indicator (e.g., "dev", "prod").
-                Passed through to maintain a consistent signature; currently unused.
+                Selects the endpoint and prompt template.
 
         Returns:
-            requests.Response: The HTTP response returned by the inference service.
+            requests.Response | StreamedGeneration: The HTTP response returned
+            by the inference service, or the streamed text.
+
+        Raises:
+            InferenceError: If the endpoint rejects the sentence (HTTP 400).
         """
-        output = query({
-            "inputs": sentence.lower(),
-            "prompt": PROMPT,
-            "max_new_tokens": HF_MAX_NEW_TOKEN,
+        sentence = sentence.lower()
+        payload = {
+            **get_endpoint(environment).prompt.fields(sentence),
+            "max_new_tokens": estimate_max_new_tokens(sentence),
             "top_p": HF_TOP_P,
             "temperature": HF_TEMPERATURE
-        }, environment)
+        }
+        if HF_STOP_SEQUENCES:
+            payload["stop"] = HF_STOP_SEQUENCES
+        if HF_STREAM:
+            output = self.stream(payload, environment)
+        else:
+            output = query(payload, environment)
+        if output.status_code == 400:
+            raise InferenceError.from_response(output)
         return output
 
+    def stream(self, payload, environment):
+        """
+        Stream a generation, prefetching tags of each entity as it completes.
+
+        The stream is closed as soon as the parser sees the end of the YAML
+        document, so trailing text is neither generated nor read.
+
+        Args:
+            payload (dict): The generation payload.
+            environment (str): Execution environment indicator.
+
+        Returns:
+            StreamedGeneration | requests.Response: See `LlamaEndpoint.stream`.
+        """
+        parser = IncrementalYamlParser()
+        prefetches = []
+
+        def prefetch(events):
+            for kind, value in events:
+                if kind == ENTITY:
+                    prefetches.append(STREAM_PREFETCH_POOL.submit(prefetch_node_tags, value))
+
+        def on_text(text):
+            prefetch(parser.feed(text))
+            return parser.finished
+
+        try:
+            response = get_endpoint(environment).stream(payload, on_text)
+            # The last entity is only complete once the stream has ended.
+            prefetch(parser.close())
+            return response
+        finally:
+            wait(prefetches)
+
+    def cache_namespace(self, environment):
+        """
+        Namespace under which results of this model and environment are cached.
+
+        Args:
+            environment (str): Execution environment indicator.
+
+        Returns:
+            str: e.g. 'llama:prod:3f2a9c0d41be'.
+        """
+        return get_endpoint(environment).cache_namespace
+
+    def admission_pool(self, environment):
+        """
+        Admission slot pool a generation for an environment waits in.
+
+        Args:
+            environment (str): Execution environment indicator.
+
+        Returns:
+            str: The endpoint name, e.g. 'llama-prod'.
+        """
+        return get_endpoint(environment).name
+
     def get_raw_output(self, response):
         """
-        Extract the generated text from the inference response.
+        Extract the generated text from the inference response, trimmed to the
+        first complete YAML document.
 
         Args:
             response (requests.Response): Response object returned by `generate`
@@ -92,14 +445,14 @@ class LlamaInference:
                 contains the key 'generated_text'.
 
         Returns:
-            str: The generated text string.
+            str: The generated text string without trailing continuation.
 
         Raises:
             KeyError/IndexError/ValueError: If the response JSON does not match
             the expected structure.
         """
         sentence = response.json()[0]['generated_text']
-        return sentence
+        return trim_to_yaml_document(sentence)
 
     def adopt(self, raw_response):
         """
@@ -116,10 +469,17 @@ class LlamaInference:
             dict: The adopted/normalized IMR object ready for persistence or return.
 
         Raises:
-            Exception: If validation or adoption fails downstream.
+            InferenceError: If the output cannot be validated or adopted; carries
+                the raw output for the request log.
+            CircuitOpenError: If the tag or colour search is failing fast.
         """
-        result = validate_and_fix_yaml(raw_response)
-        result = adopt_generation(result)
+        with stage(YAML):
+            result = validate_and_fix_yaml(raw_response)
+        try:
+            with stage(ADOPT):
+                result = adopt_generation(result)
+        except AdoptFuncError as e:
+            raise InferenceError(error=e.message, raw_output=raw_response)
         return result
 
 
@@ -129,15 +489,11 @@ if __name__ == '__main__':
     and prints the raw `requests.Response`. Useful for connectivity checks.
 
     Notes:
-        - Uses the globally loaded PROMPT and sampling parameters.
+        - Uses the preloaded prod prompt template and sampling parameters.
         - Assumes HF_* environment variables are correctly set.
     """
-    output = query({
-        "inputs": "find all bars that are called \"trink\" that are close to a kiosk in bonn",
-        "prompt": PROMPT,
-        "max_new_tokens": HF_MAX_NEW_TOKEN,
-        "top_p": HF_TOP_P,
-        "temperature": HF_TEMPERATURE
-    })
+    output = LlamaInference().generate(
+        "find all bars that are called \"trink\" that are close to a kiosk in bonn", "prod"
+    )
 
     print(output)
@@ -1,23 +1,42 @@
-import json
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, status
+from fastapi import FastAPI, Header, HTTPException, Query, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from pymongo import MongoClient
 from datetime import datetime
-from llama_inference import LlamaInference
-from t5_inference import T5Inference
+import anyio.to_thread
+import requests
+from admission import ADMISSION_RATE_KEY, AdmissionController, AdmissionRejectedError, generation_slots
+from adopt_generation import (COLOR_BUNDLE_SEARCH, COLOR_CACHE, PLURAL_CACHE, SEARCH_ENDPOINT, TAG_CACHE,
+                              tag_fetches_in_flight)
+from cache import LRUCache, get_shared_tier
+from circuit_breaker import CircuitOpenError, breaker_states
+from compression import CompressionMiddleware
+from errors import InferenceError
+from health import DependencyCheck, HealthChecks, executor_stats, http_probe, mongo_probe
+from imr_encoding import compact_imr
+from llama_inference import ENDPOINTS, STREAM_PREFETCH_POOL, EndpointBusyError, LlamaInference, StreamError
+from prefetch import TagPrefetcher
+from profiling import GENERATE, LOG, SERIALIZE, ProfilingError, SamplingProfiler, stage
+from prompts import normalize_environment
+from request_log import (RequestLogAccessError, authorize_reader, find_requests, format_timestamp, get_collection,
+                         log_request, now)
+from serialization import FAST_JSON, FastJSONResponse
+from t5_inference import T5_ENDPOINT, T5Inference
+from warmup import CacheWarmup
 
 load_dotenv()
 
 app = FastAPI()
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("MONGO_DB_NAME")]
-collection = db[os.getenv("MONGO_COLLECTION_NAME")]
+
+IMR_CACHE_SIZE = int(os.getenv("IMR_CACHE_SIZE", 1024))
+IMR_CACHE_TTL = float(os.getenv("IMR_CACHE_TTL", 3600))
+# Threads for requests that are not held by admission control (anyio's default).
+REQUEST_THREADS = int(os.getenv("REQUEST_THREADS", 40))
+IMR_CACHE = LRUCache("imr", maxsize=IMR_CACHE_SIZE, ttl=IMR_CACHE_TTL, shared=get_shared_tier())
 
 origins = ["*"]
 app.add_middleware(
@@ -27,6 +46,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
 
 class Response(BaseModel):
@@ -38,7 +58,8 @@ class Response(BaseModel):
         imr (Dict): The final IMR (intermediate representation) result.
         inputSentence (str): The input sentence, lowercased.
         status (str): Status of the request (e.g., 'success', 'error').
-        rawOutput (object): Raw model output before adaptation.
+        rawOutput (object): Raw model output before adaptation (omitted or
+            None when the request sets `includeRawOutput` to false).
         modelVersion (str): Identifier for which model was used.
         error (Optional[str]): Optional error message (only present on error).
         prompt (Optional[str]): Optional prompt sent to the model.
@@ -47,13 +68,47 @@ class Response(BaseModel):
     imr: Dict
     inputSentence: str
     status: str
-    rawOutput: object
+    rawOutput: object = None
     status: str
     modelVersion: str
     error: Optional[str] = None
     prompt: Optional[str] = None
 
 
+def build_response(model_result, omitted=()):
+    """
+    Serialize an endpoint result directly, skipping response-model validation.
+
+    The result is built by this service and already matches `Response`, so
+    validating it again and running it through `jsonable_encoder` only costs
+    time on large IMRs. Only the `Response` fields are emitted, in model order.
+
+    Args:
+        model_result (dict): The result dict built by the endpoint.
+        omitted (Iterable[str]): Fields the client asked to leave out.
+
+    Returns:
+        FastJSONResponse: An `ORJSONResponse` when orjson is available, a
+        standard `JSONResponse` otherwise.
+    """
+    return FastJSONResponse(content={
+        field: model_result.get(field) for field in Response.__fields__ if field not in omitted
+    })
+
+
+class RequestLogPage(BaseModel):
+    """
+    Response model returned by the `/requests` endpoint.
+
+    Attributes:
+        items (List[Dict]): Request documents, newest first, limited to the
+            requested fields.
+        nextCursor (Optional[str]): Cursor for the next page, None on the last page.
+    """
+    items: List[Dict]
+    nextCursor: Optional[str] = None
+
+
 class HTTPErrorResponse(BaseModel):
     """
     Response model returned in case of an HTTP error.
@@ -75,11 +130,54 @@ class RequestBody(BaseModel):
         model (str): Model key to use (e.g., 'llama', 't5').
         username (str): Username of the requester.
         environment (str): Execution environment (e.g., dev, prod).
+        includeRawOutput (bool): Return `rawOutput` alongside the IMR (default True).
+        includePrompt (bool): Return the `prompt` field (default True).
+        compactImr (bool): Encode filter leaves as `[key, operator, value]`
+            arrays instead of objects (default False).
+        batch (bool): Mark the request as part of a batch run; it is
+            scheduled after interactive requests (default False).
     """
     sentence: str
     model: str
     username: str
     environment: str
+    includeRawOutput: bool = True
+    includePrompt: bool = True
+    compactImr: bool = False
+    batch: bool = False
+
+
+@app.on_event("startup")
+def connect_request_log():
+    """
+    Open the Mongo client of this worker, which ensures the request-log
+    indexes in the background, then start the cache warm-up.
+    """
+    get_collection()
+    WARMUP.start(get_collection)
+
+
+@app.on_event("startup")
+async def size_request_threadpool():
+    """
+    Give the request threadpool room for every request admission control
+    can hold, on top of `REQUEST_THREADS` for everything else.
+
+    Sync endpoints run in anyio's threadpool, and a request waiting for a
+    generation slot blocks its thread. Without the extra threads, requests
+    beyond the pool's size would wait first-come first-served for a thread
+    instead of in the admission controller's priority queue.
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = REQUEST_THREADS + ADMISSION.max_blocked
+
+
+@app.on_event("shutdown")
+def snapshot_caches():
+    """
+    Save the caches to `CACHE_SNAPSHOT_PATH` so the next boot starts warm.
+    """
+    WARMUP.save()
 
 
 @app.exception_handler(HTTPException)
@@ -102,82 +200,529 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     )
 
 
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """
+    Fail fast while an upstream's circuit breaker is open.
+
+    Args:
+        request (Request): Incoming HTTP request (not used directly).
+        exc (CircuitOpenError): The rejection raised by the breaker.
+
+    Returns:
+        JSONResponse: A structured JSON error response with status 503 and a
+        `Retry-After` header.
+    """
+    response_model = HTTPErrorResponse(status="error", message=exc.message)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=jsonable_encoder(response_model),
+        headers={"Retry-After": str(int(exc.retry_after) + 1)},
+    )
+
+
+@app.exception_handler(EndpointBusyError)
+async def endpoint_busy_handler(request: Request, exc: EndpointBusyError):
+    """
+    Reject a request whose environment endpoint has no free concurrency slot.
+
+    Args:
+        request (Request): Incoming HTTP request (not used directly).
+        exc (EndpointBusyError): The rejection raised by the endpoint.
+
+    Returns:
+        JSONResponse: A structured JSON error response with status 503.
+    """
+    response_model = HTTPErrorResponse(status="error", message=exc.message)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=jsonable_encoder(response_model),
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(StreamError)
+async def stream_error_handler(request: Request, exc: StreamError):
+    """
+    Map a generation stream that failed after the endpoint answered to 502.
+
+    Args:
+        request (Request): Incoming HTTP request (not used directly).
+        exc (StreamError): The failure raised while reading the stream.
+
+    Returns:
+        JSONResponse: A structured JSON error response with status 502.
+    """
+    response_model = HTTPErrorResponse(status="error", message=exc.message)
+    return JSONResponse(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        content=jsonable_encoder(response_model),
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(AdmissionRejectedError)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejectedError):
+    """
+    Reject a request refused by admission control.
+
+    Args:
+        request (Request): Incoming HTTP request (not used directly).
+        exc (AdmissionRejectedError): The rejection.
+
+    Returns:
+        JSONResponse: A structured JSON error response with status 429 when
+        the user is rate limited, 503 when the request was shed, and a
+        `Retry-After` header.
+    """
+    response_model = HTTPErrorResponse(status="error", message=exc.message)
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS if exc.rate_limited else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=jsonable_encoder(response_model),
+        headers={"Retry-After": str(int(exc.retry_after) + 1)},
+    )
+
+
+@app.exception_handler(RequestLogAccessError)
+async def request_log_access_handler(request: Request, exc: RequestLogAccessError):
+    """
+    Reject a request-log API call without access.
+
+    Args:
+        request (Request): Incoming HTTP request (not used directly).
+        exc (RequestLogAccessError): The rejection, carrying its HTTP status.
+
+    Returns:
+        JSONResponse: A structured JSON error response with the error's status.
+    """
+    response_model = HTTPErrorResponse(status="error", message=exc.message)
+    return JSONResponse(status_code=exc.status_code, content=jsonable_encoder(response_model))
+
+
+@app.exception_handler(ProfilingError)
+async def profiling_error_handler(request: Request, exc: ProfilingError):
+    """
+    Reject a profiling request that is not allowed or cannot be served.
+
+    Args:
+        request (Request): Incoming HTTP request (not used directly).
+        exc (ProfilingError): The rejection, carrying its HTTP status.
+
+    Returns:
+        JSONResponse: A structured JSON error response with the error's status.
+    """
+    response_model = HTTPErrorResponse(status="error", message=exc.message)
+    return JSONResponse(status_code=exc.status_code, content=jsonable_encoder(response_model))
+
+
+@app.exception_handler(requests.Timeout)
+async def upstream_timeout_handler(request: Request, exc: requests.Timeout):
+    """
+    Map an upstream call exceeding its adaptive timeout to a 504 response.
+
+    Args:
+        request (Request): Incoming HTTP request (not used directly).
+        exc (requests.Timeout): The timeout raised by `requests`.
+
+    Returns:
+        JSONResponse: A structured JSON error response with status 504.
+    """
+    response_model = HTTPErrorResponse(status="error", message="Upstream service timed out.")
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content=jsonable_encoder(response_model),
+    )
+
+
 MODEL_INFERENCES = {
     'llama': LlamaInference(),
     't5': T5Inference()
 }
 
 
+def warmup_namespace(model, environment):
+    """
+    Map a logged model and environment to its IMR cache namespace.
+
+    Args:
+        model (str | None): Logged `modelVersion`.
+        environment (str | None): Logged environment; missing on older entries,
+            which then count as 'prod'.
+
+    Returns:
+        str | None: The namespace, or None for models this service no longer serves.
+    """
+    inference = MODEL_INFERENCES.get(model)
+    if inference is None:
+        return None
+    return inference.cache_namespace(environment)
+
+
+CACHES = [IMR_CACHE, TAG_CACHE, COLOR_CACHE, PLURAL_CACHE]
+ADMISSION = AdmissionController({
+    endpoint.name: generation_slots(endpoint.max_concurrency) for endpoint in ENDPOINTS.values()
+})
+PREFETCHER = TagPrefetcher()
+PROFILER = SamplingProfiler()
+WARMUP = CacheWarmup(IMR_CACHE, CACHES, warmup_namespace, pipeline_versions=sorted({
+    inference.cache_namespace(environment) for inference in MODEL_INFERENCES.values() for environment in ('prod', 'dev')
+}))
+HEALTH = HealthChecks([
+    DependencyCheck('mongo', mongo_probe(get_collection)),
+    DependencyCheck('osm-tag-search', http_probe(SEARCH_ENDPOINT, params={"word": "restaurant", "limit": 1,
+                                                                         "detail": False}, verify=False)),
+    DependencyCheck('color-bundle-search', http_probe(COLOR_BUNDLE_SEARCH, params={"color": "red", "limit": 1,
+                                                                                  "detail": False}, verify=False)),
+    *(DependencyCheck(f"llama-{environment}", http_probe(endpoint.url, session=endpoint.session))
+      for environment, endpoint in ENDPOINTS.items()),
+    DependencyCheck('t5', http_probe(T5_ENDPOINT)),
+])
+
+
+@app.get("/healthz")
+async def liveness():
+    """
+    Report that the process is alive.
+
+    No dependency is contacted and the request threadpool is not used, so
+    a busy or degraded worker still answers; see `/readyz` for readiness.
+
+    Returns:
+        dict: `{'status': 'ok'}`.
+    """
+    return {'status': 'ok'}
+
+
+@app.get("/health/circuit-breakers")
+def circuit_breaker_health():
+    """
+    Report the state of every upstream circuit breaker.
+
+    Returns:
+        dict: Upstream name mapped to its state ('closed', 'open', 'half_open'),
+        failure counters, current adaptive timeout and latency percentiles.
+    """
+    return breaker_states()
+
+
+@app.get("/health/prefetch")
+def prefetch_health():
+    """
+    Report how well speculative tag prefetch predicts the looked-up entities.
+
+    Returns:
+        dict: Candidate, lookup and hit counters with hit rate, warm rate
+        and precision.
+    """
+    return PREFETCHER.stats()
+
+
+@app.get("/readyz")
+def readiness():
+    """
+    Report whether this worker can serve traffic.
+
+    The worker is ready once its caches are warm and every required
+    dependency passes its check. By default only the production LLaMA
+    endpoint is required; MongoDB, the dev and T5 endpoints, tag search and
+    colour search are reported but optional (see `HEALTH_OPTIONAL_CHECKS`). Check results are cached for `HEALTH_CHECK_TTL` seconds and a
+    probe answers within `HEALTH_CHECK_TIMEOUT` seconds, so frequent probes
+    by the orchestrator do not load the dependencies (see `health.HealthChecks`).
+
+    Returns:
+        dict | JSONResponse: Readiness, warm-up stats and the result of each
+        dependency check; 503 while not ready.
+    """
+    healthy, checks = HEALTH.report()
+    ready = WARMUP.ready and healthy
+    content = {'ready': ready, 'warmup': WARMUP.stats(), 'checks': checks}
+    if not ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=content)
+    return content
+
+
+@app.get("/debug/stats")
+async def debug_stats():
+    """
+    Report the current load and internal state of this worker.
+
+    Runs on the event loop so it answers even when the request threadpool
+    is exhausted, and it reports that threadpool's usage.
+
+    Returns:
+        dict: In-flight requests per backend, thread pool utilization, cache
+        sizes and hit counters, circuit breakers, admission control,
+        speculative prefetch and warm-up stats.
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {
+        'backends': {
+            **{f"llama-{environment}": endpoint.stats() for environment, endpoint in ENDPOINTS.items()},
+            'osm-tag-search': {'inFlight': tag_fetches_in_flight()},
+        },
+        'pools': {
+            'requests': {'busy': limiter.borrowed_tokens, 'maxWorkers': limiter.total_tokens},
+            'streamPrefetch': executor_stats(STREAM_PREFETCH_POOL),
+            'speculativePrefetch': executor_stats(PREFETCHER.pool),
+            'healthChecks': executor_stats(HEALTH.executor),
+        },
+        'caches': {cache.name: cache.stats() for cache in CACHES},
+        'breakers': breaker_states(),
+        'admission': ADMISSION.stats(),
+        'prefetch': PREFETCHER.stats(),
+        'warmup': WARMUP.stats(),
+    }
+
+
+@app.post("/debug/profile")
+def start_profile(
+    request_count: Optional[int] = Query(None, ge=1, alias="requests"),
+    seconds: Optional[float] = Query(None, gt=0),
+    x_profile_token: Optional[str] = Header(None),
+):
+    """
+    Start a sampling profile of this worker's next requests.
+
+    Args:
+        request_count (Optional[int]): Number of requests to profile; sent as
+            the `requests` query parameter.
+        seconds (Optional[float]): Seconds to profile (capped at `PROFILE_MAX_SECONDS`).
+        x_profile_token (Optional[str]): Must match `PROFILE_TOKEN`.
+
+    Returns:
+        dict: Summary of the started profile.
+
+    Raises:
+        ProfilingError: If profiling is disabled (404), the token is wrong
+            (403), no limit is given (400) or a profile already runs (409).
+    """
+    PROFILER.authorize(x_profile_token)
+    return PROFILER.start(requests=request_count, seconds=seconds).summary()
+
+
+@app.get("/debug/profile")
+def profile_status(x_profile_token: Optional[str] = Header(None)):
+    """
+    Report the running profile and the recent ones of this worker.
+
+    Args:
+        x_profile_token (Optional[str]): Must match `PROFILE_TOKEN`.
+
+    Returns:
+        dict: The running profile and recent profiles, with samples per stage.
+    """
+    PROFILER.authorize(x_profile_token)
+    return PROFILER.stats()
+
+
+@app.get("/debug/profile/{profile_id}", response_class=PlainTextResponse)
+def profile_stacks(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    """
+    Download a profile as collapsed stacks (flamegraph.pl / speedscope input).
+
+    Args:
+        profile_id (str): Id of a running or recent profile.
+        x_profile_token (Optional[str]): Must match `PROFILE_TOKEN`.
+
+    Returns:
+        PlainTextResponse: One `stage;frame;...;frame count` line per stack.
+
+    Raises:
+        ProfilingError: If the profile is unknown (404).
+    """
+    PROFILER.authorize(x_profile_token)
+    session = PROFILER.get(profile_id)
+    if session is None:
+        raise ProfilingError(f"Unknown profile: {profile_id}", 404)
+    return PlainTextResponse(session.collapsed())
+
+
 @app.post(
     "/transform-sentence-to-imr",
     response_model=Response,
     status_code=status.HTTP_200_OK,
 )
-def transform_sentence_to_imr(body: RequestBody):
+def transform_sentence_to_imr(request: Request, body: RequestBody, x_profile_token: Optional[str] = Header(None)):
     """
     Transforms an input sentence into an intermediate representation (IMR)
     using the specified model ('llama' or 't5').
 
-    Stores results or errors in the database for traceability.
+    The response can be slimmed per request (`includeRawOutput`,
+    `includePrompt`, `compactImr`) and is compressed with brotli or gzip when
+    the client's `Accept-Encoding` allows it.
+
+    Every request is charged to its client's token bucket (its `username`,
+    or its address with `ADMISSION_RATE_KEY=address`); LLaMA generations
+    then run within the slots of their endpoint, where interactive outranks
+    batch requests (see `admission.AdmissionController`).
+
+    With `PREFETCH_ENABLED`, tag lookups for entity names guessed from the
+    sentence start while the model generates (see `prefetch.TagPrefetcher`).
+
+    Requests sent with a valid `X-Profile-Token` header, and requests
+    arriving while a profile started at `/debug/profile` runs, are sampled
+    by the profiler (see `profiling.SamplingProfiler`).
+
+    Successful results are cached per model and environment namespace, so
+    repeated sentences skip generation and tag lookups. Stores results or
+    errors in the database for traceability, in compact form (see
+    `request_log.log_request`); a logging failure does not fail the request.
 
     Args:
+        request (Request): The HTTP request; its peer address may key the rate limit.
         body (RequestBody): Request payload containing input sentence,
             model name, username, and environment.
+        x_profile_token (Optional[str]): Profiling token; profiles this
+            request. Ignored while profiling is disabled.
 
     Returns:
-        dict: A dictionary with the inference result and metadata.
+        FastJSONResponse | dict: The inference result and metadata, serialized
+        directly when `FAST_JSON` is enabled.
 
     Raises:
-        HTTPException: If the model returns an error or an unknown status.
+        HTTPException: If the model reports an `InferenceError` (logged, then
+            400) or returns an unknown status.
+        CircuitOpenError: If an upstream the request depends on is failing fast.
+        StreamError: If a streamed generation fails after the endpoint answered (502).
+        AdmissionRejectedError: If the user is rate limited or the request is shed.
+        ProfilingError: If the profiling token is invalid.
+    """
+    profile = x_profile_token is not None and PROFILER.enabled
+    if profile:
+        PROFILER.authorize(x_profile_token)
+    client = request.client.host if ADMISSION_RATE_KEY == 'address' and request.client else body.username
+    with PROFILER.request(requested=profile):
+        return transform(body, client)
+
+
+def transform(body, client):
+    """
+    Serve one `/transform-sentence-to-imr` request (see `transform_sentence_to_imr`).
+
+    Args:
+        body (RequestBody): The request payload.
+        client (str): Key of the client's rate-limit bucket.
+
+    Returns:
+        FastJSONResponse | dict: The inference result and metadata.
     """
     sentence = body.sentence.lower()
     environment = body.environment
     model = body.model
     username = body.username
 
-    response = MODEL_INFERENCES[model].generate(sentence, environment)
-    if response.status_code == status.HTTP_200_OK:
-        raw_output = MODEL_INFERENCES[model].get_raw_output(response)
-        adopted_result = MODEL_INFERENCES[model].adopt(raw_output)
+    ADMISSION.check_rate(client, environment)
 
-        model_result = {
-        'timestamp': f'{datetime.now():%Y-%m-%d %H:%M:%S%z}',
+    inference = MODEL_INFERENCES[model]
+    cache_namespace = inference.cache_namespace(environment)
+    cached_result = IMR_CACHE.get(cache_namespace, sentence)
+    if cached_result is not None:
+        raw_output, adopted_result = cached_result
+    else:
+        try:
+            with ADMISSION.slot(inference.admission_pool(environment), environment, body.batch), \
+                    PREFETCHER.speculate(sentence):
+                with stage(GENERATE):
+                    response = inference.generate(sentence, environment)
+                    if response.status_code != status.HTTP_200_OK:
+                        raise HTTPException(
+                            status_code=response.status_code, detail="An unexpected error occurred."
+                        )
+                    raw_output = inference.get_raw_output(response)
+                adopted_result = inference.adopt(raw_output)
+        except InferenceError as error:
+            log_document = error.to_document(sentence, model, username)
+            log_document['timestamp'] = now()
+            with stage(LOG):
+                log_request(log_document)
+
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=error.detail
+            )
+        IMR_CACHE.set(cache_namespace, sentence, (raw_output, adopted_result))
+
+    timestamp = now()
+    model_result = {
+        'timestamp': timestamp,
         'inputSentence': sentence,
         'imr': adopted_result,
         'rawOutput': raw_output,
         'modelVersion': model,
+        'environment': normalize_environment(environment),
         'status': 'success',
         'username': username
-        }
-
-        collection.insert_one(model_result)
-
-    elif response.status_code == status.HTTP_400_BAD_REQUEST:
-        error_response = response.json()
-        error_message = error_response.get('message', '')
-
-        cleaned_message = error_message.replace('\'', '\"').replace('None', 'null')
-        cleaned_message = cleaned_message.replace('\\n', '\\\\n')
-
-        error_details = json.loads(cleaned_message)
-        collection.insert_one({
-            'timestamp': error_details.get('timestamp'),
-            'inputSentence': error_details.get('inputSentence'),
-            'imr': error_details.get('imr'),
-            'rawOutput': error_details.get('rawOutput'),
-            'status': "error",
-            'error': error_details.get('error'),
-            'modelVersion': error_details.get('modelVersion'),
-            'prompt': error_details.get('prompt'),
-            'username': username
-        })
-
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=error_response
-        )
-    else:
-        raise HTTPException(
-            status_code=response.status_code, detail="An unexpected error occurred."
-        )
-
+    }
+
+    with stage(LOG):
+        log_request({**model_result, 'pipelineVersion': cache_namespace})
+
+    model_result['timestamp'] = format_timestamp(timestamp)
+    omitted = []
+    if not body.includeRawOutput:
+        omitted.append('rawOutput')
+    if not body.includePrompt:
+        omitted.append('prompt')
+
+    with stage(SERIALIZE):
+        if body.compactImr:
+            model_result['imr'] = compact_imr(adopted_result)
+        if FAST_JSON:
+            return build_response(model_result, omitted)
+    for field in omitted:
+        model_result[field] = None
     return model_result
+
+
+@app.get("/requests", response_model=RequestLogPage)
+def list_requests(
+    username: Optional[str] = None,
+    request_status: Optional[str] = Query(None, alias="status"),
+    model: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = None,
+    x_request_log_token: Optional[str] = Header(None),
+):
+    """
+    Page through the request log, newest first.
+
+    Every filter combination is served by an index, and large fields
+    (`imr`, `rawOutput`, `prompt`) are only returned when listed in `fields`.
+
+    Args:
+        username (Optional[str]): Only requests of this user.
+        request_status (Optional[str]): Only requests with this status
+            ('success', 'error'); sent as the `status` query parameter.
+        model (Optional[str]): Only requests served by this model.
+        start (Optional[datetime]): Inclusive lower bound on the request time.
+        end (Optional[datetime]): Exclusive upper bound on the request time.
+        cursor (Optional[str]): `nextCursor` of the previous page.
+        limit (int): Page size (1-100).
+        fields (Optional[str]): Comma-separated fields to return.
+        x_request_log_token (Optional[str]): Must match `REQUEST_LOG_TOKEN`.
+
+    Returns:
+        dict: The page items and the cursor of the next page.
+
+    Raises:
+        RequestLogAccessError: If the API is disabled (404) or the token is
+            wrong (403).
+        HTTPException: If the cursor or a requested field is invalid.
+    """
+    authorize_reader(x_request_log_token)
+    try:
+        return find_requests(
+            get_collection(),
+            limit=limit,
+            fields=fields.split(',') if fields else None,
+            username=username,
+            status=request_status,
+            model_version=model,
+            start=start,
+            end=end,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
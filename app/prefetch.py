@@ -0,0 +1,233 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from loguru import logger
+from adopt_generation import PLURAL_ENGINE, TAG_LOOKUP_OBSERVER, search_osm_tag
+from circuit_breaker import get_breaker
+
+load_dotenv()
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() in ('1', 'true', 'yes')
+PREFETCH_MAX_CANDIDATES = int(os.getenv("PREFETCH_MAX_CANDIDATES", 12))
+PREFETCH_MAX_NGRAM = int(os.getenv("PREFETCH_MAX_NGRAM", 3))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 8))
+
+# Speculative lookups often name things the search does not know; they go
+# through their own breaker so they cannot open (or slow down the adaptive
+# timeout of) the one real requests use.
+PREFETCH_BREAKER = get_breaker('osm-tag-prefetch', initial_timeout=10.0, min_timeout=1.0, max_timeout=30.0)
+
+WORD = re.compile(r"[a-z][a-z'\-]*")
+SINGULAR_ENDINGS = ('ss', 'us', 'is')
+
+# Words that never name an entity on their own: query verbs, determiners,
+# prepositions, spatial phrasing and distance units.
+STOPWORDS = frozenset("""
+a about above across after all along also an and any are around as at away be behind below beside besides
+between beyond both but by called can close closer contain contains containing could do does each either
+every except far few find for from get give has have having here i in inside into is it its least less list
+locate located m many me meter meters metre metres km kilometer kilometers kilometre kilometres mile miles
+more most much my near nearby nearest neighborhood next no nor not of off on one opposite or other our out
+outside over please search show some somewhere than that the their them there these they this those three
+through to together toward towards two under up use via want we where which while who whose with within
+without would yard yards you
+""".split())
+
+
+def singularize(word):
+    if word.endswith(SINGULAR_ENDINGS):
+        return word
+    return PLURAL_ENGINE.singular_noun(word) or word
+
+
+def candidate_names(sentence, limit=PREFETCH_MAX_CANDIDATES, max_ngram=PREFETCH_MAX_NGRAM):
+    """
+    Guess the entity names the model is likely to extract from a sentence.
+
+    Runs of consecutive non-stopwords are split into n-grams of up to
+    `max_ngram` words; the last word is singularized, since the model names
+    entities in the singular ("bus stops" -> "bus stop"), except for words
+    that only look plural ("bus", "grass"). Longer n-grams come first within
+    each position.
+
+    Args:
+        sentence (str): The (lowercased) input sentence.
+        limit (int): Maximum number of candidates.
+        max_ngram (int): Longest n-gram considered.
+
+    Returns:
+        list[str]: Distinct candidate names in sentence order.
+
+    Examples:
+        >>> candidate_names("find bus stops near a park in bonn")
+        ['bus stop', 'bus', 'stop', 'park', 'bonn']
+    """
+    runs, run = [], []
+    for word in WORD.findall(sentence.lower()):
+        if word in STOPWORDS:
+            if run:
+                runs.append(run)
+            run = []
+        else:
+            run.append(word)
+    if run:
+        runs.append(run)
+
+    candidates = []
+    for run in runs:
+        for start in range(len(run)):
+            for size in range(min(max_ngram, len(run) - start), 0, -1):
+                words = run[start:start + size]
+                name = ' '.join(words[:-1] + [singularize(words[-1])])
+                if name not in candidates:
+                    candidates.append(name)
+                if len(candidates) >= limit:
+                    return candidates
+    return candidates
+
+
+class Speculation:
+    """
+    Tag lookups started for one request before its entities are known.
+
+    While active, it observes the lookups the request makes itself (through
+    `adopt_generation.TAG_LOOKUP_OBSERVER`) to measure how well the guess
+    matched: a lookup is a hit if its name was speculated, and a warm hit if
+    the speculative lookup had already finished by then.
+
+    Attributes:
+        candidates (list[str]): Names being prefetched.
+        lookups (set[str]): Names the request looked up itself.
+        hits (set[str]): Looked-up names that were speculated.
+        warm_hits (set[str]): Hits whose prefetch had completed.
+    """
+    def __init__(self, candidates, futures):
+        self.candidates = candidates
+        self.futures = futures
+        self.lookups = set()
+        self.hits = set()
+        self.warm_hits = set()
+
+    def record(self, entity):
+        self.lookups.add(entity)
+        future = self.futures.get(entity)
+        if future is not None:
+            self.hits.add(entity)
+            if future.done():
+                self.warm_hits.add(entity)
+
+
+class TagPrefetcher:
+    """
+    Speculative tag prefetch run while the model generates.
+
+    Candidate names from `candidate_names` are looked up concurrently on a
+    thread pool through `search_osm_tag`, so `build_filters` usually finds
+    its results in `TAG_CACHE` (or waits for the lookup already in flight).
+    Prefetches still queued when the request finishes are cancelled.
+
+    Attributes:
+        enabled (bool): Whether speculation runs at all.
+        pool (ThreadPoolExecutor): Pool the speculative lookups run on.
+    """
+    def __init__(self, enabled=PREFETCH_ENABLED, workers=PREFETCH_WORKERS):
+        self.enabled = enabled
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculative-prefetch")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.candidates = 0
+        self.cancelled = 0
+        self.lookups = 0
+        self.hits = 0
+        self.warm_hits = 0
+
+    def _prefetch(self, name):
+        try:
+            search_osm_tag(name, breaker=PREFETCH_BREAKER)
+        except Exception as e:
+            logger.debug(f"Speculative lookup of '{name}' failed: {e}")
+
+    def start(self, sentence):
+        """
+        Start prefetching the candidates of a sentence.
+
+        Args:
+            sentence (str): The (lowercased) input sentence.
+
+        Returns:
+            Speculation | None: The running speculation, or None when disabled.
+        """
+        if not self.enabled:
+            return None
+        candidates = candidate_names(sentence)
+        futures = {name: self.pool.submit(self._prefetch, name) for name in candidates}
+        return Speculation(candidates, futures)
+
+    def finish(self, speculation):
+        """
+        Cancel outstanding prefetches and add the speculation to the metrics.
+
+        Args:
+            speculation (Speculation | None): Value returned by `start`.
+        """
+        if speculation is None:
+            return
+        cancelled = sum(1 for future in speculation.futures.values() if future.cancel())
+        with self._lock:
+            self.requests += 1
+            self.candidates += len(speculation.candidates)
+            self.cancelled += cancelled
+            self.lookups += len(speculation.lookups)
+            self.hits += len(speculation.hits)
+            self.warm_hits += len(speculation.warm_hits)
+
+    @contextmanager
+    def speculate(self, sentence):
+        """
+        Prefetch a sentence's candidates for the duration of a `with` block.
+
+        The request's own tag lookups inside the block are recorded, and the
+        speculation is finished on exit.
+
+        Args:
+            sentence (str): The (lowercased) input sentence.
+
+        Yields:
+            Speculation | None: The running speculation, or None when disabled.
+        """
+        speculation = self.start(sentence)
+        if speculation is None:
+            yield None
+            return
+        token = TAG_LOOKUP_OBSERVER.set(speculation)
+        try:
+            yield speculation
+        finally:
+            TAG_LOOKUP_OBSERVER.reset(token)
+            self.finish(speculation)
+
+    def stats(self):
+        """
+        Summarize how well speculation predicted the looked-up entities.
+
+        Returns:
+            dict: Counters plus `hitRate` (share of lookups that were
+            speculated), `warmRate` (share already finished when needed) and
+            `precision` (share of candidates that were used).
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'requests': self.requests,
+                'candidates': self.candidates,
+                'cancelled': self.cancelled,
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'warmHits': self.warm_hits,
+                'hitRate': self.hits / self.lookups if self.lookups else None,
+                'warmRate': self.warm_hits / self.lookups if self.lookups else None,
+                'precision': self.hits / self.candidates if self.candidates else None,
+            }
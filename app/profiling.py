@@ -0,0 +1,355 @@
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 300))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/spot_nlp_profiles")
+PROFILE_HISTORY = 10
+
+GENERATE = 'generate'
+YAML = 'yaml'
+ADOPT = 'adopt'
+SERIALIZE = 'serialize'
+LOG = 'log'
+REQUEST = 'request'
+
+RUNNING = 'running'
+DONE = 'done'
+
+# Current stage of each thread, read by the sampler from another thread.
+_stages = {}
+
+
+@contextmanager
+def stage(name):
+    """
+    Tag the samples taken in this thread during a `with` block with a stage.
+
+    Stages nest; the innermost one is used. Costs two dict operations, so
+    it stays in place when no profile is running.
+
+    Args:
+        name (str): Stage name, e.g. `GENERATE`, `YAML`, `ADOPT` or `SERIALIZE`.
+    """
+    thread_id = threading.get_ident()
+    previous = _stages.get(thread_id)
+    _stages[thread_id] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            _stages.pop(thread_id, None)
+        else:
+            _stages[thread_id] = previous
+
+
+class ProfilingError(Exception):
+    """
+    Raised when a profile cannot be accessed or started.
+
+    Attributes:
+        status_code (int): HTTP status to answer with.
+    """
+    def __init__(self, message, status_code):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+class ProfileSession:
+    """
+    One sampling profile, limited to a number of requests and/or seconds.
+
+    Attributes:
+        id (str): Session identifier, also the name of its file.
+        max_requests (int | None): Requests to profile; None for all requests
+            until the deadline.
+        deadline (float): `time.monotonic()` at which sampling stops.
+        samples (Counter): Collapsed stacks (`stage;frame;...;frame`) to counts.
+        path (str | None): File the collapsed stacks were written to.
+    """
+    def __init__(self, session_id, max_requests, seconds):
+        self.id = session_id
+        self.max_requests = max_requests
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds
+        self.samples = Counter()
+        self.requests = 0
+        self.completed = 0
+        self.threads = set()
+        self.status = RUNNING
+        self.path = None
+        self.duration = None
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """
+        Reserve a place for one more request in this profile.
+
+        Returns:
+            bool: False once the profile is finished or has enough requests.
+        """
+        with self._lock:
+            if self.status != RUNNING or time.monotonic() >= self.deadline:
+                return False
+            if self.max_requests is not None and self.requests >= self.max_requests:
+                return False
+            self.requests += 1
+            return True
+
+    def enter(self, thread_id):
+        with self._lock:
+            self.threads.add(thread_id)
+
+    def leave(self, thread_id):
+        with self._lock:
+            self.threads.discard(thread_id)
+            self.completed += 1
+
+    def sampled_threads(self):
+        with self._lock:
+            return list(self.threads)
+
+    def add_samples(self, stacks):
+        with self._lock:
+            self.samples.update(stacks)
+
+    def finished(self):
+        if time.monotonic() >= self.deadline:
+            return True
+        with self._lock:
+            return self.max_requests is not None and self.completed >= self.max_requests
+
+    def collapsed(self):
+        """
+        Format the samples as collapsed stacks, one `stack count` per line.
+
+        The format is read by flamegraph.pl, speedscope and similar tools.
+
+        Returns:
+            str: The collapsed stacks, most frequent first.
+        """
+        with self._lock:
+            samples = self.samples.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in samples)
+
+    def summary(self):
+        with self._lock:
+            samples = list(self.samples.items())
+        stages = Counter()
+        for stack, count in samples:
+            stages[stack.split(';', 1)[0]] += count
+        return {
+            'id': self.id,
+            'status': self.status,
+            'maxRequests': self.max_requests,
+            'seconds': self.seconds,
+            'requests': self.requests,
+            'completed': self.completed,
+            'samples': sum(count for _, count in samples),
+            'stages': dict(stages.most_common()),
+            'duration': self.duration,
+            'path': self.path,
+        }
+
+
+class SamplingProfiler:
+    """
+    On-demand sampling profiler for requests.
+
+    A profile covers the next N requests or the next T seconds (whichever
+    ends first). While it runs, a background thread wakes up every
+    `interval` seconds, reads the current frame of each thread serving a
+    profiled request through `sys._current_frames()` and counts its stack,
+    rooted at the thread's current `stage`. Nothing is sampled, and no
+    thread runs, between profiles. Finished profiles are written to
+    `directory` as collapsed stacks.
+
+    Profiling is only available when a token is configured; requests and
+    admin calls must present it.
+
+    Attributes:
+        token (str | None): Access token; None disables profiling.
+        interval (float): Seconds between samples.
+        max_seconds (float): Upper bound on a profile's duration.
+        directory (str): Where collapsed-stack files are written.
+    """
+    def __init__(self, token=PROFILE_TOKEN, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS,
+                 directory=PROFILE_DIR):
+        self.token = token
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._session = None
+        self._history = deque(maxlen=PROFILE_HISTORY)
+        self._ids = itertools.count(1)
+        self._frame_names = {}
+
+    @property
+    def enabled(self):
+        return bool(self.token)
+
+    def authorize(self, token):
+        """
+        Check an access token.
+
+        Args:
+            token (str | None): Token presented by the client.
+
+        Raises:
+            ProfilingError: 404 when profiling is disabled, 403 on a wrong token.
+        """
+        if not self.enabled:
+            raise ProfilingError("Profiling is disabled.", 404)
+        if not token or not hmac.compare_digest(token, self.token):
+            raise ProfilingError("Invalid profiling token.", 403)
+
+    def start(self, requests=None, seconds=None, admit=False):
+        """
+        Start a profile.
+
+        Args:
+            requests (int | None): Number of requests to profile.
+            seconds (float | None): Duration of the profile; capped at
+                `max_seconds`, which also applies when only `requests` is set.
+            admit (bool): Reserve the profile's first request for the caller
+                before other requests can see the profile.
+
+        Returns:
+            ProfileSession: The running profile.
+
+        Raises:
+            ProfilingError: 400 without limits, 409 while another profile runs.
+        """
+        if requests is None and seconds is None:
+            raise ProfilingError("Set the number of requests and/or seconds to profile.", 400)
+        with self._lock:
+            if self._session is not None:
+                raise ProfilingError(f"Profile {self._session.id} is still running.", 409)
+            session_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._ids)}"
+            session = ProfileSession(session_id, requests, min(seconds or self.max_seconds, self.max_seconds))
+            if admit:
+                session.requests = 1
+            self._session = session
+        threading.Thread(target=self._run, args=(session,), name="sampling-profiler", daemon=True).start()
+        return session
+
+    @contextmanager
+    def request(self, requested=False):
+        """
+        Profile the current request if a profile wants it.
+
+        Args:
+            requested (bool): The client asked for this request to be
+                profiled (already authorized); starts a one-request profile
+                unless one is running.
+
+        Yields:
+            ProfileSession | None: The profile the request belongs to.
+        """
+        session = self._session
+        admitted = False
+        if requested and session is None:
+            try:
+                session = self.start(requests=1, admit=True)
+                admitted = True
+            except ProfilingError:
+                session = self._session
+        if session is None or not (admitted or session.admit()):
+            yield None
+            return
+        thread_id = threading.get_ident()
+        session.enter(thread_id)
+        try:
+            yield session
+        finally:
+            session.leave(thread_id)
+
+    def _frame_name(self, code):
+        name = self._frame_names.get(code)
+        if name is None:
+            name = self._frame_names[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return name
+
+    def _sample(self, session):
+        frames = sys._current_frames()
+        stacks = []
+        for thread_id in session.sampled_threads():
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(_stages.get(thread_id, REQUEST))
+            stacks.append(';'.join(reversed(stack)))
+        session.add_samples(stacks)
+
+    def _run(self, session):
+        try:
+            while not session.finished():
+                time.sleep(self.interval)
+                self._sample(session)
+        finally:
+            session.status = DONE
+            session.duration = time.monotonic() - session.started
+            try:
+                session.path = self._write(session)
+            except OSError as e:
+                logger.warning(f"Could not write profile {session.id}: {e}")
+            with self._lock:
+                self._session = None
+                self._history.append(session)
+            logger.info(f"Profile finished: {session.summary()}")
+
+    def _write(self, session):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"profile-{session.id}.folded")
+        with open(path, 'w') as file:
+            file.write(session.collapsed())
+        return path
+
+    def get(self, session_id):
+        """
+        Find a running or recent profile.
+
+        Args:
+            session_id (str): The profile id.
+
+        Returns:
+            ProfileSession | None: The profile, if still known.
+        """
+        with self._lock:
+            sessions = list(self._history) + ([self._session] if self._session is not None else [])
+        return next((session for session in sessions if session.id == session_id), None)
+
+    def stats(self):
+        """
+        Describe the running profile and the recent ones.
+
+        Returns:
+            dict: 'enabled', 'active' (summary or None) and 'recent' summaries,
+            newest first.
+        """
+        with self._lock:
+            active = self._session
+            recent = list(self._history)
+        return {
+            'enabled': self.enabled,
+            'active': active.summary() if active is not None else None,
+            'recent': [session.summary() for session in reversed(recent)],
+        }
@@ -0,0 +1,216 @@
+import math
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROMPT_FILE = os.getenv("PROMPT_FILE")
+PROMPT_FILE_DEV = os.getenv("PROMPT_FILE_DEV") or PROMPT_FILE
+
+HF_MAX_NEW_TOKEN = int(os.getenv("HF_MAX_NEW_TOKEN", 1048))
+HF_MIN_NEW_TOKEN = int(os.getenv("HF_MIN_NEW_TOKEN", 160))
+HF_TOKENS_PER_WORD = int(os.getenv("HF_TOKENS_PER_WORD", 24))
+# Sent to the endpoint, which stops anywhere in the output, including the
+# reasoning the chain-of-thought prod prompt asks for before the YAML. So the
+# default is only the end-of-sequence token; the end of the YAML document is
+# detected client-side (`trim_to_yaml_document`, `IncrementalYamlParser`).
+# A literal `\n` in the variable is a newline.
+HF_STOP_SEQUENCES = [stop.replace("\\n", "\n") for stop in
+                     os.getenv("HF_STOP_SEQUENCES", "</s>").split(",") if stop]
+
+INPUT_SLOT = "{input}"
+OUTPUT_SLOT = "{output}"
+
+ENVIRONMENT_ALIASES = {
+    'prod': 'prod',
+    'production': 'prod',
+    'dev': 'dev',
+    'development': 'dev',
+}
+DEFAULT_ENVIRONMENT = 'prod'
+
+TOP_LEVEL_KEY = re.compile(r'^([A-Za-z_]+):')
+DOCUMENT_KEYS = ('area', 'entities', 'relations')
+
+
+def normalize_environment(environment):
+    """
+    Map a client-supplied environment name onto a canonical key.
+
+    Args:
+        environment (str | None): Value from the request (e.g. 'production', 'dev').
+
+    Returns:
+        str: 'prod' or 'dev'. Unknown or missing values fall back to 'prod'.
+    """
+    if not environment:
+        return DEFAULT_ENVIRONMENT
+    return ENVIRONMENT_ALIASES.get(environment.strip().lower(), DEFAULT_ENVIRONMENT)
+
+
+class PromptTemplate:
+    """
+    A prompt file read and split once, so rendering is a plain concatenation.
+
+    The endpoint handler takes the template text as `prompt` and the
+    sentence as `inputs`, and fills an `{input}` slot itself (see `fields`).
+    `render` builds the same prompt locally: templates containing an
+    `{input}` slot (e.g. the dev prompt) get the sentence in place and any
+    `{output}` slot removed; templates without a slot (e.g. the
+    chain-of-thought prod prompt) are used unchanged.
+
+    Attributes:
+        path (str): File the template was read from.
+        text (str): Raw template text.
+        has_input_slot (bool): Whether the template embeds the sentence itself.
+    """
+    def __init__(self, path, text):
+        self.path = path
+        self.text = text
+        self.has_input_slot = INPUT_SLOT in text
+        if self.has_input_slot:
+            prefix, suffix = text.split(INPUT_SLOT, 1)
+            self._prefix = prefix
+            self._suffix = suffix.replace(OUTPUT_SLOT, '').rstrip() + '\n'
+        else:
+            self._prefix = text
+            self._suffix = ''
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as file:
+            return cls(path, file.read())
+
+    def render(self, sentence):
+        """
+        Build the prompt for one sentence.
+
+        Args:
+            sentence (str): The (lowercased) input sentence.
+
+        Returns:
+            str: The prompt the endpoint handler builds for the sentence.
+        """
+        if not self.has_input_slot:
+            return self._prefix
+        return self._prefix + sentence + self._suffix
+
+    def fields(self, sentence):
+        """
+        Build the `inputs` and `prompt` fields of a generation payload.
+
+        This is the endpoint handler's contract: the sentence always goes in
+        `inputs` and the template text, slots included, in `prompt`. The
+        handler renders the prompt itself, and text-generation-inference
+        backends reject an empty `inputs`.
+
+        Args:
+            sentence (str): The (lowercased) input sentence.
+
+        Returns:
+            dict: 'inputs' and 'prompt'.
+        """
+        return {"inputs": sentence, "prompt": self.text}
+
+
+def load_prompt_templates():
+    """
+    Read the prompt file of each environment once.
+
+    Returns:
+        dict: Canonical environment name mapped to its `PromptTemplate`. Files
+        shared by several environments are only read once.
+    """
+    paths = {'prod': PROMPT_FILE, 'dev': PROMPT_FILE_DEV}
+    loaded = {}
+    templates = {}
+    for environment, path in paths.items():
+        if path not in loaded:
+            loaded[path] = PromptTemplate.from_file(path)
+        templates[environment] = loaded[path]
+    return templates
+
+
+PROMPT_TEMPLATES = load_prompt_templates()
+
+
+def get_prompt_template(environment):
+    """
+    Return the preloaded template for a request environment.
+
+    Args:
+        environment (str): Environment name as sent by the client.
+
+    Returns:
+        PromptTemplate: The template of the canonical environment.
+    """
+    return PROMPT_TEMPLATES[normalize_environment(environment)]
+
+
+def estimate_max_new_tokens(sentence):
+    """
+    Size the generation budget from the sentence instead of always asking for
+    `HF_MAX_NEW_TOKEN`.
+
+    The YAML output grows with the number of entities, properties and
+    relations, which tracks the sentence length closely. The budget is
+    `HF_MIN_NEW_TOKEN` plus `HF_TOKENS_PER_WORD` per word, rounded up to a
+    multiple of 32 and capped at `HF_MAX_NEW_TOKEN`.
+
+    Args:
+        sentence (str): The input sentence.
+
+    Returns:
+        int: The `max_new_tokens` value to request.
+    """
+    words = len(sentence.split())
+    budget = HF_MIN_NEW_TOKEN + HF_TOKENS_PER_WORD * words
+    budget = int(math.ceil(budget / 32.0) * 32)
+    return min(budget, HF_MAX_NEW_TOKEN)
+
+
+def trim_to_yaml_document(text):
+    """
+    Cut generated text after the first complete YAML document.
+
+    Models sometimes keep decoding after the answer: an end-of-sequence
+    marker, a `---`/code-fence terminator, trailing prose or unknown keys, or
+    a second copy of the document. Everything from the first such point is
+    dropped.
+
+    Args:
+        text (str): Raw generated text.
+
+    Returns:
+        str: The text up to the end of the first YAML document.
+
+    Examples:
+        >>> trim_to_yaml_document("area:\\n  type: bbox\\narea:\\n  type: bbox")
+        'area:\\n  type: bbox'
+    """
+    for stop in HF_STOP_SEQUENCES:
+        index = text.find(stop)
+        if index != -1:
+            text = text[:index]
+
+    lines = text.split('\n')
+    seen_keys = set()
+    started = False
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if started and stripped in ('---', '...', '```'):
+            return '\n'.join(lines[:index]).rstrip()
+        if not line or line[0] in (' ', '\t', '-', '#'):
+            continue
+        match = TOP_LEVEL_KEY.match(line)
+        if match is None or match.group(1) not in DOCUMENT_KEYS:
+            if started:
+                return '\n'.join(lines[:index]).rstrip()
+            continue
+        key = match.group(1)
+        if key in seen_keys:
+            return '\n'.join(lines[:index]).rstrip()
+        seen_keys.add(key)
+        started = True
+    return text
@@ -0,0 +1,350 @@
+"""
+Replay logged requests and diff the resulting IMRs against the logged ones.
+
+`adopt` mode re-runs only `validate_and_fix_yaml` and `adopt_generation` on
+the logged `rawOutput`, so regressions in the adopt layer are found without
+any model call. `full` mode re-runs the whole pipeline (generation
+included), e.g. after changing `PROMPT_FILE` or the model. Requests are
+replayed concurrently and reported in their original order.
+
+Neither mode is fully deterministic: the adopt layer still looks up tags
+and colours on the live search services (`SEARCH_ENDPOINT`,
+`COLOR_BUNDLE_SEARCH`), whose answers are not logged. A change in their
+data shows up as changed IMRs although the code under test is the same;
+replay the current release too to tell the two apart.
+
+Usage:
+    python app/replay.py --limit 500 --since 2026-01-01
+    python app/replay.py --jsonl requests.jsonl --mode full --model llama --environment dev
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pymongo import DESCENDING
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from adopt_generation import adopt_generation
+from circuit_breaker import percentile
+from imr_encoding import to_builtin
+from request_log import build_request_query, expand_documents, get_collection
+from serialization import json_default
+from yaml_parser import validate_and_fix_yaml
+
+ADOPT = 'adopt'
+FULL = 'full'
+
+SAME = 'same'
+CHANGED = 'changed'
+ERROR = 'error'
+
+REPLAY_FIELDS = {'inputSentence': 1, 'rawOutput': 1, 'rawOutputCodec': 1, 'imr': 1, 'imrId': 1,
+                 'modelVersion': 1, 'environment': 1, 'timestamp': 1}
+EXPAND_BATCH_SIZE = 500
+
+
+def load_logged_requests(collection, limit=None, batch_size=EXPAND_BATCH_SIZE, **filters):
+    """
+    Read successful requests from the request log, newest first.
+
+    Args:
+        collection (Collection): The request log.
+        limit (int | None): Maximum number of requests; None reads all.
+        batch_size (int): Documents expanded per query on the prompt and IMR
+            collections.
+        **filters: Passed to `request_log.build_request_query` (`username`,
+            `model_version`, `start`, `end`).
+
+    Yields:
+        dict: Expanded documents with 'inputSentence', 'rawOutput', 'imr',
+        'modelVersion' and 'environment'.
+    """
+    cursor = (collection.find(build_request_query(status='success', **filters), REPLAY_FIELDS)
+              .sort([('timestamp', DESCENDING), ('_id', DESCENDING)]))
+    if limit:
+        cursor = cursor.limit(limit)
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield from expand_documents(batch)
+            batch = []
+    if batch:
+        yield from expand_documents(batch)
+
+
+def load_jsonl_requests(path, limit=None):
+    """
+    Read requests from a JSONL export, one request document per line.
+
+    Args:
+        path (str): Export file, e.g. items of `/requests?fields=imr,rawOutput`.
+        limit (int | None): Maximum number of requests; None reads all.
+
+    Yields:
+        dict: The request documents, in file order.
+    """
+    with open(path, 'r') as file:
+        count = 0
+        for line in file:
+            if not line.strip():
+                continue
+            yield json.loads(line)
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def diff_imr(expected, actual, path=''):
+    """
+    Compare two IMRs structurally.
+
+    Dicts are compared by key and lists by position; leaves compare equal
+    whether they are dicts or `FilterLeaf` objects.
+
+    Args:
+        expected (Any): The logged IMR (or a part of it).
+        actual (Any): The replayed IMR (or a part of it).
+        path (str): Location of this part, e.g. 'nodes[0].filters'.
+
+    Returns:
+        list[dict]: One entry per difference with 'path', 'change' ('added',
+        'removed' or 'changed'), 'expected' and 'actual'. Empty if equal.
+
+    Examples:
+        >>> diff_imr({'nodes': [{'name': 'bar'}]}, {'nodes': [{'name': 'pub'}]})
+        [{'path': 'nodes[0].name', 'change': 'changed', 'expected': 'bar', 'actual': 'pub'}]
+    """
+    expected, actual = to_builtin(expected), to_builtin(actual)
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in expected:
+            child = f"{path}.{key}" if path else str(key)
+            if key not in actual:
+                differences.append({'path': child, 'change': 'removed', 'expected': expected[key], 'actual': None})
+            else:
+                differences.extend(diff_imr(expected[key], actual[key], child))
+        for key in actual:
+            if key not in expected:
+                child = f"{path}.{key}" if path else str(key)
+                differences.append({'path': child, 'change': 'added', 'expected': None, 'actual': actual[key]})
+        return differences
+    if isinstance(expected, list) and isinstance(actual, list):
+        differences = []
+        for index in range(max(len(expected), len(actual))):
+            child = f"{path}[{index}]"
+            if index >= len(actual):
+                differences.append({'path': child, 'change': 'removed', 'expected': expected[index], 'actual': None})
+            elif index >= len(expected):
+                differences.append({'path': child, 'change': 'added', 'expected': None, 'actual': actual[index]})
+            else:
+                differences.extend(diff_imr(expected[index], actual[index], child))
+        return differences
+    if expected != actual or (type(expected) is not type(actual) and not _both_numbers(expected, actual)):
+        return [{'path': path, 'change': 'changed', 'expected': expected, 'actual': actual}]
+    return []
+
+
+def _both_numbers(first, second):
+    return all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (first, second))
+
+
+def adopt_only(document):
+    """
+    Re-run the adopt layer on a logged request's raw output.
+
+    Args:
+        document (dict): A logged request with 'rawOutput'.
+
+    Returns:
+        dict: The adopted IMR.
+    """
+    return adopt_generation(validate_and_fix_yaml(document['rawOutput']))
+
+
+def full_pipeline(document, model=None, environment=None):
+    """
+    Re-run generation and adoption for a logged request's sentence.
+
+    Args:
+        document (dict): A logged request with 'inputSentence'.
+        model (str | None): Model to use instead of the logged `modelVersion`.
+        environment (str | None): Environment to use instead of the logged one.
+
+    Returns:
+        dict: The adopted IMR.
+
+    Raises:
+        InferenceError: If the model rejects the sentence or its output.
+    """
+    inference = get_inference(model or document.get('modelVersion') or 'llama')
+    response = inference.generate(document['inputSentence'], environment or document.get('environment') or 'prod')
+    if response.status_code != 200:
+        raise RuntimeError(f"Model endpoint answered with HTTP {response.status_code}")
+    return inference.adopt(inference.get_raw_output(response))
+
+
+_inferences = {}
+
+
+def get_inference(model):
+    # Imported on first use: adopt-only replays need neither the endpoints
+    # nor the prompt files configured.
+    if model not in _inferences:
+        if model == 'llama':
+            from llama_inference import LlamaInference
+            _inferences[model] = LlamaInference()
+        elif model == 't5':
+            from t5_inference import T5Inference
+            _inferences[model] = T5Inference()
+        else:
+            raise ValueError(f"Unknown model: {model}")
+    return _inferences[model]
+
+
+def replay_one(document, run):
+    """
+    Replay one request and diff its IMR against the logged one.
+
+    Args:
+        document (dict): A logged request.
+        run (Callable[[dict], dict]): Produces the new IMR, e.g. `adopt_only`.
+
+    Returns:
+        dict: 'id', 'inputSentence', 'status' ('same', 'changed' or 'error'),
+        'differences', 'error' and 'seconds'.
+    """
+    started = time.perf_counter()
+    result = {'id': str(document.get('_id', document.get('id'))), 'inputSentence': document.get('inputSentence')}
+    try:
+        imr = run(document)
+    except Exception as e:
+        result.update(status=ERROR, differences=[], error=f"{type(e).__name__}: {e}")
+    else:
+        differences = diff_imr(document.get('imr'), imr)
+        result.update(status=CHANGED if differences else SAME, differences=differences, error=None)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def replay(documents, run, workers=8):
+    """
+    Replay requests concurrently, yielding results in input order.
+
+    At most a few requests per worker are read ahead, so large logs are
+    streamed rather than loaded at once.
+
+    Args:
+        documents (Iterable[dict]): Logged requests.
+        run (Callable[[dict], dict]): Produces the new IMR of a request.
+        workers (int): Concurrent replays.
+
+    Yields:
+        dict: Results of `replay_one`.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay") as executor:
+        window = deque()
+        for document in documents:
+            window.append(executor.submit(replay_one, document, run))
+            if len(window) >= workers * 4:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def summarize(results, elapsed):
+    """
+    Aggregate replay results.
+
+    Args:
+        results (list[dict]): Results of `replay_one`.
+        elapsed (float): Wall-clock seconds of the whole replay.
+
+    Returns:
+        dict: Counts per status, throughput (requests per second) and
+        per-request latency percentiles.
+    """
+    latencies = [result['seconds'] for result in results]
+    return {
+        'requests': len(results),
+        SAME: sum(1 for result in results if result['status'] == SAME),
+        CHANGED: sum(1 for result in results if result['status'] == CHANGED),
+        ERROR: sum(1 for result in results if result['status'] == ERROR),
+        'seconds': elapsed,
+        'throughput': len(results) / elapsed if elapsed else None,
+        'latencyP50': percentile(latencies, 0.5),
+        'latencyP99': percentile(latencies, 0.99),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay logged requests and diff the IMRs.")
+    parser.add_argument('--mode', choices=(ADOPT, FULL), default=ADOPT,
+                        help="'adopt' re-runs only the adopt layer on the logged raw output (no model calls, but "
+                             "live tag and colour searches); 'full' re-runs generation too.")
+    parser.add_argument('--jsonl', help="Read requests from this JSONL export instead of the request log.")
+    parser.add_argument('--limit', type=int, help="Maximum number of requests.")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="Only requests at or after this time.")
+    parser.add_argument('--until', type=datetime.fromisoformat, help="Only requests before this time.")
+    parser.add_argument('--username', help="Only requests of this user.")
+    parser.add_argument('--logged-model', help="Only requests served by this model.")
+    parser.add_argument('--model', help="Full mode: model to replay with instead of the logged one.")
+    parser.add_argument('--environment', help="Full mode: environment to replay with instead of the logged one.")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent replays (default 8).")
+    parser.add_argument('--output', help="Write one JSON result per request to this file.")
+    parser.add_argument('--show', type=int, default=20, help="Changed or failed requests printed (default 20).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    Returns:
+        int: Exit status; 1 if any request changed or failed.
+    """
+    args = parse_args(argv)
+    if args.jsonl:
+        documents = load_jsonl_requests(args.jsonl, args.limit)
+    else:
+        documents = load_logged_requests(get_collection(), args.limit, username=args.username,
+                                         model_version=args.logged_model, start=args.since, end=args.until)
+    if args.mode == ADOPT:
+        run = adopt_only
+    else:
+        def run(document):
+            return full_pipeline(document, args.model, args.environment)
+
+    output = open(args.output, 'w') if args.output else None
+    results = []
+    started = time.perf_counter()
+    try:
+        for result in replay(documents, run, args.workers):
+            results.append(result)
+            if output is not None:
+                output.write(json.dumps(result, default=json_default) + '\n')
+            if result['status'] != SAME and args.show > 0:
+                args.show -= 1
+                print(f"[{result['status']}] {result['inputSentence']}")
+                if result['error']:
+                    print(f"    {result['error']}")
+                for difference in result['differences']:
+                    print(f"    {difference['change']} {difference['path']}: "
+                          f"{json.dumps(difference['expected'], default=json_default)} -> "
+                          f"{json.dumps(difference['actual'], default=json_default)}")
+    finally:
+        if output is not None:
+            output.close()
+
+    summary = summarize(results, time.perf_counter() - started)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary[CHANGED] or summary[ERROR] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,669 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from bson import Binary, ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+from loguru import logger
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import PyMongoError
+from serialization import json_default
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+MONGO_COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME")
+MONGO_REQUEST_TTL_DAYS = os.getenv("MONGO_REQUEST_TTL_DAYS")
+MONGO_PROMPT_COLLECTION_NAME = os.getenv("MONGO_PROMPT_COLLECTION_NAME") or f"{MONGO_COLLECTION_NAME}Prompts"
+MONGO_IMR_COLLECTION_NAME = os.getenv("MONGO_IMR_COLLECTION_NAME") or f"{MONGO_COLLECTION_NAME}Imrs"
+RAW_OUTPUT_COMPRESS_THRESHOLD = int(os.getenv("RAW_OUTPUT_COMPRESS_THRESHOLD", 512))
+KNOWN_CONTENT_IDS = int(os.getenv("KNOWN_CONTENT_IDS", 4096))
+CONTENT_REFRESH_SECONDS = float(os.getenv("CONTENT_REFRESH_SECONDS", 86400))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+REQUEST_LOG_TOKEN = os.getenv("REQUEST_LOG_TOKEN")
+
+LEGACY_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+MAX_PAGE_SIZE = 100
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Fields returned by the read API when no explicit `fields` are requested.
+DEFAULT_FIELDS = ('timestamp', 'inputSentence', 'username', 'status', 'modelVersion', 'error')
+# Large fields that must be asked for explicitly.
+OPTIONAL_FIELDS = ('imr', 'rawOutput', 'prompt')
+# Stored fields backing each optional field in compact documents.
+STORED_FIELDS = {
+    'imr': ('imr', 'imrId'),
+    'rawOutput': ('rawOutput', 'rawOutputCodec'),
+    'prompt': ('prompt', 'promptId'),
+}
+
+REQUEST_INDEXES = [
+    ('username_timestamp', [('username', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('status_timestamp', [('status', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('model_timestamp', [('modelVersion', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('timestamp_id', [('timestamp', DESCENDING), ('_id', DESCENDING)]),
+]
+
+_state = {}
+_state_lock = threading.Lock()
+
+
+class RequestLogAccessError(Exception):
+    """
+    Raised when the request-log API is called without access.
+
+    Attributes:
+        status_code (int): HTTP status to answer with.
+    """
+    def __init__(self, message, status_code):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+def authorize_reader(token, expected=None):
+    """
+    Check the token presented to the request-log API.
+
+    The log holds every user's sentences, so the API is only served when
+    `REQUEST_LOG_TOKEN` is configured.
+
+    Args:
+        token (str | None): Token presented by the client.
+        expected (str | None): Token to check against; defaults to `REQUEST_LOG_TOKEN`.
+
+    Raises:
+        RequestLogAccessError: 404 when the API is disabled, 403 on a wrong token.
+    """
+    expected = expected if expected is not None else REQUEST_LOG_TOKEN
+    if not expected:
+        raise RequestLogAccessError("The request log API is disabled.", 404)
+    if not token or not hmac.compare_digest(token, expected):
+        raise RequestLogAccessError("Invalid request log token.", 403)
+
+
+def ensure_indexes(collection):
+    """
+    Create the indexes used by analytics queries and the `/requests` API.
+
+    Compound indexes cover equality on `username`, `status` or `modelVersion`
+    followed by a time range and the (timestamp, _id) sort. If
+    `MONGO_REQUEST_TTL_DAYS` is set, a TTL index on `timestamp` expires old
+    request documents. Existing indexes are left untouched; conflicts (e.g. a
+    TTL changed by hand) are logged instead of failing startup.
+
+    Args:
+        collection (pymongo.collection.Collection): The request-log collection.
+    """
+    for name, keys in REQUEST_INDEXES:
+        try:
+            collection.create_index(keys, name=name)
+        except PyMongoError as e:
+            logger.warning(f"Could not ensure index {name}: {e}")
+
+    if MONGO_REQUEST_TTL_DAYS:
+        try:
+            collection.create_index(
+                [('timestamp', ASCENDING)],
+                name='timestamp_ttl',
+                expireAfterSeconds=int(float(MONGO_REQUEST_TTL_DAYS) * 86400),
+            )
+        except PyMongoError as e:
+            logger.warning(f"Could not ensure TTL index: {e}")
+
+
+def ensure_content_indexes(*collections):
+    """
+    Expire prompts and IMRs no longer referenced by any request.
+
+    If `MONGO_REQUEST_TTL_DAYS` is set, a TTL index on `lastUsed` removes
+    content documents once the requests referencing them have expired.
+    `lastUsed` is refreshed at most every `CONTENT_REFRESH_SECONDS`, so the
+    index waits that much longer than the request TTL.
+
+    Args:
+        *collections (pymongo.collection.Collection): The prompt and IMR collections.
+    """
+    if not MONGO_REQUEST_TTL_DAYS:
+        return
+    expire_after = int(float(MONGO_REQUEST_TTL_DAYS) * 86400 + CONTENT_REFRESH_SECONDS)
+    for collection in collections:
+        try:
+            collection.create_index([('lastUsed', ASCENDING)], name='last_used_ttl', expireAfterSeconds=expire_after)
+        except PyMongoError as e:
+            logger.warning(f"Could not ensure TTL index on {collection.name}: {e}")
+
+
+def _ensure_all_indexes(database):
+    ensure_indexes(database[MONGO_COLLECTION_NAME])
+    ensure_content_indexes(database[MONGO_PROMPT_COLLECTION_NAME], database[MONGO_IMR_COLLECTION_NAME])
+
+
+def _get_database():
+    pid = os.getpid()
+    with _state_lock:
+        if _state.get('pid') != pid:
+            client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS)
+            database = client[MONGO_DB_NAME]
+            threading.Thread(target=_ensure_all_indexes, args=(database,), name="mongo-indexes",
+                             daemon=True).start()
+            _state['pid'] = pid
+            _state['client'] = client
+            _state['database'] = database
+        return _state['database']
+
+
+def get_collection():
+    """
+    Return the `nlpRequests` collection of the current process.
+
+    The `MongoClient` is created lazily and once per process id. `MongoClient`
+    is not fork-safe, so when the app is preloaded in a server master and
+    forked into workers, each worker opens its own client on first use. The
+    request-log indexes are ensured in a background thread when the client
+    is created, so an unreachable server does not hold up the caller.
+
+    Returns:
+        pymongo.collection.Collection: The request-log collection.
+    """
+    return _get_database()[MONGO_COLLECTION_NAME]
+
+
+def get_prompt_collection():
+    """
+    Return the collection holding each distinct prompt once, keyed by hash.
+
+    Returns:
+        pymongo.collection.Collection: The prompt collection.
+    """
+    return _get_database()[MONGO_PROMPT_COLLECTION_NAME]
+
+
+def get_imr_collection():
+    """
+    Return the collection holding each distinct canonical IMR once, keyed by hash.
+
+    Returns:
+        pymongo.collection.Collection: The IMR collection.
+    """
+    return _get_database()[MONGO_IMR_COLLECTION_NAME]
+
+
+def content_id(text):
+    """
+    Content-address a string.
+
+    Args:
+        text (str): Prompt or canonical IMR text.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def canonical_imr(imr):
+    """
+    Serialize an IMR in canonical form: sorted keys, no insignificant whitespace.
+
+    Two IMRs that differ only in key order produce the same text and thus the
+    same content id.
+
+    Args:
+        imr (dict): The IMR.
+
+    Returns:
+        str: Canonical JSON text.
+    """
+    return json.dumps(imr, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=json_default)
+
+
+def compress_text(text):
+    """
+    Compress a large text field for storage.
+
+    Uses zstd when the optional `zstandard` package is installed, zlib otherwise.
+
+    Args:
+        text (str): Text to compress.
+
+    Returns:
+        tuple[Binary, str]: Compressed bytes and the codec name ('zstd' or 'zlib').
+    """
+    data = text.encode('utf-8')
+    if zstandard is not None:
+        return Binary(zstandard.ZstdCompressor(level=9).compress(data)), 'zstd'
+    return Binary(zlib.compress(data, 9)), 'zlib'
+
+
+def decompress_text(data, codec):
+    """
+    Reverse `compress_text`.
+
+    Args:
+        data (bytes): Compressed bytes.
+        codec (str): 'zstd' or 'zlib'.
+
+    Returns:
+        str: The original text.
+
+    Raises:
+        ValueError: If the codec is unknown or zstd data is read without `zstandard`.
+    """
+    if codec == 'zlib':
+        return zlib.decompress(data).decode('utf-8')
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Reading zstd-compressed documents requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class _KnownIds:
+    """
+    Bounded set of content ids this process stored recently, to skip repeated upserts.
+
+    An id counts as known for `refresh_after` seconds after it was stored,
+    after which the next use writes it again to refresh its `lastUsed`.
+    """
+    def __init__(self, maxsize, refresh_after=CONTENT_REFRESH_SECONDS):
+        self.maxsize = maxsize
+        self.refresh_after = refresh_after
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, content_id):
+        with self._lock:
+            stored_at = self._ids.get(content_id)
+            if stored_at is not None and time.monotonic() - stored_at < self.refresh_after:
+                self._ids.move_to_end(content_id)
+                return True
+            return False
+
+    def add(self, content_id):
+        with self._lock:
+            self._ids[content_id] = time.monotonic()
+            self._ids.move_to_end(content_id)
+            while len(self._ids) > self.maxsize:
+                self._ids.popitem(last=False)
+
+
+_known_prompts = _KnownIds(KNOWN_CONTENT_IDS)
+_known_imrs = _KnownIds(KNOWN_CONTENT_IDS)
+
+
+def _store_once(collection, known, content_key, content_value, text):
+    identifier = content_id(text)
+    if identifier not in known:
+        timestamp = now()
+        collection.update_one(
+            {'_id': identifier},
+            {'$setOnInsert': {content_key: content_value, 'createdAt': timestamp}, '$set': {'lastUsed': timestamp}},
+            upsert=True,
+        )
+        known.add(identifier)
+    return identifier
+
+
+def compact_document(document, prompt_collection=None, imr_collection=None):
+    """
+    Turn a request document into its compact stored form.
+
+    - `prompt` is stored once in the prompt collection and replaced by `promptId`.
+    - `imr` is stored once, in canonical form, in the IMR collection and
+      replaced by `imrId`.
+    - Stored prompts and IMRs carry a `lastUsed` time, refreshed at most every
+      `CONTENT_REFRESH_SECONDS`, which their TTL index expires them by.
+    - `rawOutput` longer than `RAW_OUTPUT_COMPRESS_THRESHOLD` bytes is
+      compressed; `rawOutputCodec` records the codec.
+
+    The input document is not modified.
+
+    Args:
+        document (dict): Request document as built by the endpoint.
+        prompt_collection (Collection | None): Defaults to `get_prompt_collection()`.
+        imr_collection (Collection | None): Defaults to `get_imr_collection()`.
+
+    Returns:
+        dict: The document to insert into the request log.
+    """
+    compact = dict(document)
+
+    prompt = compact.pop('prompt', None)
+    if prompt:
+        prompt_collection = prompt_collection if prompt_collection is not None else get_prompt_collection()
+        compact['promptId'] = _store_once(prompt_collection, _known_prompts, 'prompt', prompt, prompt)
+
+    imr = compact.pop('imr', None)
+    if imr is not None:
+        imr_collection = imr_collection if imr_collection is not None else get_imr_collection()
+        text = canonical_imr(imr)
+        compact['imrId'] = _store_once(imr_collection, _known_imrs, 'imr', json.loads(text), text)
+
+    raw_output = compact.get('rawOutput')
+    if isinstance(raw_output, str) and len(raw_output.encode('utf-8')) > RAW_OUTPUT_COMPRESS_THRESHOLD:
+        compact['rawOutput'], compact['rawOutputCodec'] = compress_text(raw_output)
+
+    return compact
+
+
+def log_request(document):
+    """
+    Store a request document in its compact form.
+
+    Logging never fails the request: Mongo errors, bounded by
+    `MONGO_SERVER_SELECTION_TIMEOUT_MS` when the server is unreachable, are
+    logged and the document is dropped.
+
+    Args:
+        document (dict): Request document as built by the endpoint.
+
+    Returns:
+        bool: Whether the document was stored.
+    """
+    try:
+        get_collection().insert_one(compact_document(document))
+    except PyMongoError as e:
+        logger.warning(f"Could not log request: {e}")
+        return False
+    return True
+
+
+def expand_documents(documents, prompt_collection=None, imr_collection=None):
+    """
+    Restore `prompt`, `imr` and `rawOutput` on compact documents in place.
+
+    Referenced prompts and IMRs are fetched with one query per collection
+    for the whole batch. Documents written before compaction (inline fields)
+    pass through unchanged.
+
+    Args:
+        documents (list[dict]): Documents read from the request log.
+        prompt_collection (Collection | None): Defaults to `get_prompt_collection()`.
+        imr_collection (Collection | None): Defaults to `get_imr_collection()`.
+
+    Returns:
+        list[dict]: The same documents.
+    """
+    prompt_ids = {document['promptId'] for document in documents if 'promptId' in document}
+    imr_ids = {document['imrId'] for document in documents if 'imrId' in document}
+
+    prompts = {}
+    if prompt_ids:
+        prompt_collection = prompt_collection if prompt_collection is not None else get_prompt_collection()
+        prompts = {doc['_id']: doc['prompt'] for doc in prompt_collection.find({'_id': {'$in': list(prompt_ids)}})}
+    imrs = {}
+    if imr_ids:
+        imr_collection = imr_collection if imr_collection is not None else get_imr_collection()
+        imrs = {doc['_id']: doc['imr'] for doc in imr_collection.find({'_id': {'$in': list(imr_ids)}})}
+
+    for document in documents:
+        if 'promptId' in document:
+            document['prompt'] = prompts.get(document.pop('promptId'))
+        if 'imrId' in document:
+            document['imr'] = imrs.get(document.pop('imrId'))
+        if 'rawOutputCodec' in document:
+            document['rawOutput'] = decompress_text(document['rawOutput'], document.pop('rawOutputCodec'))
+    return documents
+
+
+def now():
+    """
+    Current time as a timezone-aware UTC datetime, as stored in `timestamp`.
+
+    Returns:
+        datetime: The current UTC time.
+    """
+    return datetime.now(timezone.utc)
+
+
+def format_timestamp(timestamp):
+    """
+    Render a stored timestamp in the legacy response format (local time).
+
+    Args:
+        timestamp (datetime): Timezone-aware timestamp.
+
+    Returns:
+        str: e.g. '2024-05-01 13:37:00'.
+    """
+    return f'{timestamp.astimezone():{LEGACY_TIMESTAMP_FORMAT}}'
+
+
+def encode_cursor(document):
+    """
+    Build the opaque pagination cursor pointing after a document.
+
+    The cursor is URL-safe, so clients can put `nextCursor` into a query
+    string without encoding it. Mongo stores datetimes with millisecond
+    precision, so milliseconds since the epoch identify the timestamp.
+
+    Args:
+        document (dict): The last document of a page (needs `timestamp` and `_id`).
+
+    Returns:
+        str: Unpadded URL-safe base64 of '<epoch milliseconds>|<object id>'.
+    """
+    timestamp = document['timestamp']
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    milliseconds = (timestamp - EPOCH) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(f"{milliseconds}|{document['_id']}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Parse a cursor produced by `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor string.
+
+    Returns:
+        tuple[datetime, ObjectId]: Timestamp and id of the last seen document.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        milliseconds, object_id = decoded.split('|', 1)
+        return EPOCH + timedelta(milliseconds=int(milliseconds)), ObjectId(object_id)
+    except (ValueError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def build_request_query(username=None, status=None, model_version=None, start=None, end=None, cursor=None):
+    """
+    Build the Mongo filter for a page of request documents.
+
+    Args:
+        username (str | None): Exact username.
+        status (str | None): 'success' or 'error'.
+        model_version (str | None): Model key (e.g. 'llama').
+        start (datetime | None): Inclusive lower bound on `timestamp`.
+        end (datetime | None): Exclusive upper bound on `timestamp`.
+        cursor (str | None): Cursor of the previous page.
+
+    Returns:
+        dict: A filter served by one of `REQUEST_INDEXES`.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    query = {}
+    if username is not None:
+        query['username'] = username
+    if status is not None:
+        query['status'] = status
+    if model_version is not None:
+        query['modelVersion'] = model_version
+
+    time_range = {}
+    if start is not None:
+        time_range['$gte'] = start
+    if end is not None:
+        time_range['$lt'] = end
+    if time_range:
+        query['timestamp'] = time_range
+
+    if cursor is not None:
+        last_timestamp, last_id = decode_cursor(cursor)
+        query = {'$and': [query, {'$or': [
+            {'timestamp': {'$lt': last_timestamp}},
+            {'timestamp': last_timestamp, '_id': {'$lt': last_id}},
+        ]}]}
+    return query
+
+
+def build_projection(fields=None):
+    """
+    Select the fields returned by the read API.
+
+    Args:
+        fields (Iterable[str] | None): Requested fields; None means `DEFAULT_FIELDS`.
+
+    Returns:
+        dict: A Mongo projection.
+
+    Raises:
+        ValueError: If an unknown field is requested.
+    """
+    if not fields:
+        fields = DEFAULT_FIELDS
+    unknown = set(fields) - set(DEFAULT_FIELDS) - set(OPTIONAL_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {}
+    for field in fields:
+        for stored_field in STORED_FIELDS.get(field, (field,)):
+            projection[stored_field] = 1
+    projection['timestamp'] = 1
+    return projection
+
+
+def serialize_request(document):
+    """
+    Convert a stored request document into a JSON-friendly dict.
+
+    Args:
+        document (dict): Raw Mongo document.
+
+    Returns:
+        dict: The document with `_id` renamed to `id` and datetimes in ISO format.
+    """
+    result = {'id': str(document['_id'])}
+    for key, value in document.items():
+        if key == '_id':
+            continue
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        result[key] = value
+    return result
+
+
+def find_requests(collection, limit=20, fields=None, **filters):
+    """
+    Read one page of request documents, newest first, with compacted fields
+    expanded.
+
+    Args:
+        collection (pymongo.collection.Collection): The request-log collection.
+        limit (int): Page size, capped at `MAX_PAGE_SIZE`.
+        fields (Iterable[str] | None): Fields to return (see `build_projection`).
+        **filters: Passed to `build_request_query`.
+
+    Returns:
+        dict: {'items': [...], 'nextCursor': str | None}.
+
+    Raises:
+        ValueError: On malformed cursors or unknown fields.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    documents = list(
+        collection.find(build_request_query(**filters), build_projection(fields))
+        .sort([('timestamp', DESCENDING), ('_id', DESCENDING)])
+        .limit(limit + 1)
+    )
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1])
+    expand_documents(documents)
+    return {'items': [serialize_request(document) for document in documents], 'nextCursor': next_cursor}
+
+
+def migrate_string_timestamps(collection):
+    """
+    Convert documents written with the legacy string `timestamp` to datetimes.
+
+    Legacy timestamps were written in the server's local time without an
+    offset; they are interpreted in the local timezone of the migrating host.
+
+    Args:
+        collection (pymongo.collection.Collection): The request-log collection.
+
+    Returns:
+        int: Number of converted documents.
+    """
+    converted = 0
+    for document in collection.find({'timestamp': {'$type': 'string'}}, {'timestamp': 1}):
+        try:
+            timestamp = datetime.strptime(document['timestamp'][:19], LEGACY_TIMESTAMP_FORMAT)
+        except ValueError:
+            logger.warning(f"Skipping unparsable timestamp on {document['_id']}: {document['timestamp']}")
+            continue
+        collection.update_one(
+            {'_id': document['_id']},
+            {'$set': {'timestamp': timestamp.astimezone().astimezone(timezone.utc)}},
+        )
+        converted += 1
+    return converted
+
+
+def backfill_last_used(*collections):
+    """
+    Set `lastUsed` to `createdAt` on content documents written without it.
+
+    Those documents are otherwise never expired by the `lastUsed` TTL index.
+
+    Args:
+        *collections (pymongo.collection.Collection): The prompt and IMR collections.
+
+    Returns:
+        int: Number of updated documents.
+    """
+    updated = 0
+    for collection in collections:
+        result = collection.update_many({'lastUsed': {'$exists': False}}, [{'$set': {'lastUsed': '$createdAt'}}])
+        updated += result.modified_count
+    return updated
+
+
+if __name__ == '__main__':
+    """
+    Maintenance entry point.
+
+    Usage:
+        python request_log.py migrate-timestamps
+        python request_log.py backfill-last-used
+    """
+    if sys.argv[1:] == ['migrate-timestamps']:
+        print(f"Converted {migrate_string_timestamps(get_collection())} documents.")
+    elif sys.argv[1:] == ['backfill-last-used']:
+        print(f"Updated {backfill_last_used(get_prompt_collection(), get_imr_collection())} documents.")
+    else:
+        print("Usage: python request_log.py migrate-timestamps | backfill-last-used")
@@ -0,0 +1,63 @@
+import json
+import os
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+load_dotenv()
+
+FAST_JSON = os.getenv("FAST_JSON", "true").lower() in ("1", "true", "yes")
+
+USE_ORJSON = FAST_JSON and orjson is not None
+
+
+def json_default(obj):
+    """
+    Serialize objects that describe themselves with `to_dict()` (e.g. `FilterLeaf`).
+
+    Pass as `default=` to `json.dumps` or `orjson.dumps`.
+
+    Raises:
+        TypeError: For any other object.
+    """
+    to_dict = getattr(obj, 'to_dict', None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return to_dict()
+
+
+if USE_ORJSON:
+    from fastapi.responses import ORJSONResponse
+
+    class FastJSONResponse(ORJSONResponse):
+        def render(self, content):
+            return orjson.dumps(content, default=json_default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+else:
+    class FastJSONResponse(JSONResponse):
+        def render(self, content):
+            return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+                              default=json_default).encode('utf-8')
+
+
+def dumps(payload):
+    """
+    Serialize a request body once, to bytes.
+
+    Uses `orjson` when available and `FAST_JSON` is enabled, the standard
+    library otherwise. Passing the bytes as `data=` avoids `requests`
+    re-encoding the payload with `json.dumps` on every call.
+
+    Args:
+        payload (Any): JSON-serializable object.
+
+    Returns:
+        bytes: UTF-8 encoded JSON.
+    """
+    if USE_ORJSON:
+        return orjson.dumps(payload, default=json_default)
+    return json.dumps(payload, separators=(',', ':'), default=json_default).encode('utf-8')
@@ -1,13 +1,20 @@
 from dotenv import load_dotenv
 from yaml_parser import validate_and_fix_yaml
-from adopt_generation import adopt_generation
+from adopt_generation import AdoptFuncError, adopt_generation
+from circuit_breaker import get_breaker
+from errors import InferenceError
+from profiling import ADOPT, YAML, stage
+from prompts import normalize_environment
+from serialization import dumps
 import requests
-import json
 import os
 
 load_dotenv()
 
 T5_ENDPOINT = os.getenv("T5_ENDPOINT")
+T5_TIMEOUT = float(os.getenv("T5_TIMEOUT", 30))
+
+T5_BREAKER = get_breaker('t5', initial_timeout=T5_TIMEOUT, min_timeout=2.0, max_timeout=T5_TIMEOUT * 2)
 
 class T5Inference:
     """
@@ -32,14 +39,44 @@ class T5Inference:
             requests.Response: The HTTP response returned by the T5 model API.
 
         Raises:
-            requests.RequestException: If the HTTP request fails (not explicitly caught here).
+            InferenceError: If the T5 service rejects the sentence (HTTP 400).
+            CircuitOpenError: If the 't5' circuit breaker is open.
+            requests.RequestException: If the HTTP request fails or exceeds the
+                adaptive timeout (not explicitly caught here).
         """
-        response = requests.post(f"{T5_ENDPOINT}/transform-sentence-to-imr",
+        response = T5_BREAKER.call(requests.post, f"{T5_ENDPOINT}/transform-sentence-to-imr",
                           headers={'accept': 'application/json', 'Content-Type': 'application/json', 'User-Agent': 'Mozilla/5.0'},
-                          data=json.dumps({"sentence": sentence}))
+                          data=dumps({"sentence": sentence}))
+        if response.status_code == 400:
+            raise InferenceError.from_response(response)
         return response
 
 
+    def cache_namespace(self, environment):
+        """
+        Namespace under which results of this model and environment are cached.
+
+        Args:
+            environment (str): Execution environment indicator.
+
+        Returns:
+            str: e.g. 't5:prod'.
+        """
+        return f"t5:{normalize_environment(environment)}"
+
+    def admission_pool(self, environment):
+        """
+        Admission slot pool a generation waits in.
+
+        Args:
+            environment (str): Execution environment indicator.
+
+        Returns:
+            None: T5 requests take no LLaMA slot; the 't5' circuit breaker
+            bounds them.
+        """
+        return None
+
     def get_raw_output(self, response):
         """
         Extract the raw model output from the T5 API response.
@@ -73,9 +110,16 @@ class T5Inference:
             dict: The cleaned, structured IMR object ready for downstream use.
 
         Raises:
-            Exception: If parsing or transformation fails downstream.
+            InferenceError: If the output cannot be validated or adopted; carries
+                the raw output for the request log.
+            CircuitOpenError: If the tag or colour search is failing fast.
         """
-        result = validate_and_fix_yaml(raw_response)
-        result = adopt_generation(result)
+        with stage(YAML):
+            result = validate_and_fix_yaml(raw_response)
+        try:
+            with stage(ADOPT):
+                result = adopt_generation(result)
+        except AdoptFuncError as e:
+            raise InferenceError(error=e.message, raw_output=raw_response)
         return result
 
@@ -0,0 +1,371 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from dotenv import load_dotenv
+from loguru import logger
+from pymongo.errors import PyMongoError
+from adopt_generation import search_osm_tag
+from circuit_breaker import CircuitOpenError
+from request_log import expand_documents, now
+from serialization import json_default
+
+load_dotenv()
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ('1', 'true', 'yes')
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 60))
+WARMUP_SENTENCES = int(os.getenv("WARMUP_SENTENCES", 200))
+WARMUP_ENTITIES = int(os.getenv("WARMUP_ENTITIES", 200))
+WARMUP_LOOKBACK_DAYS = float(os.getenv("WARMUP_LOOKBACK_DAYS", 30))
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH")
+CACHE_SNAPSHOT_REUSE_SECONDS = float(os.getenv("CACHE_SNAPSHOT_REUSE_SECONDS", 300))
+LOCK_POLL_INTERVAL = 0.1
+
+SNAPSHOT_VERSION = 1
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+TIMED_OUT = 'timed_out'
+FAILED = 'failed'
+
+
+def save_snapshot(caches, path):
+    """
+    Write the live entries of several caches to one JSON file.
+
+    The file is written next to `path` and moved into place, so a crash
+    mid-write never leaves a truncated snapshot behind.
+
+    Args:
+        caches (Iterable[LRUCache]): Caches to export; their `name` is the key.
+        path (str): Snapshot file.
+
+    Returns:
+        int: Number of entries written.
+    """
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'savedAt': time.time(),
+        'caches': {cache.name: cache.snapshot() for cache in caches},
+    }
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(snapshot, file, default=json_default)
+    os.replace(temporary_path, path)
+    return sum(len(rows) for rows in snapshot['caches'].values())
+
+
+def load_snapshot(caches, path):
+    """
+    Restore caches from a file written by `save_snapshot`.
+
+    The time the service was down counts towards each entry's age, so
+    entries past their TTL are dropped. Caches missing from the file are
+    left untouched.
+
+    Args:
+        caches (Iterable[LRUCache]): Caches to fill, matched by `name`.
+        path (str): Snapshot file.
+
+    Returns:
+        int: Number of entries restored; 0 if the file does not exist or has
+        an unknown version.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r') as file:
+        snapshot = json.load(file)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return 0
+
+    downtime = max(0.0, time.time() - snapshot['savedAt'])
+    restored = 0
+    for cache in caches:
+        rows = snapshot['caches'].get(cache.name, [])
+        restored += cache.restore([namespace, key, value, age + downtime] for namespace, key, value, age in rows)
+    return restored
+
+
+def snapshot_age(path):
+    """
+    Seconds since a snapshot file was last written.
+
+    Args:
+        path (str): Snapshot file.
+
+    Returns:
+        float | None: The age, or None if the file does not exist.
+    """
+    try:
+        return max(0.0, time.time() - os.path.getmtime(path))
+    except OSError:
+        return None
+
+
+def try_lock(path):
+    """
+    Take an exclusive lock on a file without blocking.
+
+    The lock is shared by all processes on the host and released when the
+    returned file is closed or the process exits.
+
+    Args:
+        path (str): Lock file; created if missing.
+
+    Returns:
+        IO | None: The open lock file, or None if another process holds the lock.
+    """
+    file = open(path, 'a')
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+def frequent_results(collection, limit=WARMUP_SENTENCES, lookback_days=WARMUP_LOOKBACK_DAYS, max_time_ms=None,
+                     pipeline_versions=None):
+    """
+    Fetch the latest successful result of the most frequent recent requests.
+
+    Results are grouped by `pipelineVersion` as well, so each group's result
+    was produced by a single prompt and model.
+
+    Args:
+        collection (Collection): The request log.
+        limit (int): Maximum number of distinct requests.
+        lookback_days (float): Only requests newer than this are counted.
+        max_time_ms (int | None): Server-side time limit of the aggregation.
+        pipeline_versions (Iterable[str] | None): Only count requests logged
+            with one of these versions; None counts all.
+
+    Returns:
+        list[dict]: Expanded documents with 'inputSentence', 'modelVersion',
+        'environment', 'pipelineVersion', 'count', 'imr' and 'rawOutput',
+        most frequent first.
+    """
+    match = {'status': 'success', 'timestamp': {'$gte': now() - timedelta(days=lookback_days)}}
+    if pipeline_versions is not None:
+        match['pipelineVersion'] = {'$in': list(pipeline_versions)}
+    pipeline = [
+        {'$match': match},
+        {'$sort': {'timestamp': -1}},
+        {'$group': {
+            '_id': {'inputSentence': '$inputSentence', 'modelVersion': '$modelVersion',
+                    'environment': '$environment', 'pipelineVersion': '$pipelineVersion'},
+            'count': {'$sum': 1},
+            'imr': {'$first': '$imr'},
+            'imrId': {'$first': '$imrId'},
+            'rawOutput': {'$first': '$rawOutput'},
+            'rawOutputCodec': {'$first': '$rawOutputCodec'},
+        }},
+        {'$sort': {'count': -1}},
+        {'$limit': limit},
+    ]
+    options = {'maxTimeMS': max_time_ms} if max_time_ms is not None else {}
+    documents = []
+    for group in collection.aggregate(pipeline, allowDiskUse=True, **options):
+        document = {**group.pop('_id'), **{field: value for field, value in group.items() if value is not None}}
+        documents.append(document)
+    return expand_documents(documents)
+
+
+def frequent_entities(results, limit=WARMUP_ENTITIES):
+    """
+    Rank the entity names of logged IMRs by how often they were requested.
+
+    Args:
+        results (list[dict]): Documents from `frequent_results`.
+        limit (int): Maximum number of names.
+
+    Returns:
+        list[str]: Entity names, most frequent first.
+    """
+    counts = Counter()
+    for result in results:
+        imr = result.get('imr') or {}
+        for node in imr.get('nodes', []):
+            if node.get('name'):
+                counts[node['name']] += result.get('count', 1)
+    return [name for name, _ in counts.most_common(limit)]
+
+
+class CacheWarmup:
+    """
+    Startup stage that fills the caches before a worker reports ready.
+
+    It first restores the on-disk snapshot (if `CACHE_SNAPSHOT_PATH` is set),
+    then replays the most frequent successful requests of the request log
+    into the IMR cache and looks up their entity names so the tag cache is
+    hot. No model is called: logged results are reused as they are, but only
+    those logged with the current `pipelineVersion` (the IMR cache namespace,
+    which changes with the prompt and model), so a new prompt never serves
+    old results. The stage runs in a background thread and stops at
+    `WARMUP_TIMEOUT`; each query and lookup is limited to the remaining time.
+    A failing step is logged and never prevents the worker from serving.
+
+    With a snapshot path, the workers of one host take turns behind a lock
+    file next to the snapshot: the first one replays the request log and
+    writes the snapshot, the others wait for it and only restore it. A
+    snapshot younger than `CACHE_SNAPSHOT_REUSE_SECONDS` is reused rather than
+    rebuilt, and at shutdown only one worker rewrites it.
+
+    Attributes:
+        imr_cache (LRUCache): Cache of endpoint results.
+        snapshot_caches (list[LRUCache]): Caches saved and restored on disk.
+        namespace_for (Callable[[str, str], str | None]): Maps a logged model
+            and environment to the IMR cache namespace; None skips the entry.
+        pipeline_versions (list[str] | None): Current IMR cache namespaces;
+            only requests logged with one of them are counted.
+        status (str): 'pending', 'running', 'done', 'timed_out' or 'failed'.
+        replayed (bool): Whether this worker replayed the request log.
+    """
+    def __init__(self, imr_cache, snapshot_caches, namespace_for, pipeline_versions=None, timeout=WARMUP_TIMEOUT,
+                 snapshot_path=CACHE_SNAPSHOT_PATH):
+        self.imr_cache = imr_cache
+        self.snapshot_caches = snapshot_caches
+        self.namespace_for = namespace_for
+        self.pipeline_versions = pipeline_versions
+        self.timeout = timeout
+        self.snapshot_path = snapshot_path
+        self.status = PENDING
+        self.replayed = False
+        self.restored = 0
+        self.sentences = 0
+        self.entities = 0
+        self.duration = None
+        self._finished = threading.Event()
+
+    @property
+    def ready(self):
+        return self._finished.is_set()
+
+    def start(self, collection_factory):
+        """
+        Run the warm-up in a daemon thread, or mark it done when disabled.
+
+        Args:
+            collection_factory (Callable[[], Collection]): Returns the request log.
+        """
+        if not WARMUP_ENABLED:
+            self.status = DONE
+            self._finished.set()
+            return
+        threading.Thread(target=self.run, args=(collection_factory,), name="cache-warmup", daemon=True).start()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def run(self, collection_factory):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        self.status = RUNNING
+        lock = None
+        try:
+            if not self.snapshot_path:
+                self.status = DONE if self._replay(collection_factory(), deadline) else TIMED_OUT
+                return
+            lock = self._wait_for_lock(deadline)
+            age = snapshot_age(self.snapshot_path)
+            self.restored = load_snapshot(self.snapshot_caches, self.snapshot_path)
+            if lock is None:
+                self.status = TIMED_OUT
+            elif age is not None and age < CACHE_SNAPSHOT_REUSE_SECONDS:
+                self.status = DONE
+            else:
+                self.replayed = True
+                self.status = DONE if self._replay(collection_factory(), deadline) else TIMED_OUT
+                save_snapshot(self.snapshot_caches, self.snapshot_path)
+        except (PyMongoError, OSError, ValueError) as e:
+            self.status = FAILED
+            logger.warning(f"Cache warm-up failed: {e}")
+        finally:
+            if lock is not None:
+                lock.close()
+            self.duration = time.monotonic() - started
+            self._finished.set()
+            logger.info(f"Cache warm-up {self.status}: {self.stats()}")
+
+    def _lock_path(self):
+        return f"{self.snapshot_path}.lock"
+
+    def _wait_for_lock(self, deadline):
+        while True:
+            lock = try_lock(self._lock_path())
+            if lock is not None or time.monotonic() >= deadline:
+                return lock
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def _replay(self, collection, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        results = frequent_results(collection, max_time_ms=int(remaining * 1000),
+                                   pipeline_versions=self.pipeline_versions)
+        for result in results:
+            if time.monotonic() >= deadline:
+                return False
+            namespace = self.namespace_for(result.get('modelVersion'), result.get('environment'))
+            if namespace is None or result.get('imr') is None or result.get('pipelineVersion') != namespace:
+                continue
+            if self.imr_cache.get(namespace, result['inputSentence']) is None:
+                self.imr_cache.set(namespace, result['inputSentence'], (result.get('rawOutput'), result['imr']))
+            self.sentences += 1
+
+        for name in frequent_entities(results):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                search_osm_tag(name, timeout=remaining)
+            except CircuitOpenError:
+                return False
+            except Exception as e:
+                logger.warning(f"Cache warm-up could not look up '{name}': {e}")
+                continue
+            self.entities += 1
+        return True
+
+    def save(self):
+        """
+        Snapshot the caches to the snapshot path, if configured.
+
+        Skipped while another worker holds the lock or when a sibling wrote
+        the snapshot less than `CACHE_SNAPSHOT_REUSE_SECONDS` ago, so workers
+        stopping together write it once.
+
+        Returns:
+            int: Number of entries written (0 when skipped or disabled).
+        """
+        if not self.snapshot_path:
+            return 0
+        lock = None
+        try:
+            lock = try_lock(self._lock_path())
+            if lock is None:
+                return 0
+            age = snapshot_age(self.snapshot_path)
+            if age is not None and age < CACHE_SNAPSHOT_REUSE_SECONDS:
+                return 0
+            return save_snapshot(self.snapshot_caches, self.snapshot_path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Cache snapshot failed: {e}")
+            return 0
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def stats(self):
+        return {
+            'status': self.status,
+            'restored': self.restored,
+            'replayed': self.replayed,
+            'sentences': self.sentences,
+            'entities': self.entities,
+            'seconds': self.duration,
+        }
@@ -0,0 +1,194 @@
+from prompts import DOCUMENT_KEYS, HF_STOP_SEQUENCES, TOP_LEVEL_KEY
+from yaml_parser import validate_and_fix_yaml
+
+AREA = 'area'
+ENTITY = 'entity'
+RELATION = 'relation'
+
+LIST_SECTIONS = {'entities': ENTITY, 'relations': RELATION}
+DOCUMENT_TERMINATORS = ('---', '...', '```')
+
+
+def parse_block(text):
+    """
+    Parse one YAML fragment with the same fixes applied to full documents.
+
+    Args:
+        text (str): The fragment.
+
+    Returns:
+        Any: The parsed value, or None if it cannot be parsed.
+    """
+    # Fragments of a partial generation can trip any of the fixes, and a
+    # failed fragment must not fail the stream: the full document is
+    # parsed again once generation ends.
+    try:
+        return validate_and_fix_yaml(text)
+    except Exception:
+        return None
+
+
+class IncrementalYamlParser:
+    """
+    Parse generated YAML chunk by chunk, emitting each part as soon as it closes.
+
+    The model answers with an `area` mapping, an `entities` list and a
+    `relations` list. A part is closed once the next part starts: the area
+    when the next top-level key arrives, a list item when the next item of
+    the same list (or the next section) begins. Each closed part is parsed on
+    its own with `validate_and_fix_yaml`, so callers can act on early
+    entities while later tokens are still being generated.
+
+    Parsing stops at the first point `prompts.trim_to_yaml_document` would
+    cut: a stop sequence, a document terminator, an unknown top-level key
+    after the document started, or a repeated section. Parts that cannot be
+    parsed on their own are skipped and counted in `failed`; the complete
+    text remains available for a full parse.
+
+    Attributes:
+        area (dict | None): The area, once emitted.
+        entities (list[dict]): Entities emitted so far.
+        relations (list[dict]): Relations emitted so far.
+        failed (int): Parts that could not be parsed.
+        finished (bool): Whether the document is complete.
+    """
+    def __init__(self):
+        self.area = None
+        self.entities = []
+        self.relations = []
+        self.failed = 0
+        self.finished = False
+        self._pending = ''
+        self._section = None
+        self._seen_sections = set()
+        self._block = []
+        self._item_indent = None
+
+    def feed(self, chunk):
+        """
+        Consume the next piece of generated text.
+
+        Args:
+            chunk (str): Text in generation order; it may end mid-line.
+
+        Returns:
+            list[tuple[str, dict]]: `(kind, value)` events closed by this
+            chunk, where `kind` is 'area', 'entity' or 'relation'.
+        """
+        if self.finished:
+            return []
+        self._pending += chunk
+        *lines, self._pending = self._pending.split('\n')
+        events = []
+        for line in lines:
+            events.extend(self._line(line))
+            if self.finished:
+                return events
+        if self._starts_next_part(self._pending):
+            events.extend(self._close_block())
+        return events
+
+    def close(self):
+        """
+        Signal the end of generation and emit the last open part.
+
+        Returns:
+            list[tuple[str, dict]]: The remaining events.
+        """
+        events = []
+        if not self.finished and self._pending:
+            events.extend(self._line(self._pending))
+        self._pending = ''
+        if not self.finished:
+            events.extend(self._finish())
+        return events
+
+    def _starts_next_part(self, partial):
+        """
+        Whether an incomplete line already shows that the open part is over:
+        it begins the next item of the current list or a new section.
+        """
+        if not self._block or not partial:
+            return False
+        if partial[0] not in (' ', '\t', '-', '#'):
+            match = TOP_LEVEL_KEY.match(partial)
+            return match is not None and match.group(1) in DOCUMENT_KEYS
+        if self._section not in LIST_SECTIONS:
+            return False
+        indent = len(partial) - len(partial.lstrip())
+        return partial.lstrip().startswith('-') and indent <= self._item_indent
+
+    def _line(self, line):
+        for stop in HF_STOP_SEQUENCES:
+            if stop.startswith('\n'):
+                # Lines arrive without their newline: match at the line start
+                # once an earlier line exists.
+                index = 0 if self._section is not None and line.startswith(stop[1:]) else -1
+            else:
+                index = line.find(stop)
+            if index != -1:
+                events = self._line(line[:index]) if line[:index].strip() else []
+                return events + self._finish()
+
+        stripped = line.strip()
+        if self._section is not None and stripped in DOCUMENT_TERMINATORS:
+            return self._finish()
+
+        if line and line[0] not in (' ', '\t', '-', '#'):
+            match = TOP_LEVEL_KEY.match(line)
+            if match is None or match.group(1) not in DOCUMENT_KEYS:
+                return self._finish() if self._section is not None else []
+            key = match.group(1)
+            if key in self._seen_sections:
+                return self._finish()
+            events = self._close_block()
+            self._section = key
+            self._seen_sections.add(key)
+            self._item_indent = None
+            if key == AREA:
+                self._block = [line]
+            return events
+
+        if self._section is None:
+            return []
+        if self._section == AREA:
+            self._block.append(line)
+            return []
+
+        indent = len(line) - len(line.lstrip())
+        if stripped.startswith('-') and (self._item_indent is None or indent <= self._item_indent):
+            events = self._close_block()
+            self._item_indent = indent
+            self._block = [line]
+            return events
+        if self._block:
+            self._block.append(line)
+        return []
+
+    def _close_block(self):
+        block, self._block = self._block, []
+        if not block or self._section is None:
+            return []
+
+        if self._section == AREA:
+            parsed = parse_block('\n'.join(block))
+            area = parsed.get(AREA) if isinstance(parsed, dict) else None
+            if not isinstance(area, dict):
+                self.failed += 1
+                return []
+            self.area = area
+            return [(AREA, area)]
+
+        parsed = parse_block(f"{self._section}:\n" + '\n'.join(block))
+        items = parsed.get(self._section) if isinstance(parsed, dict) else None
+        if not isinstance(items, list) or len(items) != 1 or not isinstance(items[0], dict):
+            self.failed += 1
+            return []
+        kind = LIST_SECTIONS[self._section]
+        (self.entities if kind == ENTITY else self.relations).append(items[0])
+        return [(kind, items[0])]
+
+    def _finish(self):
+        events = self._close_block()
+        self.finished = True
+        return events
@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from errors import InferenceError
+
+"""
+Benchmark for the upstream-400 handling path.
+
+Compares the former approach (rewrite quotes/None with `str.replace`, then
+`json.loads`) with `InferenceError.from_response` on three bodies:
+  - 'plain': a repr message whose fields contain no quotes at all (both succeed;
+    the real prompt contains double quotes, so the legacy path fails on it),
+  - 'apostrophe': the same with an apostrophe in the sentence,
+  - 'json': the message sent as a JSON object, which needs no parsing at all.
+
+To execute:
+    python benchmarks/bench_error_envelope.py
+"""
+
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'zero_shot_cot_prompt.txt')
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+def legacy_parse(response):
+    error_response = response.json()
+    error_message = error_response.get('message', '')
+    cleaned_message = error_message.replace('\'', '\"').replace('None', 'null')
+    cleaned_message = cleaned_message.replace('\\n', '\\\\n')
+    return json.loads(cleaned_message)
+
+
+def build_body(sentence):
+    with open(PROMPT_PATH) as file:
+        prompt = file.read().replace("'", "").replace('"', '')
+    return {'message': repr({
+        'timestamp': '2024-05-01 10:00:00',
+        'inputSentence': sentence,
+        'imr': None,
+        'rawOutput': "area:\n  type: area\n  value: bonn\nentities:\n - name: kiosk\n   id: 0\n   type: nwr",
+        'error': 'Error in Adopt Generation: name',
+        'modelVersion': 'llama',
+        'prompt': prompt,
+    })}
+
+
+def run(label, func, response, number=2000):
+    try:
+        func(response)
+    except (ValueError, AttributeError) as e:
+        print(f"{label:<28} fails: {type(e).__name__}")
+        return
+    seconds = timeit.timeit(lambda: func(response), number=number)
+    print(f"{label:<28} {seconds / number * 1e6:8.1f} us/call")
+
+
+if __name__ == '__main__':
+    plain = FakeResponse(build_body("find all bars in bonn"))
+    apostrophe = FakeResponse(build_body("find st. mary's church in bonn"))
+
+    structured = FakeResponse({'message': {'inputSentence': "find st. mary's church", 'error': 'bad yaml'}})
+
+    for name, response in (('plain', plain), ('apostrophe', apostrophe), ('json', structured)):
+        run(f"legacy replace+json ({name})", legacy_parse, response)
+        run(f"InferenceError ({name})", InferenceError.from_response, response)
@@ -0,0 +1,88 @@
+import copy
+import gc
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from imr_encoding import to_leaves, with_fields
+
+"""
+Memory benchmark for filter leaves in colour-expanded IMRs.
+
+Builds the filters of many concurrent requests the way `build_filters`
+expands a colour property (every colour value times every colour key) and
+keeps them alive, as in-flight requests and cached IMRs do. Compares the
+previous representation (a deep-copied tag result and a dict per leaf,
+`item.copy()` then assignment)
+with shared, slotted `FilterLeaf` objects (`to_leaves` + `with_fields`).
+
+To execute:
+    python benchmarks/bench_filter_leaves.py
+"""
+
+COLOUR_KEYS = ('colour', 'building:colour', 'roof:colour')
+COLOURS = [f'#{index:06x}' for index in range(0, 0xffffff, 0xffffff // 24)][:24]
+SEARCH_RESULT = [{'imr': [{'or': [{'key': key, 'operator': '=', 'value': '***example***'} for key in COLOUR_KEYS]}]}]
+
+
+def expand_dicts(requests, nodes):
+    results = []
+    for _ in range(requests):
+        imr = []
+        for _ in range(nodes):
+            template = copy.deepcopy(SEARCH_RESULT)[0]['imr'][0]['or']
+            expanded = []
+            for colour in COLOURS:
+                for item in template:
+                    new_item = item.copy()
+                    new_item['operator'] = '='
+                    new_item['value'] = colour
+                    expanded.append(new_item)
+            imr.append({'or': expanded})
+        results.append(imr)
+    return results
+
+
+def expand_leaves(requests, nodes):
+    results = []
+    for _ in range(requests):
+        imr = []
+        for _ in range(nodes):
+            template = to_leaves(SEARCH_RESULT)[0]['imr'][0]['or']
+            expanded = []
+            for colour in COLOURS:
+                for item in template:
+                    expanded.append(with_fields(item, operator='=', value=colour))
+            imr.append({'or': expanded})
+        results.append(imr)
+    return results
+
+
+def measure(label, func, requests=500, nodes=4):
+    gc.collect()
+    tracemalloc.start()
+    results = func(requests, nodes)
+    current, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    tracemalloc.stop()
+    leaves = requests * nodes * len(COLOURS) * len(COLOUR_KEYS)
+    print(f"{label:<10} {current / 1024 / 1024:8.2f} MiB retained  {peak / 1024 / 1024:8.2f} MiB peak  "
+          f"{blocks:9d} blocks  {current / leaves:6.1f} B/leaf")
+    del results
+
+
+def main():
+    print(f"{len(COLOURS)} colours x {len(COLOUR_KEYS)} keys per node, 4 nodes per request, 500 requests kept alive")
+    measure('dicts', expand_dicts)
+    measure('leaves', expand_leaves)
+
+    for label, func in (('dicts', expand_dicts), ('leaves', expand_leaves)):
+        seconds = timeit.timeit(lambda: func(50, 4), number=10)
+        print(f"{label:<10} {seconds / 10 * 1e3:8.2f} ms per 50 requests")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Dict, Optional
+
+from serialization import USE_ORJSON, FastJSONResponse, dumps
+
+"""
+Benchmark for response and upstream-body serialization on large IMRs.
+
+Compares FastAPI's default path for the `/transform-sentence-to-imr` result
+(validate against the `Response` model, `jsonable_encoder`, `json.dumps`)
+with the direct path (`FastJSONResponse`, orjson when installed), and the
+`requests`-style `json.dumps` body with a pre-serialized `dumps` body.
+
+To execute:
+    python benchmarks/bench_serialization.py
+"""
+
+
+class Response(BaseModel):
+    timestamp: str
+    imr: Dict
+    inputSentence: str
+    status: str
+    rawOutput: object
+    modelVersion: str
+    error: Optional[str] = None
+    prompt: Optional[str] = None
+
+
+COLOUR_KEYS = ('colour', 'building:colour', 'roof:colour')
+
+
+def build_imr(nodes=4, colours=20):
+    """
+    Build an IMR shaped like a colour-expanded result: every node has an
+    entity block and a colour property expanded over `colours` values.
+    """
+    imr_nodes = []
+    for node_id in range(nodes):
+        colour_leaves = [
+            {'key': key, 'operator': '=', 'value': f'#{node_id:02x}{index:04x}'}
+            for index in range(colours) for key in COLOUR_KEYS
+        ]
+        imr_nodes.append({
+            'id': node_id,
+            'type': 'nwr',
+            'filters': [{'and': [
+                {'or': [{'key': 'building', 'operator': '=', 'value': value}
+                        for value in ('house', 'terrace', 'detached')]},
+                {'or': colour_leaves},
+            ]}],
+            'name': 'house',
+            'display_name': 'houses',
+        })
+    edges = [{'source': i, 'target': i + 1, 'type': 'distance', 'value': '100 m'} for i in range(nodes - 1)]
+    return {'area': {'type': 'area', 'value': 'bonn'}, 'nodes': imr_nodes, 'edges': edges}
+
+
+def default_path(result):
+    validated = Response(**result)
+    return JSONResponse(content=jsonable_encoder(validated)).body
+
+
+def direct_path(result):
+    return FastJSONResponse(content={field: result.get(field) for field in Response.__fields__}).body
+
+
+def run(label, func, arg, number=500):
+    seconds = timeit.timeit(lambda: func(arg), number=number)
+    print(f"{label:<34} {seconds / number * 1e6:9.1f} us/call")
+
+
+if __name__ == '__main__':
+    print(f"orjson in use: {USE_ORJSON}")
+    for colours in (5, 20, 60):
+        imr = build_imr(colours=colours)
+        result = {
+            'timestamp': '2024-05-01 10:00:00', 'imr': imr, 'inputSentence': 'find houses with a green door',
+            'status': 'success', 'rawOutput': 'area:\n  type: bbox\n' * 10, 'modelVersion': 'llama',
+            'username': 'kid-test',
+        }
+        print(f"--- {colours} colours, {len(direct_path(result))} bytes ---")
+        run("response: validate+encoder+json", default_path, result)
+        run("response: direct", direct_path, result)
+
+    payload = {'inputs': 'find houses with a green door', 'prompt': 'x' * 2300, 'max_new_tokens': 352,
+               'top_p': 0.1, 'temperature': 0.001, 'stop': ['</s>']}
+    print("--- upstream request body ---")
+    run("body: json.dumps", lambda p: json.dumps(p).encode('utf-8'), payload, number=20000)
+    run("body: dumps", dumps, payload, number=20000)
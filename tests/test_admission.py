@@ -0,0 +1,174 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+os.environ.setdefault('PROMPT_FILE', os.path.join(DATA_PATH, 'zero_shot_cot_prompt.txt'))
+os.environ.setdefault('PROMPT_FILE_DEV', os.path.join(DATA_PATH, 'zero_shot_llama_prompt_dev.txt'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from admission import (AdmissionController, AdmissionRejectedError, PRIORITY_CLASSES, SlotPool, generation_slots,
+                       priority_of)
+
+"""
+Unit tests for rate limiting and priority scheduling in admission.py.
+
+To execute:
+    python -m unittest tests.test_admission
+"""
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_burst_then_rejected(self):
+        controller = AdmissionController(user_rate=1, user_burst=2)
+        with mock.patch('admission.time.monotonic', return_value=100.0):
+            controller.check_rate('alice', 'prod')
+            controller.check_rate('alice', 'production')
+            with self.assertRaises(AdmissionRejectedError) as context:
+                controller.check_rate('alice', 'prod')
+        self.assertTrue(context.exception.rate_limited)
+        self.assertEqual(context.exception.retry_after, 1.0)
+        self.assertEqual(controller.stats()['rateLimited'], 1)
+
+    def test_buckets_are_per_user_and_environment(self):
+        controller = AdmissionController(user_rate=1, user_burst=1)
+        with mock.patch('admission.time.monotonic', return_value=100.0):
+            controller.check_rate('alice', 'prod')
+            controller.check_rate('alice', 'dev')
+            controller.check_rate('bob', 'prod')
+
+    def test_tokens_refill(self):
+        controller = AdmissionController(user_rate=2, user_burst=1)
+        with mock.patch('admission.time.monotonic', return_value=100.0):
+            controller.check_rate('alice', 'prod')
+        with mock.patch('admission.time.monotonic', return_value=100.5):
+            controller.check_rate('alice', 'prod')
+
+    def test_zero_rate_disables_limit(self):
+        controller = AdmissionController(user_rate=0)
+        for _ in range(100):
+            controller.check_rate('alice', 'prod')
+
+
+class TestPriorityQueue(unittest.TestCase):
+    def test_priority_classes(self):
+        self.assertEqual(PRIORITY_CLASSES[priority_of('production')], 'prod-interactive')
+        self.assertEqual(PRIORITY_CLASSES[priority_of('development')], 'dev-interactive')
+        self.assertEqual(PRIORITY_CLASSES[priority_of('prod', batch=True)], 'prod-batch')
+        self.assertLess(priority_of('dev'), priority_of('prod', batch=True))
+
+    def test_waiters_are_admitted_by_priority(self):
+        controller = SlotPool('llama-prod', max_active=1, queue_size=10)
+        controller.acquire(0, timeout=1)
+        order = []
+
+        def request(priority):
+            controller.acquire(priority, timeout=5)
+            order.append(priority)
+            controller.release()
+
+        threads = []
+        for priority in (3, 2, 0):
+            thread = threading.Thread(target=request, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: sum(controller.stats()['queued'].values()) == len(threads))
+
+        controller.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, [0, 2, 3])
+        self.assertEqual(controller.stats()['active'], 0)
+
+    def test_full_queue_sheds_lowest_priority(self):
+        controller = SlotPool('llama-prod', max_active=1, queue_size=1)
+        controller.acquire(0, timeout=1)
+        outcome = {}
+
+        def batch_request():
+            try:
+                controller.acquire(3, timeout=5)
+                outcome['batch'] = 'admitted'
+            except AdmissionRejectedError:
+                outcome['batch'] = 'shed'
+
+        thread = threading.Thread(target=batch_request)
+        thread.start()
+        wait_until(lambda: controller.stats()['queued']['dev-batch'] == 1)
+
+        with self.assertRaises(AdmissionRejectedError):
+            controller.acquire(3, timeout=1)
+
+        interactive = threading.Thread(target=controller.acquire, args=(0, 5))
+        interactive.start()
+        thread.join(5)
+        self.assertEqual(outcome['batch'], 'shed')
+        self.assertEqual(controller.stats()['shed']['dev-batch'], 2)
+
+        controller.release()
+        interactive.join(5)
+        self.assertEqual(controller.stats()['admitted']['prod-interactive'], 2)
+
+    def test_queue_timeout_sheds(self):
+        controller = AdmissionController({'llama-prod': 1}, queue_size=4)
+        pool = controller.pools['llama-prod']
+        with controller.slot('llama-prod', 'prod'):
+            with self.assertRaises(AdmissionRejectedError) as context:
+                pool.acquire(0, timeout=0.05)
+        self.assertFalse(context.exception.rate_limited)
+        self.assertEqual(controller.stats()['pools']['llama-prod']['queued']['prod-interactive'], 0)
+        self.assertEqual(pool.stats()['active'], 0)
+
+    def test_slots_are_capped_at_endpoint_concurrency(self):
+        self.assertEqual(generation_slots(20, configured=None), 20)
+        self.assertEqual(generation_slots(20, configured=64), 20)
+        self.assertEqual(generation_slots(20, configured=8), 8)
+        self.assertEqual(generation_slots(20, configured=0), 0)
+
+    def test_max_blocked(self):
+        controller = AdmissionController({'llama-prod': 16, 'llama-dev': 4, 'off': 0}, queue_size=64)
+        self.assertEqual(controller.max_blocked, 80 + 68)
+
+
+class TestEndpointPools(unittest.TestCase):
+    def test_dev_saturation_does_not_delay_prod(self):
+        controller = AdmissionController({'llama-prod': 1, 'llama-dev': 1}, queue_size=4)
+        dev = controller.pools['llama-dev']
+        dev.acquire(priority_of('dev'), timeout=1)
+        waiters = [threading.Thread(target=dev.acquire, args=(priority_of('dev', batch=True), 5)) for _ in range(3)]
+        for thread in waiters:
+            thread.start()
+        wait_until(lambda: dev.stats()['queued']['dev-batch'] == 3)
+
+        started = time.monotonic()
+        with controller.slot('llama-prod', 'prod'):
+            self.assertLess(time.monotonic() - started, 0.5)
+            self.assertEqual(controller.stats()['pools']['llama-prod']['active'], 1)
+
+        for _ in range(4):
+            dev.release()
+        for thread in waiters:
+            thread.join(5)
+        self.assertEqual(dev.stats()['admitted']['dev-batch'], 3)
+
+    def test_requests_without_a_pool_take_no_slot(self):
+        controller = AdmissionController({'llama-prod': 1}, queue_size=0)
+        with controller.slot('llama-prod', 'prod'):
+            with controller.slot(None, 'prod'):
+                pass
+        self.assertEqual(controller.stats()['pools']['llama-prod']['active'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from cache import LRUCache, SQLiteTier
+
+"""
+Unit tests for the in-process LRU cache in cache.py.
+
+To execute:
+    python -m unittest tests.test_cache
+"""
+
+
+class TestLRUCache(unittest.TestCase):
+    """
+    Test suite for namespacing, eviction and expiry.
+    """
+
+    def test_namespaces_are_isolated(self):
+        cache = LRUCache('test', maxsize=10)
+        cache.set('llama:prod', 'find bars', 'prod-result')
+        self.assertEqual(cache.get('llama:prod', 'find bars'), 'prod-result')
+        self.assertIsNone(cache.get('llama:dev', 'find bars'))
+        self.assertEqual(cache.stats()['namespaces'], {'llama:prod': 1})
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache('test', maxsize=2)
+        cache.set('ns', 'a', 1)
+        cache.set('ns', 'b', 2)
+        cache.get('ns', 'a')
+        cache.set('ns', 'c', 3)
+        self.assertEqual(cache.get('ns', 'a'), 1)
+        self.assertIsNone(cache.get('ns', 'b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        cache = LRUCache('test', maxsize=2, ttl=10)
+        with mock.patch('cache.time.monotonic', return_value=100.0):
+            cache.set('ns', 'a', 1)
+        with mock.patch('cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get('ns', 'a'))
+
+    def test_counters_are_exact_under_concurrency(self):
+        cache = LRUCache('test', maxsize=4)
+        cache.set('ns', 'a', 1)
+
+        def lookups():
+            for _ in range(2000):
+                cache.get('ns', 'a')
+                cache.get('ns', 'missing')
+
+        threads = [threading.Thread(target=lookups) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((cache.hits, cache.misses), (8000, 8000))
+
+    def test_zero_size_disables_cache(self):
+        cache = LRUCache('test', maxsize=0)
+        cache.set('ns', 'a', 1)
+        self.assertIsNone(cache.get('ns', 'a'))
+
+    def test_snapshot_restore_keeps_age(self):
+        cache = LRUCache('test', maxsize=4, ttl=10)
+        with mock.patch('cache.time.monotonic', return_value=100.0):
+            cache.set('ns', 'a', 1)
+        with mock.patch('cache.time.monotonic', return_value=106.0):
+            cache.set('ns', 'b', 2)
+            rows = cache.snapshot()
+        self.assertEqual(rows, [['ns', 'a', 1, 6.0], ['ns', 'b', 2, 0.0]])
+
+        restored = LRUCache('test', maxsize=4, ttl=10)
+        with mock.patch('cache.time.monotonic', return_value=500.0):
+            self.assertEqual(restored.restore(rows + [['ns', 'old', 3, 11.0]]), 2)
+        with mock.patch('cache.time.monotonic', return_value=505.0):
+            self.assertIsNone(restored.get('ns', 'a'))
+            self.assertEqual(restored.get('ns', 'b'), 2)
+
+
+class TestSharedTier(unittest.TestCase):
+    """
+    Test suite for the file-backed shared tier behind the LRU cache.
+    """
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_entries_are_visible_to_other_caches(self):
+        writer = LRUCache('imr', maxsize=10, shared=SQLiteTier(self.path))
+        reader = LRUCache('imr', maxsize=10, shared=SQLiteTier(self.path))
+        writer.set('llama:prod', 'find bars', ('raw', {'nodes': []}))
+
+        self.assertEqual(reader.get('llama:prod', 'find bars'), ['raw', {'nodes': []}])
+        self.assertEqual(reader.shared_hits, 1)
+        reader.get('llama:prod', 'find bars')
+        self.assertEqual(reader.hits, 1)
+
+    def test_shared_entries_expire(self):
+        tier = SQLiteTier(self.path)
+        with mock.patch('cache.time.time', return_value=100.0):
+            tier.set('key', 'value', ttl=10)
+        with mock.patch('cache.time.time', return_value=111.0):
+            self.assertIsNone(tier.get('key'))
+
+    def test_prune_deletes_expired_and_oldest_rows(self):
+        tier = SQLiteTier(self.path, max_rows=2, prune_interval=3600)
+        with mock.patch('cache.time.time', return_value=100.0):
+            tier.set('expired', 'value', ttl=10)
+            for key in ('a', 'b', 'c'):
+                tier.set(key, key)
+        with mock.patch('cache.time.time', return_value=111.0):
+            self.assertEqual(tier.prune(), 2)
+        count = tier._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.assertEqual(count, 2)
+        self.assertIsNone(tier.get('a'))
+        self.assertEqual(tier.get('c'), 'c')
+
+    def test_writes_prune_periodically(self):
+        tier = SQLiteTier(self.path, max_rows=1, prune_interval=0)
+        tier.set('a', 1)
+        tier.set('b', 2)
+        self.assertIsNone(tier.get('a'))
+        self.assertEqual(tier.get('b'), 2)
+
+    def test_shared_errors_are_misses(self):
+        broken = mock.Mock()
+        broken.get.side_effect = ConnectionError('down')
+        cache = LRUCache('imr', maxsize=10, shared=broken)
+        self.assertIsNone(cache.get('ns', 'key'))
+        self.assertEqual(cache.shared_errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
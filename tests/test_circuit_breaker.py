@@ -0,0 +1,117 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN, MIN_LATENCY_SAMPLES
+
+"""
+Unit tests for the upstream circuit breaker in circuit_breaker.py.
+
+To execute:
+    python -m unittest tests.test_circuit_breaker
+"""
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    Test suite for breaker state transitions and adaptive timeouts.
+    """
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            breaker.call(lambda timeout: FakeResponse(503))
+        self.assertEqual(breaker.state, OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda timeout: FakeResponse(200))
+
+    def test_request_exceptions_count_as_failures(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=60)
+
+        def failing(timeout):
+            raise requests.ConnectionError("refused")
+
+        with self.assertRaises(requests.ConnectionError):
+            breaker.call(failing)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_trial_closes_circuit(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+        with mock.patch('circuit_breaker.time.monotonic', return_value=100.0):
+            breaker.call(lambda timeout: FakeResponse(500))
+        with mock.patch('circuit_breaker.time.monotonic', return_value=111.0):
+            self.assertEqual(breaker.state, HALF_OPEN)
+            breaker.call(lambda timeout: FakeResponse(200))
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_client_errors_do_not_trip(self):
+        breaker = CircuitBreaker('test', failure_threshold=1)
+        breaker.call(lambda timeout: FakeResponse(400))
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_adaptive_timeout_is_clamped(self):
+        breaker = CircuitBreaker('test', initial_timeout=10.0, min_timeout=1.0, max_timeout=5.0)
+        self.assertEqual(breaker.timeout(), 10.0)
+
+        for _ in range(MIN_LATENCY_SAMPLES):
+            breaker.record_success(0.1)
+        self.assertEqual(breaker.timeout(), 1.0)
+
+        for _ in range(MIN_LATENCY_SAMPLES):
+            breaker.record_success(30.0)
+        self.assertEqual(breaker.timeout(), 5.0)
+
+    def test_timeouts_raise_adaptive_timeout(self):
+        breaker = CircuitBreaker('test', initial_timeout=10.0, min_timeout=1.0, max_timeout=60.0,
+                                 failure_threshold=1000)
+        for _ in range(MIN_LATENCY_SAMPLES):
+            breaker.record_success(1.0)
+        self.assertEqual(breaker.timeout(), 2.0)
+
+        def slow(timeout):
+            raise requests.ReadTimeout("slow")
+
+        with mock.patch('circuit_breaker.time.monotonic', side_effect=[0.0, 2.0] * MIN_LATENCY_SAMPLES):
+            for _ in range(MIN_LATENCY_SAMPLES):
+                with self.assertRaises(requests.ReadTimeout):
+                    breaker.call(slow)
+        self.assertEqual(breaker.timeout(), 4.0)
+
+    def test_half_open_trial_uses_max_timeout(self):
+        breaker = CircuitBreaker('test', min_timeout=1.0, max_timeout=60.0, failure_threshold=1, reset_timeout=10)
+        for _ in range(MIN_LATENCY_SAMPLES):
+            breaker.record_success(0.1)
+        with mock.patch('circuit_breaker.time.monotonic', return_value=100.0):
+            breaker.call(lambda timeout: FakeResponse(500))
+        timeouts = []
+        with mock.patch('circuit_breaker.time.monotonic', return_value=111.0):
+            breaker.call(lambda timeout: timeouts.append(timeout) or FakeResponse(200))
+        self.assertEqual(timeouts[0][1], 60.0)
+
+    def test_unexpected_error_releases_half_open_trial(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+        with mock.patch('circuit_breaker.time.monotonic', return_value=100.0):
+            breaker.call(lambda timeout: FakeResponse(500))
+        with mock.patch('circuit_breaker.time.monotonic', return_value=111.0):
+            def broken(timeout):
+                raise ValueError("bad payload")
+
+            with self.assertRaises(ValueError):
+                breaker.call(broken)
+            breaker.call(lambda timeout: FakeResponse(200))
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
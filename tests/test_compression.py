@@ -0,0 +1,89 @@
+import copy
+import gzip
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from compression import compress, negotiate_encoding
+from imr_encoding import compact_imr, expand_filters
+
+"""
+Unit tests for response compression negotiation and the compact IMR encoding.
+
+To execute:
+    python -m unittest tests.test_compression
+"""
+
+IMR = {
+    'area': {'type': 'area', 'value': 'bonn'},
+    'nodes': [
+        {
+            'id': 0,
+            'name': 'bar',
+            'type': 'nwr',
+            'filters': [{'and': [
+                {'or': [
+                    {'key': 'amenity', 'operator': '=', 'value': 'bar'},
+                    {'key': 'amenity', 'operator': '=', 'value': 'pub'},
+                ]},
+                {'key': 'name', 'operator': '~', 'value': 'trink'},
+            ]}],
+        },
+        {'id': 1, 'name': 'kiosk', 'type': 'cluster'},
+    ],
+    'edges': [{'source': 0, 'target': 1, 'type': 'dist', 'value': '200 m'}],
+}
+
+
+class TestNegotiateEncoding(unittest.TestCase):
+    def test_missing_header_means_identity(self):
+        self.assertIsNone(negotiate_encoding(None, ('br', 'gzip')))
+        self.assertIsNone(negotiate_encoding('', ('br', 'gzip')))
+
+    def test_server_preference_breaks_ties(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate, br', ('br', 'gzip')), 'br')
+        self.assertEqual(negotiate_encoding('gzip, deflate, br', ('gzip',)), 'gzip')
+
+    def test_client_q_values_win(self):
+        self.assertEqual(negotiate_encoding('gzip, br;q=0.5', ('br', 'gzip')), 'gzip')
+
+    def test_q_zero_excludes_coding(self):
+        self.assertIsNone(negotiate_encoding('gzip;q=0', ('gzip',)))
+        self.assertEqual(negotiate_encoding('*, br;q=0', ('br', 'gzip')), 'gzip')
+
+    def test_unsupported_codings_are_ignored(self):
+        self.assertIsNone(negotiate_encoding('deflate, identity', ('br', 'gzip')))
+
+    def test_gzip_round_trip(self):
+        body = b'{"imr": {}}' * 100
+        self.assertEqual(gzip.decompress(compress(body, 'gzip')), body)
+
+
+class TestCompactImr(unittest.TestCase):
+    def test_leaves_become_triples(self):
+        compact = compact_imr(IMR)
+        self.assertEqual(compact['nodes'][0]['filters'], [{'and': [
+            {'or': [['amenity', '=', 'bar'], ['amenity', '=', 'pub']]},
+            ['name', '~', 'trink'],
+        ]}])
+        self.assertEqual(compact['edges'], IMR['edges'])
+        self.assertNotIn('filters', compact['nodes'][1])
+
+    def test_round_trip(self):
+        compact = compact_imr(IMR)
+        self.assertEqual(expand_filters(compact['nodes'][0]['filters']), IMR['nodes'][0]['filters'])
+
+    def test_input_is_not_modified(self):
+        original = copy.deepcopy(IMR)
+        compact_imr(IMR)
+        self.assertEqual(IMR, original)
+
+    def test_non_imr_values_pass_through(self):
+        self.assertIsNone(compact_imr(None))
+        self.assertEqual(compact_imr({'area': {}}), {'area': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+os.environ.setdefault('PROMPT_FILE', os.path.join(DATA_PATH, 'zero_shot_cot_prompt.txt'))
+os.environ.setdefault('PROMPT_FILE_DEV', os.path.join(DATA_PATH, 'zero_shot_llama_prompt_dev.txt'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from adopt_generation import AdoptFuncError
+from errors import InferenceError, parse_error_message
+from llama_inference import LlamaInference
+from t5_inference import T5Inference
+
+"""
+Unit tests for the structured backend error in errors.py.
+
+To execute:
+    python -m unittest tests.test_errors
+"""
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+DETAILS = {
+    'timestamp': '2024-05-01 10:00:00',
+    'inputSentence': "find st. mary's church and the \"old\" mill",
+    'imr': None,
+    'rawOutput': "area:\n  type: area\n  value: o'fallon\nentities:\n - name: \"mill\"",
+    'error': "Error in Adopt Generation: 'name'",
+    'modelVersion': 'llama',
+    'prompt': "Say 'hi'\nthen stop",
+}
+
+
+class TestInferenceError(unittest.TestCase):
+    """
+    Test suite for parsing upstream error bodies with quotes and newlines.
+    """
+
+    def assert_details(self, error):
+        self.assertEqual(error.input_sentence, DETAILS['inputSentence'])
+        self.assertEqual(error.raw_output, DETAILS['rawOutput'])
+        self.assertEqual(error.error, DETAILS['error'])
+        self.assertEqual(error.prompt, DETAILS['prompt'])
+        self.assertIsNone(error.imr)
+
+    def test_python_repr_message(self):
+        body = {'message': repr(DETAILS)}
+        error = InferenceError.from_response(FakeResponse(body))
+        self.assert_details(error)
+        self.assertEqual(error.detail, body)
+
+    def test_json_string_message(self):
+        error = InferenceError.from_response(FakeResponse({'message': json.dumps(DETAILS)}))
+        self.assert_details(error)
+
+    def test_dict_message(self):
+        error = InferenceError.from_response(FakeResponse({'message': DETAILS}))
+        self.assert_details(error)
+
+    def test_unparsable_message_is_kept_verbatim(self):
+        error = InferenceError.from_response(FakeResponse({'message': "model's output was empty"}))
+        self.assertEqual(error.error, "model's output was empty")
+        self.assertIsNone(parse_error_message("model's output was empty"))
+
+    def test_document_falls_back_to_request_fields(self):
+        error = InferenceError(error='bad yaml', raw_output='area: [')
+        document = error.to_document('find bars', 't5', 'kid-test')
+        self.assertEqual(document, {
+            'inputSentence': 'find bars',
+            'imr': None,
+            'rawOutput': 'area: [',
+            'status': 'error',
+            'error': 'bad yaml',
+            'modelVersion': 't5',
+            'prompt': None,
+            'username': 'kid-test',
+        })
+
+
+class TestAdoptErrors(unittest.TestCase):
+    def test_adopt_failures_carry_the_raw_output(self):
+        raw_output = "area:\n  type: bbox\nentities:\n - name: bar"
+        for inference, module in ((LlamaInference(), 'llama_inference'), (T5Inference(), 't5_inference')):
+            with mock.patch(f'{module}.adopt_generation', side_effect=AdoptFuncError("no tag for 'bar'")):
+                with self.assertRaises(InferenceError) as context:
+                    inference.adopt(raw_output)
+            self.assertEqual(context.exception.error, "no tag for 'bar'")
+            self.assertEqual(context.exception.raw_output, raw_output)
+
+
+if __name__ == '__main__':
+    unittest.main()
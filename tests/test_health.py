@@ -0,0 +1,123 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pymongo
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from health import FAILED, OK, SKIPPED, DependencyCheck, HealthChecks, executor_stats, http_probe, mongo_probe
+
+"""
+Unit tests for the cached dependency checks in health.py.
+
+To execute:
+    python -m unittest tests.test_health
+"""
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class CountingProbe:
+    def __init__(self, error=None, delay=0.0):
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, timeout):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+
+class TestHealthChecks(unittest.TestCase):
+    def test_results_are_cached(self):
+        probe = CountingProbe()
+        checks = HealthChecks([DependencyCheck('mongo', probe, ttl=60)], timeout=1)
+        self.assertEqual(checks.report()[1]['mongo']['status'], OK)
+        healthy, results = checks.report()
+        self.assertTrue(healthy)
+        self.assertEqual(probe.calls, 1)
+
+    def test_required_failure_makes_unhealthy(self):
+        checks = HealthChecks([
+            DependencyCheck('mongo', CountingProbe(), ttl=0),
+            DependencyCheck('llama-prod', CountingProbe(error=ConnectionError("refused")), ttl=0),
+        ], timeout=1)
+        healthy, results = checks.report()
+        self.assertFalse(healthy)
+        self.assertEqual(results['llama-prod']['status'], FAILED)
+        self.assertEqual(results['llama-prod']['error'], "ConnectionError: refused")
+
+    def test_only_the_prod_endpoint_is_required_by_default(self):
+        for name in ('mongo', 'llama-dev', 't5', 'osm-tag-search', 'color-bundle-search'):
+            self.assertFalse(DependencyCheck(name, CountingProbe()).required)
+        self.assertTrue(DependencyCheck('llama-prod', CountingProbe()).required)
+
+    def test_optional_and_unconfigured_checks_do_not_fail(self):
+        checks = HealthChecks([
+            DependencyCheck('llama-dev', CountingProbe(error=ConnectionError("refused")), required=False),
+            DependencyCheck('t5', None),
+        ], timeout=1)
+        healthy, results = checks.report()
+        self.assertTrue(healthy)
+        self.assertEqual(results['llama-dev']['status'], FAILED)
+        self.assertEqual(results['t5']['status'], SKIPPED)
+
+    def test_hanging_probe_times_out_and_is_not_restarted(self):
+        release = threading.Event()
+        probe = CountingProbe()
+        hanging = DependencyCheck('mongo', lambda timeout: (probe(timeout), release.wait(5)), ttl=0, required=True)
+        checks = HealthChecks([hanging], timeout=0.05)
+
+        started = time.monotonic()
+        healthy, results = checks.report()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertFalse(healthy)
+        self.assertEqual(results['mongo']['error'], "timed out after 0.05s")
+        checks.report()
+        self.assertEqual(probe.calls, 1)
+
+        release.set()
+        checks.executor.shutdown(wait=True)
+        self.assertEqual(hanging.result()['status'], OK)
+
+
+class TestProbes(unittest.TestCase):
+    def test_http_probe_fails_on_server_errors_only(self):
+        session = mock.Mock()
+        probe = http_probe('http://search', session=session)
+        session.get.return_value = FakeResponse(405)
+        probe(1)
+        session.get.return_value = FakeResponse(503)
+        with self.assertRaises(requests.HTTPError):
+            probe(1)
+        self.assertIsNone(http_probe(None))
+
+    def test_mongo_probe_is_bounded_by_its_timeout(self):
+        client = pymongo.MongoClient('mongodb://127.0.0.1:1', serverSelectionTimeoutMS=30000, connect=False)
+        self.addCleanup(client.close)
+        probe = mongo_probe(lambda: client['spot']['requests'])
+        started = time.monotonic()
+        with self.assertRaises(pymongo.errors.PyMongoError):
+            probe(0.2)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_executor_stats(self):
+        executor = ThreadPoolExecutor(max_workers=2)
+        executor.submit(lambda: None).result()
+        self.assertEqual(executor_stats(executor), {'workers': 1, 'maxWorkers': 2, 'queued': 0})
+        executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
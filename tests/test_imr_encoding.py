@@ -0,0 +1,85 @@
+import copy
+import json
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from imr_encoding import FilterLeaf, compact_imr, make_leaf, to_builtin, to_leaves, with_fields
+from serialization import dumps, json_default
+
+"""
+Unit tests for the shared, slotted filter leaves in imr_encoding.py.
+
+To execute:
+    python -m unittest tests.test_imr_encoding
+"""
+
+SEARCH_RESULT = [{
+    'imr': [{'or': [
+        {'key': 'amenity', 'operator': '=', 'value': 'bar'},
+        {'key': 'amenity', 'operator': '=', 'value': 'pub', 'note': 'kept as dict'},
+    ]}],
+    'score': 0.9,
+}]
+
+
+class TestFilterLeaf(unittest.TestCase):
+    def test_equal_fields_share_one_leaf(self):
+        leaf = make_leaf('colour', '=', '#ff0000')
+        self.assertIs(leaf, make_leaf('colour', '=', '#ff0000'))
+        self.assertIs(make_leaf(''.join(['col', 'our']), '=', 'red').key, leaf.key)
+
+    def test_reads_like_a_dict(self):
+        leaf = make_leaf('amenity', '=', 'bar')
+        self.assertEqual(leaf['value'], 'bar')
+        self.assertEqual(leaf.get('missing', 'default'), 'default')
+        self.assertIn('key', leaf)
+        self.assertEqual(dict(leaf), {'key': 'amenity', 'operator': '=', 'value': 'bar'})
+        self.assertEqual(leaf, {'key': 'amenity', 'operator': '=', 'value': 'bar'})
+        self.assertEqual([{'key': 'amenity', 'operator': '=', 'value': 'bar'}], [leaf])
+        with self.assertRaises(KeyError):
+            leaf['name']
+
+    def test_has_no_instance_dict(self):
+        leaf = make_leaf('amenity', '=', 'bar')
+        self.assertFalse(hasattr(leaf, '__dict__'))
+        self.assertIs(copy.deepcopy(leaf), leaf)
+
+    def test_with_fields_does_not_modify_leaf(self):
+        leaf = make_leaf('colour', '=', '***example***')
+        changed = with_fields(leaf, operator='~', value='red')
+        self.assertEqual(changed, {'key': 'colour', 'operator': '~', 'value': 'red'})
+        self.assertEqual(leaf['value'], '***example***')
+        self.assertEqual(with_fields({'key': 'a', 'operator': '=', 'value': 1, 'note': 'x'}, value=2)['value'], 2)
+
+    def test_unhashable_values_are_not_shared(self):
+        leaf = make_leaf('name', '=', ['a', 'b'])
+        self.assertIsInstance(leaf, FilterLeaf)
+        self.assertIsNot(leaf, make_leaf('name', '=', ['a', 'b']))
+
+
+class TestConversion(unittest.TestCase):
+    def test_to_leaves_copies_containers(self):
+        converted = to_leaves(SEARCH_RESULT)
+        leaves = converted[0]['imr'][0]['or']
+        self.assertIsInstance(leaves[0], FilterLeaf)
+        self.assertIsInstance(leaves[1], dict)
+        self.assertEqual(converted, SEARCH_RESULT)
+        converted[0]['imr'][0]['or'].append('extra')
+        self.assertEqual(len(SEARCH_RESULT[0]['imr'][0]['or']), 2)
+
+    def test_serialized_as_dicts(self):
+        tree = to_leaves(SEARCH_RESULT)
+        self.assertEqual(to_builtin(tree), SEARCH_RESULT)
+        self.assertEqual(json.loads(dumps(tree)), SEARCH_RESULT)
+        self.assertEqual(json.loads(json.dumps(tree, default=json_default)), SEARCH_RESULT)
+
+    def test_compact_imr_handles_leaves(self):
+        imr = {'nodes': [{'id': 0, 'filters': [{'or': [make_leaf('amenity', '=', 'bar')]}]}]}
+        self.assertEqual(compact_imr(imr)['nodes'][0]['filters'], [{'or': [['amenity', '=', 'bar']]}])
+
+
+if __name__ == '__main__':
+    unittest.main()
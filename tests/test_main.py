@@ -0,0 +1,169 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+os.environ.setdefault('PROMPT_FILE', os.path.join(DATA_PATH, 'zero_shot_cot_prompt.txt'))
+os.environ.setdefault('PROMPT_FILE_DEV', os.path.join(DATA_PATH, 'zero_shot_llama_prompt_dev.txt'))
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import anyio
+from bson import ObjectId
+import anyio.to_thread
+from fastapi.testclient import TestClient
+
+import main
+from llama_inference import StreamError
+
+"""
+Endpoint tests for the API in main.py, with the model and the request log faked.
+
+To execute:
+    python -m unittest tests.test_main
+"""
+
+IMR = {'area': {'type': 'bbox', 'value': ''}, 'nodes': [{'id': 0, 'name': 'bar'}], 'edges': []}
+
+
+class FakeResponse:
+    status_code = 200
+
+
+class FakeInference:
+    def __init__(self):
+        self.generated = []
+
+    def cache_namespace(self, environment):
+        return f"fake:{environment}:v1"
+
+    def admission_pool(self, environment):
+        return 'llama-prod'
+
+    def generate(self, sentence, environment):
+        self.generated.append(sentence)
+        return FakeResponse()
+
+    def get_raw_output(self, response):
+        return "area:\n  type: bbox"
+
+    def adopt(self, raw_output):
+        return IMR
+
+
+class TestTransformEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+        self.inference = FakeInference()
+        main.IMR_CACHE.clear()
+        inferences = mock.patch.dict(main.MODEL_INFERENCES, {'llama': self.inference})
+        inferences.start()
+        self.addCleanup(inferences.stop)
+        log_request = mock.patch('main.log_request')
+        self.log_request = log_request.start()
+        self.addCleanup(log_request.stop)
+
+    def post(self, sentence='Find bars', **fields):
+        return self.client.post('/transform-sentence-to-imr', json={
+            'sentence': sentence, 'model': 'llama', 'username': 'kid-test', 'environment': 'production', **fields,
+        })
+
+    def test_result_is_logged_with_its_pipeline_version(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imr'], IMR)
+        self.assertEqual(response.json()['inputSentence'], 'find bars')
+
+        logged = self.log_request.call_args[0][0]
+        self.assertEqual(logged['pipelineVersion'], 'fake:production:v1')
+        self.assertEqual(logged['environment'], 'prod')
+        self.assertNotIn('pipelineVersion', response.json())
+
+    def test_repeated_sentences_are_served_from_the_cache(self):
+        self.post()
+        self.post(sentence='find BARS')
+        self.assertEqual(self.inference.generated, ['find bars'])
+        self.assertEqual(self.log_request.call_count, 2)
+
+    def test_rate_limit_key(self):
+        with mock.patch.object(main.ADMISSION, 'check_rate') as check_rate:
+            self.post()
+            check_rate.assert_called_with('kid-test', 'production')
+            with mock.patch('main.ADMISSION_RATE_KEY', 'address'):
+                self.post()
+            check_rate.assert_called_with('testclient', 'production')
+
+    def test_threadpool_holds_admission_queue(self):
+        async def startup():
+            await main.size_request_threadpool()
+            return anyio.to_thread.current_default_thread_limiter().total_tokens
+
+        self.assertEqual(anyio.run(startup), main.REQUEST_THREADS + main.ADMISSION.max_blocked)
+
+    def test_profile_header_is_ignored_while_profiling_is_disabled(self):
+        with mock.patch.object(main.PROFILER, 'token', None):
+            response = self.client.post('/transform-sentence-to-imr', headers={'X-Profile-Token': 'any'}, json={
+                'sentence': 'Find bars', 'model': 'llama', 'username': 'kid-test', 'environment': 'production',
+            })
+        self.assertEqual(response.status_code, 200)
+
+    def test_failed_stream_is_a_bad_gateway(self):
+        with mock.patch.object(self.inference, 'generate', side_effect=StreamError('prod', "overloaded")):
+            response = self.post()
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.log_request.assert_not_called()
+
+    def test_slimmed_response(self):
+        response = self.post(includeRawOutput=False)
+        self.assertIsNone(response.json().get('rawOutput'))
+
+
+class TestOperationalEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+
+    def test_liveness(self):
+        self.assertEqual(self.client.get('/healthz').json(), {'status': 'ok'})
+
+    def test_not_ready_until_warmed_up(self):
+        with mock.patch.object(main.HEALTH, 'report', return_value=(True, {})), \
+                mock.patch.object(main.WARMUP, '_finished') as finished:
+            finished.is_set.return_value = False
+            response = self.client.get('/readyz')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()['warmup']['status'], main.WARMUP.status)
+            finished.is_set.return_value = True
+            self.assertEqual(self.client.get('/readyz').status_code, 200)
+
+    def test_request_log_requires_token(self):
+        with mock.patch('request_log.REQUEST_LOG_TOKEN', None):
+            self.assertEqual(self.client.get('/requests').status_code, 404)
+        with mock.patch('request_log.REQUEST_LOG_TOKEN', 'secret'), mock.patch('main.get_collection'), \
+                mock.patch('main.find_requests', return_value={'items': [], 'nextCursor': None}) as find:
+            self.assertEqual(self.client.get('/requests', headers={'X-Request-Log-Token': 'wrong'}).status_code, 403)
+            response = self.client.get('/requests', headers={'X-Request-Log-Token': 'secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'items': [], 'nextCursor': None})
+            find.assert_called_once()
+
+    def test_next_cursor_works_unencoded_in_the_query_string(self):
+        documents = [{'_id': ObjectId(), 'timestamp': datetime(2024, 1, 1, 12, 30, 15, 250000, tzinfo=timezone.utc),
+                      'inputSentence': 'find bars', 'status': 'success'} for _ in range(2)]
+        collection = mock.Mock()
+        collection.find.return_value.sort.return_value.limit.return_value = documents
+        headers = {'X-Request-Log-Token': 'secret'}
+        with mock.patch('request_log.REQUEST_LOG_TOKEN', 'secret'), \
+                mock.patch('main.get_collection', return_value=collection):
+            cursor = self.client.get('/requests?limit=1', headers=headers).json()['nextCursor']
+            response = self.client.get(f'/requests?limit=1&cursor={cursor}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        query = collection.find.call_args[0][0]
+        self.assertEqual(query['$and'][1]['$or'][1],
+                         {'timestamp': documents[0]['timestamp'], '_id': {'$lt': documents[0]['_id']}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import requests
+import adopt_generation
+from prefetch import PREFETCH_BREAKER, TagPrefetcher, candidate_names
+
+"""
+Unit tests for speculative tag prefetch in prefetch.py and the shared
+in-flight lookups of `adopt_generation.search_osm_tag`.
+
+To execute:
+    python -m unittest tests.test_prefetch
+"""
+
+TAG_RESULT = [{'imr': [{'or': [{'key': 'amenity', 'operator': '=', 'value': 'bar'}]}]}]
+
+
+def fake_fetch(entity, timeout=None, breaker=None):
+    adopt_generation.TAG_CACHE.set('search', entity, TAG_RESULT)
+    return TAG_RESULT
+
+
+class TestCandidateNames(unittest.TestCase):
+    def test_ngrams_are_singularized(self):
+        self.assertEqual(candidate_names("find bus stops near a park in bonn"),
+                         ['bus stop', 'bus', 'stop', 'park', 'bonn'])
+
+    def test_stopwords_split_runs(self):
+        self.assertEqual(candidate_names('find all bars that are called "trink" that are close to a kiosk'),
+                         ['bar', 'trink', 'kiosk'])
+
+    def test_limit(self):
+        self.assertEqual(len(candidate_names("italian restaurants cafes bakeries churches parks", limit=4)), 4)
+
+
+class TestTagPrefetcher(unittest.TestCase):
+    def setUp(self):
+        adopt_generation.TAG_CACHE.clear()
+
+    def test_disabled_prefetcher_does_nothing(self):
+        prefetcher = TagPrefetcher(enabled=False)
+        with prefetcher.speculate("find bars") as speculation:
+            self.assertIsNone(speculation)
+        self.assertEqual(prefetcher.stats()['requests'], 0)
+
+    def test_hits_are_measured(self):
+        prefetcher = TagPrefetcher(enabled=True, workers=2)
+        with mock.patch.object(adopt_generation, '_fetch_osm_tag', side_effect=fake_fetch) as fetch:
+            with prefetcher.speculate("find bars near a kiosk") as speculation:
+                for future in speculation.futures.values():
+                    future.result(5)
+                adopt_generation.search_osm_tag('bar')
+                adopt_generation.search_osm_tag('pub')
+
+        self.assertEqual(sorted(call.args[0] for call in fetch.call_args_list), ['bar', 'kiosk', 'pub'])
+        stats = prefetcher.stats()
+        self.assertEqual(stats['candidates'], 2)
+        self.assertEqual(stats['lookups'], 2)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['warmHits'], 1)
+        self.assertEqual(stats['hitRate'], 0.5)
+        self.assertEqual(stats['precision'], 0.5)
+
+    def test_lookups_outside_speculation_are_not_recorded(self):
+        prefetcher = TagPrefetcher(enabled=True, workers=1)
+        with mock.patch.object(adopt_generation, '_fetch_osm_tag', side_effect=fake_fetch):
+            with prefetcher.speculate("find bars"):
+                pass
+            adopt_generation.search_osm_tag('bar')
+        self.assertEqual(prefetcher.stats()['lookups'], 0)
+
+    def test_speculative_failures_do_not_count_against_real_lookups(self):
+        prefetcher = TagPrefetcher(enabled=True, workers=2)
+        search_failures = adopt_generation.SEARCH_BREAKER.snapshot()['totalFailures']
+        prefetch_failures = PREFETCH_BREAKER.snapshot()['totalFailures']
+        with mock.patch.object(adopt_generation.requests, 'get', side_effect=requests.ConnectionError("down")):
+            with prefetcher.speculate("find bars near a kiosk") as speculation:
+                for future in speculation.futures.values():
+                    future.result(5)
+        self.assertEqual(adopt_generation.SEARCH_BREAKER.snapshot()['totalFailures'], search_failures)
+        self.assertEqual(PREFETCH_BREAKER.snapshot()['totalFailures'], prefetch_failures + 2)
+
+
+class TestSharedLookups(unittest.TestCase):
+    def setUp(self):
+        adopt_generation.TAG_CACHE.clear()
+
+    def test_concurrent_lookups_share_one_request(self):
+        def slow_fetch(entity, timeout=None, breaker=None):
+            time.sleep(0.05)
+            return fake_fetch(entity)
+
+        results = []
+        with mock.patch.object(adopt_generation, '_fetch_osm_tag', side_effect=slow_fetch) as fetch:
+            threads = [threading.Thread(target=lambda: results.append(adopt_generation.search_osm_tag('bar')))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(results, [TAG_RESULT] * 4)
+        self.assertIsNot(results[0], results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from profiling import ADOPT, DONE, YAML, ProfilingError, SamplingProfiler, _stages, stage
+
+"""
+Unit tests for the on-demand sampling profiler in profiling.py.
+
+To execute:
+    python -m unittest tests.test_profiling
+"""
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(100))
+
+
+def wait_for(predicate, timeout=5):
+    end = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < end:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestStage(unittest.TestCase):
+    def test_stages_nest_and_reset(self):
+        thread_id = threading.get_ident()
+        with stage(YAML):
+            with stage(ADOPT):
+                self.assertEqual(_stages[thread_id], ADOPT)
+            self.assertEqual(_stages[thread_id], YAML)
+        self.assertNotIn(thread_id, _stages)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profiler = SamplingProfiler(token='secret', interval=0.002, max_seconds=5,
+                                         directory=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_authorize(self):
+        with self.assertRaises(ProfilingError) as context:
+            SamplingProfiler(token=None).authorize('secret')
+        self.assertEqual(context.exception.status_code, 404)
+        with self.assertRaises(ProfilingError) as context:
+            self.profiler.authorize('wrong')
+        self.assertEqual(context.exception.status_code, 403)
+        self.profiler.authorize('secret')
+
+    def test_requested_request_is_profiled_by_stage(self):
+        with self.profiler.request(requested=True) as session:
+            with stage(YAML):
+                busy(0.05)
+            with stage(ADOPT):
+                busy(0.05)
+
+        self.assertTrue(wait_for(lambda: session.status == DONE))
+        summary = session.summary()
+        self.assertEqual(summary['completed'], 1)
+        self.assertGreater(summary['stages'][YAML], 0)
+        self.assertGreater(summary['stages'][ADOPT], 0)
+        self.assertEqual(set(summary['stages']), {YAML, ADOPT})
+
+        with open(session.path) as file:
+            lines = file.read().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn(stack.split(';')[0], (YAML, ADOPT))
+        self.assertIn('test_profiling.py:busy', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_requested_profile_keeps_its_request(self):
+        real_start = self.profiler.start
+        stolen = []
+
+        def start_then_race(*args, **kwargs):
+            session = real_start(*args, **kwargs)
+            with self.profiler.request() as other:
+                stolen.append(other)
+            return session
+
+        self.profiler.start = start_then_race
+        with self.profiler.request(requested=True) as session:
+            self.assertIsNotNone(session)
+        self.assertEqual(stolen, [None])
+        self.assertEqual(session.requests, 1)
+
+    def test_unprofiled_requests_are_not_sampled(self):
+        with self.profiler.request() as session:
+            self.assertIsNone(session)
+
+    def test_request_limit(self):
+        session = self.profiler.start(requests=2)
+        with self.assertRaises(ProfilingError) as context:
+            self.profiler.start(seconds=1)
+        self.assertEqual(context.exception.status_code, 409)
+
+        profiled = []
+        for _ in range(3):
+            with self.profiler.request() as current:
+                profiled.append(current)
+        self.assertEqual(profiled[:2], [session, session])
+        self.assertTrue(wait_for(lambda: session.status == DONE))
+        self.assertIsNone(profiled[2])
+        self.assertEqual(self.profiler.get(session.id), session)
+        self.assertTrue(os.path.exists(session.path))
+
+    def test_time_limit(self):
+        session = self.profiler.start(seconds=0.05)
+        self.assertTrue(wait_for(lambda: session.status == DONE))
+        self.assertIsNone(self.profiler.stats()['active'])
+        self.assertEqual(self.profiler.stats()['recent'][0]['id'], session.id)
+
+    def test_limit_required(self):
+        with self.assertRaises(ProfilingError) as context:
+            self.profiler.start()
+        self.assertEqual(context.exception.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+os.environ.setdefault('PROMPT_FILE', os.path.join(DATA_PATH, 'zero_shot_cot_prompt.txt'))
+os.environ.setdefault('PROMPT_FILE_DEV', os.path.join(DATA_PATH, 'zero_shot_llama_prompt_dev.txt'))
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from llama_inference import LlamaInference
+from prompts import (HF_MAX_NEW_TOKEN, HF_STOP_SEQUENCES, PromptTemplate, estimate_max_new_tokens,
+                     get_prompt_template, normalize_environment, trim_to_yaml_document)
+
+"""
+Unit tests for prompt templates and generation budgeting in prompts.py.
+
+To execute:
+    python -m unittest tests.test_prompts
+"""
+
+
+class FakeResponse:
+    status_code = 200
+
+
+class TestPrompts(unittest.TestCase):
+    """
+    Test suite for template rendering, token budgets and YAML trimming.
+    """
+
+    def test_environment_aliases(self):
+        self.assertEqual(normalize_environment('production'), 'prod')
+        self.assertEqual(normalize_environment('Development'), 'dev')
+        self.assertEqual(normalize_environment(None), 'prod')
+
+    def test_render_with_input_slot(self):
+        template = PromptTemplate('inline', 'Sentence:\n{input}\n\nYAML:\n{output}')
+        self.assertEqual(template.render('find bars'), 'Sentence:\nfind bars\n\nYAML:\n')
+
+    def test_render_without_input_slot(self):
+        template = PromptTemplate('inline', 'Extract entities.')
+        self.assertEqual(template.render('find bars'), 'Extract entities.')
+
+    def test_payload_carries_sentence_and_template(self):
+        text = 'Sentence:\n{input}\n\nYAML:\n{output}'
+        self.assertEqual(PromptTemplate('inline', text).fields('find bars'), {'inputs': 'find bars', 'prompt': text})
+        template = PromptTemplate('inline', 'Extract entities.')
+        self.assertEqual(template.fields('find bars'), {'inputs': 'find bars', 'prompt': 'Extract entities.'})
+
+    def test_generation_payload(self):
+        with mock.patch('llama_inference.query', return_value=FakeResponse()) as query:
+            LlamaInference().generate('Find Bars', 'dev')
+        payload = query.call_args[0][0]
+        self.assertEqual(payload['inputs'], 'find bars')
+        self.assertEqual(payload['prompt'], get_prompt_template('dev').text)
+        self.assertIn('{input}', payload['prompt'])
+
+    def test_reasoning_before_the_document_is_kept_out(self):
+        output = "Let's think step by step.\n---\n```yaml\narea:\n  type: bbox\n```\nSentence: find pubs"
+        self.assertEqual(trim_to_yaml_document(output).split('```yaml\n')[-1], 'area:\n  type: bbox')
+
+    def test_budget_grows_with_sentence_and_is_capped(self):
+        short = estimate_max_new_tokens('find all bars')
+        long = estimate_max_new_tokens('find a park next to a two lane road in berlin with benches')
+        self.assertLess(short, long)
+        self.assertEqual(short % 32, 0)
+        self.assertEqual(estimate_max_new_tokens('word ' * 500), HF_MAX_NEW_TOKEN)
+
+    def test_trim_repeated_document(self):
+        text = "area:\n  type: bbox\nentities:\n- name: bar\n  id: 0\narea:\n  type: bbox\n"
+        self.assertEqual(trim_to_yaml_document(text), "area:\n  type: bbox\nentities:\n- name: bar\n  id: 0")
+
+    def test_trim_trailing_prose_and_eos(self):
+        text = "area:\n  type: bbox\nentities:\n - name: bar\nNote: this is a guess</s>garbage"
+        self.assertEqual(trim_to_yaml_document(text), "area:\n  type: bbox\nentities:\n - name: bar")
+
+    def test_complete_document_is_unchanged(self):
+        text = "area:\n  type: area\n  value: bonn\nentities:\n - name: kiosk\n   id: 0\n   type: nwr\n"
+        self.assertEqual(trim_to_yaml_document(text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import replay as replay_module
+from imr_encoding import make_leaf
+from replay import CHANGED, ERROR, SAME, diff_imr, load_jsonl_requests, replay, replay_one, summarize
+
+"""
+Unit tests for the replay and IMR diff tool in replay.py.
+
+To execute:
+    python -m unittest tests.test_replay
+"""
+
+IMR = {
+    'area': {'type': 'area', 'value': 'bonn'},
+    'nodes': [{'id': 0, 'name': 'bar', 'filters': [{'or': [{'key': 'amenity', 'operator': '=', 'value': 'bar'}]}]}],
+    'edges': [],
+}
+
+
+def changed_imr(document):
+    imr = json.loads(json.dumps(document['imr']))
+    imr['nodes'][0]['filters'][0]['or'][0]['value'] = 'pub'
+    imr['edges'].append({'source': 0, 'target': 1})
+    del imr['area']
+    return imr
+
+
+class TestDiffImr(unittest.TestCase):
+    def test_equal_imrs(self):
+        self.assertEqual(diff_imr(IMR, json.loads(json.dumps(IMR))), [])
+
+    def test_leaves_equal_dicts(self):
+        replayed = {**IMR, 'nodes': [{**IMR['nodes'][0], 'filters': [{'or': [make_leaf('amenity', '=', 'bar')]}]}]}
+        self.assertEqual(diff_imr(IMR, replayed), [])
+
+    def test_differences_have_paths(self):
+        differences = diff_imr(IMR, changed_imr({'imr': IMR}))
+        self.assertEqual([(d['change'], d['path']) for d in differences], [
+            ('removed', 'area'),
+            ('changed', 'nodes[0].filters[0].or[0].value'),
+            ('added', 'edges[0]'),
+        ])
+        self.assertEqual(differences[1]['expected'], 'bar')
+        self.assertEqual(differences[1]['actual'], 'pub')
+
+    def test_numbers_and_types(self):
+        self.assertEqual(diff_imr({'value': 100}, {'value': 100.0}), [])
+        self.assertEqual(len(diff_imr({'value': '100'}, {'value': 100})), 1)
+        self.assertEqual(len(diff_imr({'value': True}, {'value': 1})), 1)
+
+
+class TestReplay(unittest.TestCase):
+    def test_replay_one_statuses(self):
+        document = {'_id': 'a', 'inputSentence': 'find bars in bonn', 'imr': IMR}
+        self.assertEqual(replay_one(document, lambda document: document['imr'])['status'], SAME)
+        self.assertEqual(replay_one(document, changed_imr)['status'], CHANGED)
+
+        def failing(document):
+            raise ValueError("bad yaml")
+
+        result = replay_one(document, failing)
+        self.assertEqual(result['status'], ERROR)
+        self.assertEqual(result['error'], "ValueError: bad yaml")
+
+    def test_results_keep_input_order(self):
+        def run(document):
+            time.sleep(0.01 * (5 - document['id']))
+            return document['imr']
+
+        documents = [{'id': index, 'imr': IMR} for index in range(6)]
+        results = list(replay(documents, run, workers=3))
+        self.assertEqual([result['id'] for result in results], [str(index) for index in range(6)])
+
+        summary = summarize(results, 0.5)
+        self.assertEqual(summary['requests'], 6)
+        self.assertEqual(summary[SAME], 6)
+        self.assertEqual(summary['throughput'], 12)
+
+    def test_usage_is_the_module_docstring(self):
+        self.assertIn('Usage:', replay_module.__doc__)
+
+    def test_load_jsonl_requests(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'requests.jsonl')
+            with open(path, 'w') as file:
+                file.write(json.dumps({'id': '1', 'imr': IMR}) + '\n\n' + json.dumps({'id': '2', 'imr': IMR}) + '\n')
+            self.assertEqual([document['id'] for document in load_jsonl_requests(path)], ['1', '2'])
+            self.assertEqual(len(list(load_jsonl_requests(path, limit=1))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
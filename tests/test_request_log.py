@@ -0,0 +1,171 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+from request_log import (DEFAULT_FIELDS, RequestLogAccessError, _KnownIds, _store_once, authorize_reader,
+                         build_projection, build_request_query, canonical_imr, compact_document, compress_text,
+                         content_id, decode_cursor, decompress_text, encode_cursor, ensure_content_indexes,
+                         expand_documents, log_request, serialize_request)
+
+"""
+Unit tests for request-log query building in request_log.py.
+
+To execute:
+    python -m unittest tests.test_request_log
+"""
+
+
+class TestRequestLogQueries(unittest.TestCase):
+    """
+    Test suite for filters, projections and pagination cursors.
+    """
+
+    def test_filters_and_time_range(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2024, 2, 1, tzinfo=timezone.utc)
+        query = build_request_query(username='kid-test', status='error', start=start, end=end)
+        self.assertEqual(query, {
+            'username': 'kid-test',
+            'status': 'error',
+            'timestamp': {'$gte': start, '$lt': end},
+        })
+
+    def test_cursor_round_trip(self):
+        document = {'_id': ObjectId(), 'timestamp': datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)}
+        cursor = encode_cursor(document)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+        timestamp, object_id = decode_cursor(cursor)
+        self.assertEqual(timestamp, document['timestamp'])
+        self.assertEqual(object_id, document['_id'])
+
+    def test_cursor_continues_after_last_document(self):
+        document = {'_id': ObjectId(), 'timestamp': datetime(2024, 1, 1, tzinfo=timezone.utc)}
+        query = build_request_query(model_version='llama', cursor=encode_cursor(document))
+        self.assertEqual(query['$and'][0], {'modelVersion': 'llama'})
+        self.assertEqual(query['$and'][1]['$or'][1], {'timestamp': document['timestamp'], '_id': {'$lt': document['_id']}})
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            build_request_query(cursor='not-a-cursor')
+
+    def test_projection_excludes_large_fields_by_default(self):
+        projection = build_projection()
+        self.assertEqual(set(projection), set(DEFAULT_FIELDS))
+        self.assertNotIn('rawOutput', projection)
+        self.assertEqual(set(build_projection(['imr'])), {'imr', 'imrId', 'timestamp'})
+        with self.assertRaises(ValueError):
+            build_projection(['password'])
+
+    def test_serialize_request(self):
+        object_id = ObjectId()
+        document = {'_id': object_id, 'timestamp': datetime(2024, 1, 1, tzinfo=timezone.utc), 'status': 'success'}
+        self.assertEqual(serialize_request(document), {
+            'id': str(object_id), 'timestamp': '2024-01-01T00:00:00+00:00', 'status': 'success'
+        })
+
+
+class TestCompactStorage(unittest.TestCase):
+    """
+    Test suite for prompt/IMR deduplication and raw-output compression.
+    """
+
+    def test_canonical_imr_ignores_key_order(self):
+        first = {'nodes': [{'key': 'amenity', 'operator': '=', 'value': 'bar'}], 'area': {'type': 'bbox'}}
+        second = {'area': {'type': 'bbox'}, 'nodes': [{'value': 'bar', 'operator': '=', 'key': 'amenity'}]}
+        self.assertEqual(content_id(canonical_imr(first)), content_id(canonical_imr(second)))
+
+    def test_compression_round_trip(self):
+        text = "area:\n  type: bbox\n" * 100
+        data, codec = compress_text(text)
+        self.assertLess(len(data), len(text))
+        self.assertEqual(decompress_text(data, codec), text)
+
+    def test_compact_and_expand(self):
+        prompts, imrs = mock.MagicMock(), mock.MagicMock()
+        imr = {'area': {'type': 'bbox'}, 'nodes': []}
+        raw_output = "entities:\n - name: bar\n" * 100
+        prompt = "You are a joint entity and relation extractor. " * 10
+        document = {'status': 'error', 'imr': imr, 'rawOutput': raw_output, 'prompt': prompt}
+
+        compact = compact_document(document, prompts, imrs)
+        self.assertNotIn('prompt', compact)
+        self.assertNotIn('imr', compact)
+        self.assertEqual(compact['promptId'], content_id(prompt))
+        self.assertIn(compact['rawOutputCodec'], ('zlib', 'zstd'))
+        self.assertIn('prompt', document)
+
+        compact_document(document, prompts, imrs)
+        self.assertEqual(prompts.update_one.call_count, 1)
+
+        prompts.find.return_value = [{'_id': compact['promptId'], 'prompt': prompt}]
+        imrs.find.return_value = [{'_id': compact['imrId'], 'imr': imr}]
+        expanded = expand_documents([compact], prompts, imrs)[0]
+        self.assertEqual(expanded['prompt'], prompt)
+        self.assertEqual(expanded['imr'], imr)
+        self.assertEqual(expanded['rawOutput'], raw_output)
+        self.assertNotIn('rawOutputCodec', expanded)
+
+    def test_short_raw_output_stays_inline(self):
+        compact = compact_document({'rawOutput': 'area:\n  type: bbox'}, mock.MagicMock(), mock.MagicMock())
+        self.assertEqual(compact, {'rawOutput': 'area:\n  type: bbox'})
+
+    def test_stored_content_refreshes_last_used(self):
+        collection = mock.MagicMock()
+        known = _KnownIds(10, refresh_after=60)
+        with mock.patch('request_log.time.monotonic', return_value=100.0):
+            _store_once(collection, known, 'prompt', 'p', 'p')
+            _store_once(collection, known, 'prompt', 'p', 'p')
+        self.assertEqual(collection.update_one.call_count, 1)
+        self.assertIn('lastUsed', collection.update_one.call_args[0][1]['$set'])
+        with mock.patch('request_log.time.monotonic', return_value=161.0):
+            _store_once(collection, known, 'prompt', 'p', 'p')
+        self.assertEqual(collection.update_one.call_count, 2)
+
+    def test_content_expires_after_referencing_requests(self):
+        prompts = mock.MagicMock()
+        with mock.patch('request_log.MONGO_REQUEST_TTL_DAYS', '1'), \
+                mock.patch('request_log.CONTENT_REFRESH_SECONDS', 3600):
+            ensure_content_indexes(prompts)
+        self.assertEqual(prompts.create_index.call_args[1]['expireAfterSeconds'], 86400 + 3600)
+        with mock.patch('request_log.MONGO_REQUEST_TTL_DAYS', None):
+            ensure_content_indexes(prompts)
+        self.assertEqual(prompts.create_index.call_count, 1)
+
+    def test_logging_errors_do_not_fail_requests(self):
+        collection = mock.MagicMock()
+        collection.insert_one.side_effect = ServerSelectionTimeoutError('no servers')
+        with mock.patch('request_log.get_collection', return_value=collection):
+            self.assertFalse(log_request({'inputSentence': 'find bars', 'status': 'success'}))
+            collection.insert_one.side_effect = None
+            self.assertTrue(log_request({'inputSentence': 'find bars', 'status': 'success'}))
+
+
+class TestRequestLogAccess(unittest.TestCase):
+    """
+    Test suite for the token protecting the `/requests` API.
+    """
+
+    def test_disabled_without_token(self):
+        with self.assertRaises(RequestLogAccessError) as context:
+            authorize_reader('secret', expected='')
+        self.assertEqual(context.exception.status_code, 404)
+
+    def test_token_must_match(self):
+        for token in (None, 'wrong'):
+            with self.assertRaises(RequestLogAccessError) as context:
+                authorize_reader(token, expected='secret')
+            self.assertEqual(context.exception.status_code, 403)
+        authorize_reader('secret', expected='secret')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from cache import LRUCache
+from warmup import (DONE, TIMED_OUT, CacheWarmup, frequent_entities, frequent_results, load_snapshot, save_snapshot,
+                    try_lock)
+
+"""
+Unit tests for the cache warm-up and snapshots in warmup.py.
+
+To execute:
+    python -m unittest tests.test_warmup
+"""
+
+RESULTS = [
+    {'inputSentence': 'find bars in bonn', 'modelVersion': 'llama', 'environment': 'prod', 'count': 5,
+     'pipelineVersion': 'llama:prod:v2', 'rawOutput': 'area: bonn', 'imr': {'nodes': [{'name': 'bar'}]}},
+    {'inputSentence': 'find bars near a kiosk', 'modelVersion': 'llama', 'environment': None, 'count': 2,
+     'pipelineVersion': 'llama:prod:v2', 'rawOutput': 'area: bbox',
+     'imr': {'nodes': [{'name': 'bar'}, {'name': 'kiosk'}]}},
+    {'inputSentence': 'find a church', 'modelVersion': 'gpt', 'environment': 'dev', 'count': 1,
+     'pipelineVersion': 'gpt:dev', 'rawOutput': 'area: bbox', 'imr': {'nodes': [{'name': 'church'}]}},
+    {'inputSentence': 'find a pub', 'modelVersion': 'llama', 'environment': 'prod', 'count': 1,
+     'pipelineVersion': 'llama:prod:v1', 'rawOutput': 'area: bbox', 'imr': {'nodes': [{'name': 'pub'}]}},
+]
+
+
+def namespace_for(model, environment):
+    if model != 'llama':
+        return None
+    return f"llama:{environment or 'prod'}:v2"
+
+
+class TestSnapshots(unittest.TestCase):
+    def test_round_trip(self):
+        source = LRUCache('imr', maxsize=8)
+        source.set('llama:prod', 'find bars', ['raw', {'nodes': []}])
+        target = LRUCache('imr', maxsize=8)
+        untouched = LRUCache('other', maxsize=8)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.json')
+            self.assertEqual(save_snapshot([source], path), 1)
+            self.assertEqual(load_snapshot([target, untouched], path), 1)
+
+        self.assertEqual(target.get('llama:prod', 'find bars'), ['raw', {'nodes': []}])
+        self.assertEqual(len(untouched), 0)
+
+    def test_downtime_counts_towards_ttl(self):
+        source = LRUCache('imr', maxsize=8, ttl=60)
+        source.set('llama:prod', 'find bars', 'value')
+        target = LRUCache('imr', maxsize=8, ttl=60)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.json')
+            with mock.patch('warmup.time.time', return_value=1000.0):
+                save_snapshot([source], path)
+            with mock.patch('warmup.time.time', return_value=1100.0):
+                self.assertEqual(load_snapshot([target], path), 0)
+
+    def test_missing_file_restores_nothing(self):
+        self.assertEqual(load_snapshot([LRUCache('imr')], '/nonexistent/snapshot.json'), 0)
+
+
+class TestCacheWarmup(unittest.TestCase):
+    def test_frequent_entities_are_weighted_by_count(self):
+        self.assertEqual(frequent_entities(RESULTS), ['bar', 'kiosk', 'church', 'pub'])
+        self.assertEqual(frequent_entities(RESULTS, limit=1), ['bar'])
+
+    def test_frequent_results_query(self):
+        collection = mock.MagicMock()
+        collection.aggregate.return_value = []
+        with mock.patch('warmup.expand_documents', side_effect=lambda documents: documents):
+            frequent_results(collection, max_time_ms=1500, pipeline_versions=['llama:prod:v2'])
+        pipeline = collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0]['$match']['pipelineVersion'], {'$in': ['llama:prod:v2']})
+        self.assertEqual(collection.aggregate.call_args[1]['maxTimeMS'], 1500)
+
+    def test_replay_fills_imr_cache_and_looks_up_entities(self):
+        imr_cache = LRUCache('imr', maxsize=8)
+        warmup = CacheWarmup(imr_cache, [imr_cache], namespace_for, snapshot_path=None)
+        with mock.patch('warmup.frequent_results', return_value=RESULTS), \
+                mock.patch('warmup.search_osm_tag') as search:
+            warmup.run(lambda: mock.MagicMock())
+
+        self.assertEqual(warmup.status, DONE)
+        self.assertTrue(warmup.ready)
+        self.assertEqual(imr_cache.get('llama:prod:v2', 'find bars in bonn'),
+                         ('area: bonn', {'nodes': [{'name': 'bar'}]}))
+        self.assertIsNotNone(imr_cache.get('llama:prod:v2', 'find bars near a kiosk'))
+        self.assertIsNone(imr_cache.get('llama:prod:v2', 'find a pub'))
+        self.assertEqual(warmup.sentences, 2)
+        self.assertEqual([call.args[0] for call in search.call_args_list], ['bar', 'kiosk', 'church', 'pub'])
+        self.assertTrue(all(0 < call.kwargs['timeout'] <= warmup.timeout for call in search.call_args_list))
+        self.assertEqual(warmup.entities, 4)
+
+    def test_replay_stops_at_deadline(self):
+        imr_cache = LRUCache('imr', maxsize=8)
+        warmup = CacheWarmup(imr_cache, [imr_cache], namespace_for, timeout=0, snapshot_path=None)
+        with mock.patch('warmup.frequent_results', return_value=RESULTS) as results, \
+                mock.patch('warmup.search_osm_tag') as search:
+            warmup.run(lambda: mock.MagicMock())
+
+        self.assertEqual(warmup.status, TIMED_OUT)
+        self.assertTrue(warmup.ready)
+        results.assert_not_called()
+        search.assert_not_called()
+
+
+class TestSnapshotSharing(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'snapshot.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def warmup(self, **kwargs):
+        imr_cache = LRUCache('imr', maxsize=8)
+        return CacheWarmup(imr_cache, [imr_cache], namespace_for, snapshot_path=self.path, **kwargs)
+
+    def test_one_worker_replays_and_the_others_restore(self):
+        first, second = self.warmup(), self.warmup()
+        with mock.patch('warmup.frequent_results', return_value=RESULTS) as results, \
+                mock.patch('warmup.search_osm_tag'):
+            first.run(lambda: mock.MagicMock())
+            second.run(lambda: mock.MagicMock())
+
+        self.assertEqual(results.call_count, 1)
+        self.assertTrue(first.replayed)
+        self.assertFalse(second.replayed)
+        self.assertEqual(second.status, DONE)
+        self.assertEqual(second.restored, 2)
+        self.assertIsNotNone(second.imr_cache.get('llama:prod:v2', 'find bars in bonn'))
+
+    def test_worker_waits_for_the_lock(self):
+        lock = try_lock(f"{self.path}.lock")
+        warmup = self.warmup(timeout=0.05)
+        with mock.patch('warmup.frequent_results', return_value=RESULTS) as results:
+            warmup.run(lambda: mock.MagicMock())
+        lock.close()
+
+        self.assertEqual(warmup.status, TIMED_OUT)
+        results.assert_not_called()
+
+    def test_shutdown_snapshot_is_written_once(self):
+        first, second = self.warmup(), self.warmup()
+        first.imr_cache.set('llama:prod:v2', 'find bars', 'value')
+        self.assertEqual(first.save(), 1)
+        self.assertEqual(second.save(), 0)
+        lock = try_lock(f"{self.path}.lock")
+        self.assertIsNotNone(lock)
+        lock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
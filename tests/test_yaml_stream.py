@@ -0,0 +1,175 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+os.environ.setdefault('PROMPT_FILE', os.path.join(DATA_PATH, 'zero_shot_cot_prompt.txt'))
+os.environ.setdefault('PROMPT_FILE_DEV', os.path.join(DATA_PATH, 'zero_shot_llama_prompt_dev.txt'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from yaml_parser import validate_and_fix_yaml
+import requests
+from llama_inference import LlamaEndpoint, LlamaInference, StreamError
+from yaml_stream import AREA, ENTITY, RELATION, IncrementalYamlParser, parse_block
+
+"""
+Unit tests for the incremental YAML parser in yaml_stream.py.
+
+To execute:
+    python -m unittest tests.test_yaml_stream
+"""
+
+OUTPUT = """area:
+   type: area
+   value: bonn
+
+entities:
+ - name: bar
+   id: 0
+   type: nwr
+   properties:
+    - name: name
+      operator: "="
+      value: trink
+ - name: kiosk
+   id: 1
+   type: nwr
+relations:
+ - source: 0
+   target: 1
+   type: dist
+   value: 100 m"""
+
+
+def feed_in_chunks(parser, text, size):
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return events + parser.close()
+
+
+class TestIncrementalYamlParser(unittest.TestCase):
+    def test_matches_full_parse_for_any_chunking(self):
+        expected = validate_and_fix_yaml(OUTPUT)
+        for size in (1, 3, 16, len(OUTPUT)):
+            parser = IncrementalYamlParser()
+            events = feed_in_chunks(parser, OUTPUT, size)
+            self.assertEqual([kind for kind, _ in events], [AREA, ENTITY, ENTITY, RELATION])
+            self.assertEqual(parser.area, expected['area'])
+            self.assertEqual(parser.entities, expected['entities'])
+            self.assertEqual(parser.relations, expected['relations'])
+            self.assertTrue(parser.finished)
+
+    def test_parts_are_emitted_when_closed(self):
+        parser = IncrementalYamlParser()
+        head, tail = OUTPUT.split(' - name: kiosk')
+        events = parser.feed(head)
+        self.assertEqual([kind for kind, _ in events], [AREA])
+        events = parser.feed(' - name: kiosk')
+        self.assertEqual(events, [(ENTITY, validate_and_fix_yaml(OUTPUT)['entities'][0])])
+
+    def test_stops_at_continuation(self):
+        parser = IncrementalYamlParser()
+        events = feed_in_chunks(parser, "Sure!\n" + OUTPUT + "\n</s>area:\n  type: bbox\n", 5)
+        self.assertEqual(len(events), 4)
+        self.assertEqual(parser.area['value'], 'bonn')
+
+    def test_next_example_ends_document(self):
+        parser = IncrementalYamlParser()
+        events = feed_in_chunks(parser, OUTPUT + "\nSentence:\nfind parks\n", 7)
+        self.assertTrue(parser.finished)
+        self.assertEqual(len(events), 4)
+
+    def test_repeated_section_ends_document(self):
+        parser = IncrementalYamlParser()
+        feed_in_chunks(parser, OUTPUT + "\nentities:\n - name: park\n", 8)
+        self.assertEqual([entity['name'] for entity in parser.entities], ['bar', 'kiosk'])
+
+    def test_items_at_column_zero(self):
+        parser = IncrementalYamlParser()
+        feed_in_chunks(parser, "area:\n  type: bbox\nentities:\n- name: park\n  id: 0\n- name: bench\n  id: 1\n", 4)
+        self.assertEqual([entity['name'] for entity in parser.entities], ['park', 'bench'])
+
+    def test_unparsable_part_is_skipped(self):
+        parser = IncrementalYamlParser()
+        feed_in_chunks(parser, "area:\n  type: bbox\nentities:\n - name: [park\n - name: bench\n", 6)
+        self.assertEqual(parser.entities, [{'name': 'bench'}])
+        self.assertEqual(parser.failed, 1)
+
+    def test_any_fix_error_skips_the_part(self):
+        with mock.patch('yaml_stream.validate_and_fix_yaml', side_effect=TypeError("unhashable")):
+            self.assertIsNone(parse_block("- name: bar"))
+
+
+class FakeEndpoint:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, payload, on_text):
+        for chunk in self.chunks:
+            if on_text(chunk):
+                break
+        return 'response'
+
+
+class TestStreamPrefetch(unittest.TestCase):
+    def stream(self, text):
+        endpoint = FakeEndpoint([text[start:start + 7] for start in range(0, len(text), 7)])
+        with mock.patch('llama_inference.get_endpoint', return_value=endpoint), \
+                mock.patch('llama_inference.prefetch_node_tags') as prefetch:
+            self.assertEqual(LlamaInference().stream({}, 'prod'), 'response')
+        return [call.args[0]['name'] for call in prefetch.call_args_list]
+
+    def test_last_entity_is_prefetched_when_the_stream_ends(self):
+        self.assertEqual(self.stream("area:\n  type: bbox\nentities:\n - name: bar\n - name: kiosk"),
+                         ['bar', 'kiosk'])
+
+    def test_entities_are_prefetched_once(self):
+        self.assertEqual(self.stream(OUTPUT), ['bar', 'kiosk'])
+
+
+class FakeStreamResponse:
+    status_code = 200
+
+    def __init__(self, lines, error=None):
+        self.lines = lines
+        self.error = error
+
+    def iter_lines(self, decode_unicode=False):
+        yield from self.lines
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class TestStreamFailures(unittest.TestCase):
+    TOKEN = 'data: {"token": {"text": "area:", "special": false}}'
+
+    def stream(self, response):
+        endpoint = LlamaEndpoint('dev', 'http://llama-dev', 1)
+        failures = endpoint.breaker.snapshot()['totalFailures']
+        with mock.patch.object(endpoint.session, 'post', return_value=response):
+            with self.assertRaises(StreamError) as context:
+                endpoint.stream({}, lambda text: False)
+        self.assertEqual(endpoint.breaker.snapshot()['totalFailures'], failures + 1)
+        self.assertEqual(endpoint.in_flight, 0)
+        return context.exception
+
+    def test_error_event_is_an_endpoint_failure(self):
+        error = self.stream(FakeStreamResponse([self.TOKEN, 'data: {"error": "CUDA out of memory"}']))
+        self.assertEqual(error.error, "CUDA out of memory")
+        self.assertEqual(error.environment, 'dev')
+
+    def test_read_failure_after_headers_is_an_endpoint_failure(self):
+        error = self.stream(FakeStreamResponse([self.TOKEN], error=requests.ConnectionError("Read timed out.")))
+        self.assertIn("Read timed out.", error.error)
+
+
+if __name__ == '__main__':
+    unittest.main()